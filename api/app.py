@@ -1,12 +1,23 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse, PlainTextResponse
-from gradescopeClient import GradescopeClient
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
+from gradescopeClient import AsyncGradescopeClient, GRADESCOPE_BASE_URL
+from gradescopeSessionPool import GradescopeSessionPool, get_current_client
 from utils import *
+from cache import TTLCache, ResponseCache, etag_matches
+from prairieLearnClient import PrairieLearnClient
+from raw_data_cache import RawDataCache
+from singleFlight import SingleFlight, AsyncSingleFlight
+from assignment_catalog import compile_rules
+from metrics import MetricsMiddleware, ServiceStatsCollector, metrics_registry, render_metrics, track_upstream
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry
 import gspread
 from google.oauth2.service_account import Credentials
 from backoff_utils import strategies
 from backoff_utils import backoff
 import requests
+import asyncio
+from functools import partial
+from itertools import islice
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
@@ -15,18 +26,105 @@ credentials_dict = json.loads(credentials_json)
 credentials = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
 client = gspread.authorize(credentials)
 app = FastAPI()
-GRADESCOPE_CLIENT = GradescopeClient()
+# Records the latency of every request and the number in flight, for /metrics.
+app.add_middleware(MetricsMiddleware)
 # Load JSON variables
 config_path = os.path.join(os.path.dirname(__file__), "config/cs10_fall_2024.json")
 with open(config_path, "r") as config_file:
     config = json.load(config_file)
 
+# A recent successful Gradescope response is trusted as proof of login for this many seconds,
+# so most requests skip the extra round-trip to verify the session.
+GRADESCOPE_VERIFY_INTERVAL_SECONDS = config.get("GRADESCOPE_VERIFY_INTERVAL_SECONDS", 300)
+# Logged-in Gradescope sessions for the synchronous endpoints, up to GRADESCOPE_SESSION_POOL_SIZE per course.
+# Set GRADESCOPE_COOKIE_STORE_PATH to share one login between all uvicorn worker processes on a machine.
+cookie_store_path = config.get("GRADESCOPE_COOKIE_STORE_PATH")
+GRADESCOPE_SESSION_POOL = GradescopeSessionPool(
+    GRADESCOPE_EMAIL,
+    GRADESCOPE_PASSWORD,
+    size=config.get("GRADESCOPE_SESSION_POOL_SIZE", 4),
+    verify_interval=GRADESCOPE_VERIFY_INTERVAL_SECONDS,
+    cookie_store_path=cookie_store_path and os.path.join(os.path.dirname(__file__), cookie_store_path)
+)
+# Used by the /async endpoints, so that one worker can serve many in-flight Gradescope requests.
+ASYNC_GRADESCOPE_CLIENT = AsyncGradescopeClient(verify_interval=GRADESCOPE_VERIFY_INTERVAL_SECONDS)
+
 # Hardcoded (for now) GradeScope CS10 Fall 2024 COURSE ID
 CS_10_GS_COURSE_ID = str(config.get("GRADESCOPE_COURSE_ID"))
 # Hardcoded (for now) PL CS10 Summer 2024 COURSE ID
 CS_10_PL_COURSE_ID = str(config.get("PL_COURSE_ID"))
 PL_API_TOKEN = os.getenv("PL_API_TOKEN")
-PL_SERVER = "https://us.prairielearn.com/pl/api/v1"
+# Set the PL_SERVER environment variable to send PrairieLearn requests to another server, such as a benchmark stand-in.
+PL_SERVER = os.getenv("PL_SERVER", "https://us.prairielearn.com/pl/api/v1")
+# Shared by every PrairieLearn request, so that connections to PrairieLearn are kept alive between requests.
+PL_CLIENT = PrairieLearnClient(PL_API_TOKEN, PL_SERVER, pool_size=config.get("PL_CONNECTION_POOL_SIZE", 10))
+
+# Upper bound on the number of assignments whose grades are fetched from Gradescope at once by /fetchAllGrades.
+MAX_CONCURRENT_GRADE_FETCHES = config.get("MAX_CONCURRENT_GRADE_FETCHES", 8)
+
+# Categorized assignment info for each class, so that ID lookups do not re-scrape the Gradescope assignments page.
+# Invalidate with the /invalidateAssignmentJSON endpoint after assignments are added or renamed on Gradescope.
+assignment_cache_path = config.get("ASSIGNMENT_CACHE_PATH")
+ASSIGNMENT_CACHE = TTLCache(
+    ttl=config.get("ASSIGNMENT_CACHE_TTL_SECONDS", 3600),
+    max_entries=config.get("ASSIGNMENT_CACHE_MAX_ENTRIES", 32),
+    persist_path=assignment_cache_path and os.path.join(os.path.dirname(__file__), assignment_cache_path)
+)
+# How assignment titles are sorted into categories (labs, discussions, ...). Set ASSIGNMENT_CATEGORY_RULES to a list of
+# rules to change it; see DEFAULT_CATEGORY_RULES in assignment_catalog.py for the format and the default rules.
+ASSIGNMENT_CATEGORY_RULES = compile_rules(config.get("ASSIGNMENT_CATEGORY_RULES"))
+
+# Local Parquet cache of raw grade data, shared with the sync scripts when it points at the same volume. See raw_data_cache.py.
+# Scores downloaded by /getGrades are stored in it, and scores cached less than RAW_DATA_MAX_AGE_SECONDS ago
+# are served from it without contacting Gradescope. Leave RAW_DATA_CACHE_PATH unset to disable the cache.
+raw_data_cache_path = config.get("RAW_DATA_CACHE_PATH")
+RAW_DATA_CACHE = raw_data_cache_path and RawDataCache(os.path.join(os.path.dirname(__file__), raw_data_cache_path))
+RAW_DATA_MAX_AGE_SECONDS = config.get("RAW_DATA_MAX_AGE_SECONDS", 0)
+
+# Concurrent requests for the same upstream resource (an assignment's scores, a class's assignments page, the
+# PrairieLearn gradebook) share one in-flight fetch and its result, so that a burst of identical requests
+# reaches Gradescope and PrairieLearn once. The synchronous and /async endpoints each coalesce their own requests.
+UPSTREAM_FETCHES = SingleFlight()
+ASYNC_UPSTREAM_FETCHES = AsyncSingleFlight()
+
+# Grades served by /getGrades, per (class_id, assignment_id, shape), so that dashboards polling an assignment do not
+# download and parse its scores every time. Grades are fresh for GRADES_CACHE_TTL_SECONDS, then served stale for up to
+# GRADES_CACHE_STALE_SECONDS more while they are downloaded again in the background. Failed downloads are not cached.
+GRADES_CACHE = ResponseCache(
+    ttl=config.get("GRADES_CACHE_TTL_SECONDS", 30),
+    stale_ttl=config.get("GRADES_CACHE_STALE_SECONDS", 300),
+    max_entries=config.get("GRADES_CACHE_MAX_ENTRIES", 256),
+    cacheable=lambda grades: isinstance(grades, list) or (isinstance(grades, dict) and "columns" in grades)
+)
+
+# Metrics reported by /metrics: request and upstream call latencies from metrics.py (merged across workers if
+# PROMETHEUS_MULTIPROC_DIR is set), and the cache, single-flight and login counters of the worker that answers.
+METRICS_REGISTRY = metrics_registry()
+SERVICE_STATS_REGISTRY = CollectorRegistry()
+SERVICE_STATS_REGISTRY.register(ServiceStatsCollector(
+    caches={"grades": GRADES_CACHE, "assignments": ASSIGNMENT_CACHE},
+    single_flights={"sync": UPSTREAM_FETCHES, "async": ASYNC_UPSTREAM_FETCHES},
+    gradescope_login_counts={"pool": lambda: GRADESCOPE_SESSION_POOL.login_count,
+                             "async": lambda: ASYNC_GRADESCOPE_CLIENT.login_count}
+))
+
+
+def read_cached_scores(class_id: str, assignment_id: str):
+    """
+    Returns the scores CSV of an assignment from `RAW_DATA_CACHE`, or None if it is disabled or has no recent enough copy.
+    """
+    if not RAW_DATA_CACHE or RAW_DATA_MAX_AGE_SECONDS <= 0:
+        return None
+    cached = RAW_DATA_CACHE.read_latest(class_id, "gradescope", assignment_id, max_age=RAW_DATA_MAX_AGE_SECONDS)
+    return cached and cached["payload"].decode("utf-8")
+
+
+def cache_scores(class_id: str, assignment_id: str, content: bytes):
+    """
+    Stores a scores CSV downloaded from Gradescope in `RAW_DATA_CACHE`, if it is enabled.
+    """
+    if RAW_DATA_CACHE:
+        RAW_DATA_CACHE.write(class_id, "gradescope", assignment_id, content, "text/csv")
 
 
 @app.get("/")
@@ -41,17 +139,25 @@ def read_item(item_id: int, q: str = None):
 
 @app.get("/getGrades")
 @handle_errors
-@gradescope_session(GRADESCOPE_CLIENT)
-def fetchGrades(class_id: str, assignment_id: str, file_type: str = "json"):
+def fetchGrades(class_id: str, assignment_id: str, file_type: str = "json", shape: str = "records",
+                if_none_match: str = Header(None)):
     """
-    Fetches student grades from Gradescope as JSON. 
+    Fetches student grades from Gradescope as JSON, serialized with orjson.
+    Grades are served from `GRADES_CACHE` while it has them, and recent enough scores in `RAW_DATA_CACHE`
+    are served without contacting Gradescope.
+
+    Every successful response has an `ETag` header. A request whose `If-None-Match` header matches the ETag
+    of the cached grades gets an empty 304 Not Modified response, without any Gradescope traffic.
 
     Parameters:
         class_id (str): The ID of the class/course. If not provided, a default ID (CS_10_COURSE_ID) is used.
         assignment_id (str): The ID of the assignment for which grades are to be fetched.
         file_type (str): JSON or CSV format. The default type is JSON.
+        shape (str): One of `GRADES_SHAPES` (see `convert_scores_csv`). The default, `records`, is a list of
+            dictionaries of strings. `typed` has floats for scores and null for blanks, and `columns` returns
+            `{"columns": [...], "rows": [[...], ...]}` with typed values, without repeating the column names per student.
     Returns:
-        dict or list: A list of dictionaries containing student grades if the request is successful.
+        dict or list: The student grades in the requested shape if the request is successful.
                       If an error occurs, a dictionary with an error message is returned.
     Raises:
         HTTPException: If there is an issue with the request to Gradescope (e.g., network issues).
@@ -59,14 +165,86 @@ def fetchGrades(class_id: str, assignment_id: str, file_type: str = "json"):
     """
     # supported filetypes
     assert file_type in ["csv", "json"], "File type must be either CSV or JSON."
+    if shape not in GRADES_SHAPES:
+        raise ValueError(f"shape must be one of {GRADES_SHAPES}")
     # If the class_id is not passed in, use the default (CS10) class id
     class_id = class_id or CS_10_GS_COURSE_ID
+    entry = GRADES_CACHE.get((class_id, assignment_id, shape), partial(load_grades, class_id, assignment_id, shape))
+    if entry.etag is None:
+        return entry.value
+    if etag_matches(if_none_match, entry.etag):
+        GRADES_CACHE.record_not_modified()
+        return Response(status_code=304, headers={"ETag": entry.etag})
+    # Clients may keep the grades, but must revalidate them with If-None-Match before using them.
+    return ORJSONResponse(entry.value, headers={"ETag": entry.etag, "Cache-Control": "no-cache"})
+
+
+@app.get("/gradesCacheStats")
+@handle_errors
+def grades_cache_stats():
+    """
+    Reports the number of entries in `GRADES_CACHE` and its hit, stale hit, miss, refresh and 304 counts,
+    counted since the worker started.
+
+    Returns:
+    - JSON: The cache's counters.
+    """
+    return GRADES_CACHE.stats()
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Reports the service's metrics in the Prometheus text format, for Prometheus to scrape.
+
+    Returns:
+    - Text: Request latency histograms by route, requests in flight, upstream call latencies by status,
+      endpoint errors, cache hit ratios, coalesced upstream fetches and Gradescope logins.
+    """
+    return Response(render_metrics(METRICS_REGISTRY, SERVICE_STATS_REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/upstreamFetchStats")
+@handle_errors
+def upstream_fetch_stats():
+    """
+    Reports how many upstream fetches were made and how many requests shared another request's in-flight fetch
+    instead, for the synchronous and /async endpoints, counted since the worker started.
+
+    Returns:
+    - JSON: The counters of `UPSTREAM_FETCHES` and `ASYNC_UPSTREAM_FETCHES`.
+    """
+    return {"sync": UPSTREAM_FETCHES.stats(), "async": ASYNC_UPSTREAM_FETCHES.stats()}
+
+
+def load_grades(class_id: str, assignment_id: str, shape: str = "records"):
+    """
+    Loads the grades of an assignment from `RAW_DATA_CACHE` if it has recent enough scores, or else from Gradescope,
+    and converts them to `shape`. Concurrent downloads of the same assignment share one request to Gradescope.
+    """
+    csv_content = read_cached_scores(class_id, assignment_id)
+    if csv_content is None:
+        csv_content = UPSTREAM_FETCHES.do(("gradescope_scores", class_id, assignment_id), download_scores, class_id, assignment_id)
+        if not isinstance(csv_content, str):
+            # An error response.
+            return csv_content
+    return convert_scores_csv(csv_content, shape)
+
+
+@pooled_gradescope_session(GRADESCOPE_SESSION_POOL)
+def download_scores(class_id: str, assignment_id: str):
+    """
+    Downloads the scores CSV of an assignment from Gradescope with a pooled session, stores it in `RAW_DATA_CACHE`
+    and returns it, or returns an error response.
+    """
     filetype = "csv" # json is not supported
-    GRADESCOPE_CLIENT.last_res = result = GRADESCOPE_CLIENT.session.get(f"https://www.gradescope.com/courses/{class_id}/assignments/{assignment_id}/scores.{filetype}")
+    gradescope_client = get_current_client()
+    with track_upstream("gradescope", "scores") as call:
+        gradescope_client.last_res = result = gradescope_client.session.get(f"{GRADESCOPE_BASE_URL}/courses/{class_id}/assignments/{assignment_id}/scores.{filetype}")
+        call.status = result.status_code
     if result.ok:
-        csv_content = result.content.decode("utf-8")
-        json_content = csv_to_json(csv_content)
-        return json_content
+        cache_scores(class_id, assignment_id, result.content)
+        return result.content.decode("utf-8")
     else:
         return JSONResponse(
             content={"message": f"Failed to fetch grades. "},
@@ -76,13 +254,13 @@ def fetchGrades(class_id: str, assignment_id: str, file_type: str = "json"):
 
 @app.get("/getAssignmentJSON")
 @handle_errors
-@gradescope_session(GRADESCOPE_CLIENT)
 def get_assignment_info(class_id: str = None):
     """
     Fetches and returns assignment information in a JSON format for a specified class from Gradescope.
 
     This endpoint retrieves all assignments for the given `class_id` from Gradescope, using the 
-    Gradescope client session.
+    Gradescope client session. Results are cached per class in `ASSIGNMENT_CACHE`, so repeated
+    lookups do not re-scrape Gradescope until the cache entry expires or is invalidated.
 
     Parameters:
     - class_id (str, optional): The ID of the class for which assignments are being retrieved. 
@@ -120,12 +298,32 @@ def get_assignment_info(class_id: str = None):
         with open(local_json_path, "r") as f:
             assignments = json.load(f)
         return assignments
-    if not GRADESCOPE_CLIENT.logged_in:
+    cached_assignments = ASSIGNMENT_CACHE.get(class_id)
+    if cached_assignments is not None:
+        return cached_assignments
+    return UPSTREAM_FETCHES.do(("gradescope_assignments", class_id), scrape_assignment_info, class_id)
+
+
+@pooled_gradescope_session(GRADESCOPE_SESSION_POOL)
+def scrape_assignment_info(class_id: str):
+    """
+    Scrapes the Gradescope assignments page for `class_id`, categorizes the assignments and caches the result.
+
+    Parameters:
+    - class_id (str): The ID of the class for which assignments are being retrieved.
+
+    Returns:
+    - JSON in the format documented in `get_assignment_info`, or a JSONResponse describing the error.
+    """
+    gradescope_client = get_current_client()
+    if not gradescope_client.logged_in:
         return JSONResponse(
             content={"error": "Unauthorized access", "message": "User is not logged into Gradescope"},
             status_code=401
         )
-    GRADESCOPE_CLIENT.last_res = res = GRADESCOPE_CLIENT.session.get(f"https://www.gradescope.com/courses/{class_id}/assignments")
+    with track_upstream("gradescope", "assignments") as call:
+        gradescope_client.last_res = res = gradescope_client.session.get(f"{GRADESCOPE_BASE_URL}/courses/{class_id}/assignments")
+        call.status = res.status_code
     if not res:
         return JSONResponse(
         content={"error": "Connection Error", "message": "Failed to connect to Gradescope"},
@@ -138,10 +336,28 @@ def get_assignment_info(class_id: str = None):
     )
     # We return the JSON without JSONResponse so we can reuse this in other APIs easily.
     # We let FastAPI reformat this for us.
-    json_format_content = convert_course_info_to_json(str(res.content).replace("\\", "").replace("\\u0026", "&"))
+    json_format_content = convert_course_info_to_json(res.content, ASSIGNMENT_CATEGORY_RULES)
+    ASSIGNMENT_CACHE.set(class_id, json_format_content)
     return json_format_content
 
 
+@app.post("/invalidateAssignmentJSON")
+@handle_errors
+def invalidate_assignment_info(class_id: str = None):
+    """
+    Removes cached assignment information, so that the next lookup re-scrapes Gradescope.
+
+    Parameters:
+    - class_id (str, optional): The ID of the class whose cached assignments are removed.
+      Defaults to `None`, which removes the cached assignments of every class.
+
+    Returns:
+    - JSON: The number of cache entries removed.
+    """
+    removed = ASSIGNMENT_CACHE.invalidate(class_id)
+    return {"message": f"Invalidated {removed} cached assignment catalog(s)."}
+
+
 @app.get("/getGradeScopeAssignmentID/{category_type}/{assignment_number}")
 @handle_errors
 def get_assignment_id(category_type: str, assignment_number: int, lab_type: int = None, class_id: str = CS_10_GS_COURSE_ID):
@@ -212,16 +428,19 @@ def get_assignment_id(category_type: str, assignment_number: int, lab_type: int
 
 @app.get("/fetchAllGrades")
 @handle_errors
-def fetchAllGrades(class_id: str = None):
+def fetchAllGrades(class_id: str = None, stream: bool = False):
     """
     Fetch Grades for all assignments for all students
 
     Parameters:
     - class_id (str, optional): The ID of the class for which assignments are being retrieved. 
       Defaults to `None`.
+    - stream (bool, optional): If true, assignments are fetched concurrently and each assignment's grades
+      are streamed back as one line of NDJSON as soon as they arrive (see `stream_grades_as_ndjson`).
+      Defaults to `False`.
 
     Returns:
-    - JSON
+    - JSON, or NDJSON if `stream` is true
     
     # TODO: In the database design, consider if the assignmentID should be the primary key.
     # TODO: In this function, consider if we need both the assignmentID and title in this JSON
@@ -254,13 +473,241 @@ def fetchAllGrades(class_id: str = None):
     class_id = class_id or CS_10_GS_COURSE_ID
     assignment_info = get_assignment_info(class_id)
     all_ids = get_ids_for_all_assignments(assignment_info)
+    if stream:
+        return StreamingResponse(stream_grades_as_ndjson(class_id, all_ids), media_type="application/x-ndjson")
 
     all_grades = {}
     for title, one_id in all_ids:
-        all_grades[title] = fetchGrades(class_id, one_id)
+        all_grades[title] = GRADES_CACHE.get((class_id, one_id, "records"), partial(load_grades, class_id, one_id)).value
     return all_grades
 
 
+@app.get("/sessionPoolHealth")
+@handle_errors
+def session_pool_health():
+    """
+    Verifies the idle Gradescope sessions in the pool, drops the ones that are no longer logged in,
+    and reports the state of the pool.
+
+    Returns:
+    - JSON: The health check result and the number of clients, idle clients and logins per course.
+    """
+    health = GRADESCOPE_SESSION_POOL.health_check()
+    return {**health, **GRADESCOPE_SESSION_POOL.stats()}
+
+
+@app.on_event("shutdown")
+async def close_async_gradescope_client():
+    await ASYNC_GRADESCOPE_CLIENT.aclose()
+    PL_CLIENT.close()
+
+
+@app.get("/async/getGrades")
+@handle_errors
+async def fetchGradesAsync(class_id: str, assignment_id: str, file_type: str = "json", shape: str = "records"):
+    """
+    Asynchronous version of `/getGrades`. Fetches student grades from Gradescope as JSON
+    without blocking the worker while waiting on Gradescope. It shares `RAW_DATA_CACHE` with `/getGrades`.
+
+    Parameters:
+        class_id (str): The ID of the class/course. If not provided, a default ID (CS_10_COURSE_ID) is used.
+        assignment_id (str): The ID of the assignment for which grades are to be fetched.
+        file_type (str): JSON or CSV format. The default type is JSON.
+        shape (str): One of `GRADES_SHAPES`, as for `/getGrades`. The default type is `records`.
+    Returns:
+        dict or list: The student grades in the requested shape if the request is successful.
+                      If an error occurs, a dictionary with an error message is returned.
+    """
+    # supported filetypes
+    assert file_type in ["csv", "json"], "File type must be either CSV or JSON."
+    if shape not in GRADES_SHAPES:
+        raise ValueError(f"shape must be one of {GRADES_SHAPES}")
+    # If the class_id is not passed in, use the default (CS10) class id
+    class_id = class_id or CS_10_GS_COURSE_ID
+    grades = await load_grades_async(class_id, assignment_id, shape)
+    if isinstance(grades, JSONResponse):
+        return grades
+    return ORJSONResponse(grades)
+
+
+async def load_grades_async(class_id: str, assignment_id: str, shape: str = "records"):
+    """
+    Asynchronous version of `load_grades`.
+    """
+    csv_content = await asyncio.to_thread(read_cached_scores, class_id, assignment_id)
+    if csv_content is None:
+        csv_content = await ASYNC_UPSTREAM_FETCHES.do(("gradescope_scores", class_id, assignment_id), download_scores_async, class_id, assignment_id)
+        if not isinstance(csv_content, str):
+            # An error response.
+            return csv_content
+    return convert_scores_csv(csv_content, shape)
+
+
+@gradescope_session(ASYNC_GRADESCOPE_CLIENT)
+async def download_scores_async(class_id: str, assignment_id: str):
+    """
+    Asynchronous version of `download_scores`.
+    """
+    filetype = "csv" # json is not supported
+    with track_upstream("gradescope", "scores") as call:
+        result = await ASYNC_GRADESCOPE_CLIENT.get(f"/courses/{class_id}/assignments/{assignment_id}/scores.{filetype}")
+        call.status = result.status_code
+    if result.is_success:
+        await asyncio.to_thread(cache_scores, class_id, assignment_id, result.content)
+        return result.content.decode("utf-8")
+    else:
+        return JSONResponse(
+            content={"message": f"Failed to fetch grades. "},
+            status_code=int(result.status_code)
+        )
+
+
+@app.get("/async/getAssignmentJSON")
+@handle_errors
+async def get_assignment_info_async(class_id: str = None):
+    """
+    Asynchronous version of `/getAssignmentJSON`. Fetches and returns assignment information in a JSON format
+    for a specified class from Gradescope. It shares `ASSIGNMENT_CACHE` with `/getAssignmentJSON`.
+
+    Parameters:
+    - class_id (str, optional): The ID of the class for which assignments are being retrieved. 
+      Defaults to `None`.
+
+    Returns:
+    - JSON in the format documented in `get_assignment_info`.
+    """
+    class_id = class_id or CS_10_GS_COURSE_ID
+    cached_assignments = ASSIGNMENT_CACHE.get(class_id)
+    if cached_assignments is not None:
+        return cached_assignments
+    return await ASYNC_UPSTREAM_FETCHES.do(("gradescope_assignments", class_id), scrape_assignment_info_async, class_id)
+
+
+@gradescope_session(ASYNC_GRADESCOPE_CLIENT)
+async def scrape_assignment_info_async(class_id: str):
+    """
+    Asynchronous version of `scrape_assignment_info`. Scrapes the Gradescope assignments page for `class_id`,
+    categorizes the assignments and caches the result.
+    """
+    if not ASYNC_GRADESCOPE_CLIENT.logged_in:
+        return JSONResponse(
+            content={"error": "Unauthorized access", "message": "User is not logged into Gradescope"},
+            status_code=401
+        )
+    with track_upstream("gradescope", "assignments") as call:
+        res = await ASYNC_GRADESCOPE_CLIENT.get(f"/courses/{class_id}/assignments")
+        call.status = res.status_code
+    if not res.is_success:
+        return JSONResponse(
+        content={"error": "Gradescope Error", "message": f"Gradescope returned a {res.status_code} status code"},
+        status_code=res.status_code
+    )
+    json_format_content = convert_course_info_to_json(res.content, ASSIGNMENT_CATEGORY_RULES)
+    ASSIGNMENT_CACHE.set(class_id, json_format_content)
+    return json_format_content
+
+
+@app.get("/async/fetchAllGrades")
+@handle_errors
+async def fetchAllGradesAsync(class_id: str = None, stream: bool = False):
+    """
+    Asynchronous version of `/fetchAllGrades`. Fetch Grades for all assignments for all students,
+    fetching at most `MAX_CONCURRENT_GRADE_FETCHES` assignments at once.
+
+    Parameters:
+    - class_id (str, optional): The ID of the class for which assignments are being retrieved. 
+      Defaults to `None`.
+    - stream (bool, optional): If true, each assignment's grades are streamed back as one line of NDJSON
+      as soon as they arrive (see `stream_grades_as_ndjson`). Defaults to `False`.
+
+    Returns:
+    - JSON in the format documented in `fetchAllGrades`, or NDJSON if `stream` is true.
+    """
+    class_id = class_id or CS_10_GS_COURSE_ID
+    assignment_info = await get_assignment_info_async(class_id)
+    all_ids = get_ids_for_all_assignments(assignment_info)
+    if stream:
+        return StreamingResponse(stream_grades_as_ndjson(class_id, all_ids), media_type="application/x-ndjson")
+
+    grades_by_assignment_id = {}
+    async for _, one_id, grades in fetch_grades_concurrently(class_id, all_ids):
+        grades_by_assignment_id[one_id] = grades
+    # Keep the catalog order, regardless of the order in which the fetches finished.
+    all_grades = {}
+    for title, one_id in all_ids:
+        all_grades[title] = grades_by_assignment_id[one_id]
+    return all_grades
+
+
+async def fetch_grades_concurrently(class_id: str, all_ids: list):
+    """
+    Fetches the grades of many assignments, with at most `MAX_CONCURRENT_GRADE_FETCHES` fetches in flight.
+
+    A new fetch is only started once a finished one has been yielded, so at most `MAX_CONCURRENT_GRADE_FETCHES`
+    assignments' grades are held at a time, and a client that reads slowly slows the fetches down.
+
+    Parameters:
+    - class_id (str): The ID of the class the assignments belong to.
+    - all_ids (list): A list of assignment titles and ids, as returned by `get_ids_for_all_assignments`.
+
+    Yields:
+    - tuple: (title, assignment_id, grades) for each assignment, in the order the fetches finish.
+    """
+    async def fetch_one(title, assignment_id):
+        try:
+            return title, assignment_id, await load_grades_async(class_id, assignment_id)
+        except Exception as e:
+            # One failed assignment must not end the stream for the others.
+            return title, assignment_id, {"message": "Unknown error: " + str(e)}
+
+    remaining_ids = iter(all_ids)
+    pending = {asyncio.create_task(fetch_one(title, one_id))
+               for title, one_id in islice(remaining_ids, MAX_CONCURRENT_GRADE_FETCHES)}
+    try:
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            while finished:
+                # Drop the finished task before yielding, so that its grades can be freed once they are sent.
+                result = finished.pop().result()
+                yield result
+                del result
+                for title, one_id in islice(remaining_ids, 1):
+                    pending.add(asyncio.create_task(fetch_one(title, one_id)))
+    finally:
+        # Stop outstanding fetches if the client disconnects part way through a stream.
+        for task in pending:
+            task.cancel()
+
+
+def grades_error_line(title: str, assignment_id: str, grades):
+    """
+    Returns the NDJSON line of an assignment whose grades could not be loaded, or None if `grades` holds grades.
+    Failures come back as an error response from Gradescope, or as a {"message": ...} dict from the session decorators.
+    """
+    if isinstance(grades, JSONResponse):
+        return {"title": title, "assignment_id": assignment_id, "error": "Failed to fetch grades.", "status_code": grades.status_code}
+    if isinstance(grades, dict) and "message" in grades:
+        return {"title": title, "assignment_id": assignment_id, "error": grades["message"], "status_code": 500}
+    return None
+
+
+async def stream_grades_as_ndjson(class_id: str, all_ids: list):
+    """
+    Yields one line of NDJSON per assignment, as soon as that assignment's grades arrive, so that
+    time-to-first-byte and memory use do not grow with the number of assignments.
+
+    Every line has "title" and "assignment_id", and either "grades" (the assignment's grades) or, if they could
+    not be loaded, "error" (a message) and "status_code". A line never has both "grades" and "error".
+
+    Example Output:
+    {"title": "Lab 2: Basics (Code)", "assignment_id": "5211617", "grades": [{"Name": "test2", ...}, ...]}
+    {"title": "Lecture Quiz 1: Intro", "assignment_id": "5211613", "error": "Failed to fetch grades.", "status_code": 404}
+    """
+    async for title, one_id, grades in fetch_grades_concurrently(class_id, all_ids):
+        line = grades_error_line(title, one_id, grades) or {"title": title, "assignment_id": one_id, "grades": grades}
+        yield json.dumps(line) + "\n"
+
+
 @handle_errors
 @app.post("/testWriteToSheet")
 async def write_to_sheet(request: WriteRequest):
@@ -270,8 +717,10 @@ async def write_to_sheet(request: WriteRequest):
     # NOTE: Remove this test function in a future version once more Sheets API endpoints are written.
     """
     try:
-        sheet = client.open_by_key(request.spreadsheet_id).worksheet(request.sheet_name)
-        sheet.update_acell(request.cell, request.value)
+        with track_upstream("sheets", "update_cell") as call:
+            sheet = client.open_by_key(request.spreadsheet_id).worksheet(request.sheet_name)
+            sheet.update_acell(request.cell, request.value)
+            call.status = 200
         return JSONResponse(content={"message": f"Successfully wrote '{request.value}' to {request.cell}"}, status_code=200)
     except Exception as e:
         return JSONResponse(
@@ -296,8 +745,16 @@ def retrieve_gradebook():
     Raises:
         Exception: Catches any unexpected errors and includes a descriptive message.
     """
-    headers = {'Private-Token': PL_API_TOKEN}
-    url = PL_SERVER + f"/course_instances/{CS_10_PL_COURSE_ID}/gradebook"
-    r = backoff(requests.get, args = [url], kwargs = {'headers': headers}, max_tries = 3,  max_delay = 30, strategy = strategies.Exponential)
+    return UPSTREAM_FETCHES.do(("pl_gradebook", CS_10_PL_COURSE_ID), download_pl_gradebook, CS_10_PL_COURSE_ID)
+
+
+def download_pl_gradebook(course_instance_id: str):
+    """
+    Downloads the gradebook of a PrairieLearn course instance.
+    """
+    endpoint = f"/course_instances/{course_instance_id}/gradebook"
+    with track_upstream("prairielearn", "gradebook") as call:
+        r = backoff(PL_CLIENT.get, args = [endpoint], max_tries = 3,  max_delay = 30, strategy = strategies.Exponential)
+        call.status = r.status_code
     data = r.json()
     return data
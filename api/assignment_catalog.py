@@ -0,0 +1,218 @@
+# Parses the assignments page of a Gradescope course into a catalog of assignments, with their categories.
+# This file is shared by the API and the Gradescope sync script. Each is deployed from its own folder,
+# so an identical copy lives in each of them; keep the copies in sync.
+
+import json
+import re
+
+# The page embeds each assignment as {"id":123,"title":"..."}, possibly inside a JavaScript string, in which case the
+# quotes are escaped (\") and the title's own escapes are escaped once more. One compiled pattern finds both forms in a
+# single pass over the page; the number of backslashes before "id" tells how many times the title is escaped.
+# The title is matched greedily, a run of plain characters at a time, and stops at the first "}", so the pattern never
+# scans past the end of an assignment.
+ASSIGNMENT_PATTERN = re.compile(r'\{(\\*)"id\\*":(\d+),\\*"title\\*":\\*"((?:[^"\\}]+|\\.)*)\\*"\}')
+NUMBER_PATTERN = re.compile(r"\d+")
+
+# The categories of the catalog, in the order of DEFAULT_CATEGORY_RULES. Assignments that match no rule are "other".
+# Each rule has:
+# - "category": The category of the assignments whose title matches "pattern".
+# - "pattern": A regular expression searched for in the title. Rules are tried in order, and the first match wins.
+# - "key": How assignments are numbered within the category: "number" uses the first number in the title (titles
+#   without one get no number, and are left out of to_json), and "sequence" numbers them 1, 2, ... in page order.
+# - "parts" (optional): Maps a part name to a pattern, for categories such as labs whose assignments come in parts.
+DEFAULT_CATEGORY_RULES = [
+    {"category": "lecture_quizzes", "pattern": "Lecture Quiz", "key": "number"},
+    {"category": "discussions", "pattern": "Discussion", "key": "number"},
+    {"category": "midterms", "pattern": "Midterm", "key": "sequence"},
+    {"category": "projects", "pattern": "Project", "key": "number"},
+    {"category": "labs", "pattern": "Lab", "key": "number", "parts": {"conceptual": "Conceptual", "code": "Code"}},
+]
+OTHER_CATEGORY = "other"
+
+
+class CategoryRule:
+    """
+    A rule of DEFAULT_CATEGORY_RULES (or of a course config), with its patterns compiled.
+    """
+
+    def __init__(self, category, pattern, key="number", parts=None):
+        if key not in ("number", "sequence"):
+            raise ValueError(f"Unknown key {key!r} for category {category!r}; expected 'number' or 'sequence'")
+        self.category = category
+        self.pattern = re.compile(pattern)
+        self.key = key
+        self.parts = [(part, re.compile(part_pattern)) for part, part_pattern in (parts or {}).items()]
+
+    def part_of(self, title):
+        """
+        Returns the name of the first part whose pattern is found in `title`, or None.
+        """
+        for part, part_pattern in self.parts:
+            if part_pattern.search(title):
+                return part
+        return None
+
+
+def compile_rules(rules=None):
+    """
+    Compiles category rules, given as a list of dicts like DEFAULT_CATEGORY_RULES (the default).
+
+    Returns:
+        list: The CategoryRule of each rule, in order.
+    """
+    return [CategoryRule(**rule) for rule in (DEFAULT_CATEGORY_RULES if rules is None else rules)]
+
+
+DEFAULT_RULES = compile_rules()
+
+
+def unescape_title(title, depth):
+    """
+    Decodes a title matched by ASSIGNMENT_PATTERN, which is escaped `depth + 1` times as a JSON string.
+    """
+    if "\\" not in title:
+        return title
+    try:
+        for _ in range(depth + 1):
+            title = json.loads(f'"{title}"')
+        return title
+    except ValueError:
+        # Not valid JSON escapes: drop the backslashes, as earlier versions did.
+        return title.replace("\\", "")
+
+
+def legacy_title(title):
+    """
+    Normalizes a title matched by ASSIGNMENT_PATTERN the way earlier versions did: the page's bytes as Python prints
+    them, with every backslash removed. Escapes are not decoded, so "\\u0026" becomes "u0026" and "é" becomes "xc3xa9".
+    Subsheet names, gradebook headers and the API's titles are made from these titles, so changing them would orphan
+    existing sheets and break API clients.
+    """
+    return str(title.encode("utf-8"))[2:-1].replace("\\", "")
+
+
+def extract_assignments(page):
+    """
+    Extracts every assignment embedded in a Gradescope assignments page.
+
+    Args:
+        page (bytes or String): The assignments page. Falsy values, such as a failed download, count as an empty page.
+    Returns:
+        list: (assignment ID, title, legacy title) tuples of strings, in page order. The title is decoded;
+        the legacy title is normalized by legacy_title.
+    """
+    if not page:
+        return []
+    if isinstance(page, bytes):
+        page = page.decode("utf-8", errors="replace")
+    return [(assignment_id, unescape_title(title, len(backslashes)), legacy_title(title))
+            for backslashes, assignment_id, title in ASSIGNMENT_PATTERN.findall(page)]
+
+
+class Assignment:
+    """
+    One assignment of a catalog. `number` is its key within its category (None for "other", and for titles without
+    a number), and `part` is the part it belongs to (such as "code" for a lab), or None. `legacy_title` is the title
+    as earlier versions normalized it (see legacy_title), which is what the sync script names sheets and columns with,
+    and what the API returns.
+    """
+
+    __slots__ = ("assignment_id", "title", "category", "number", "part", "legacy_title")
+
+    def __init__(self, assignment_id, title, category, number=None, part=None, legacy_title=None):
+        self.assignment_id = assignment_id
+        self.title = title
+        self.category = category
+        self.number = number
+        self.part = part
+        self.legacy_title = title if legacy_title is None else legacy_title
+
+
+class AssignmentCatalog:
+    """
+    The assignments of a Gradescope course, categorized by title, with lookup indexes by ID, by category,
+    and by (category, number, part).
+    """
+
+    def __init__(self, assignments, categories):
+        """
+        Args:
+            assignments (list): The Assignment of every assignment, in page order.
+            categories (list): The category names, in order, including OTHER_CATEGORY.
+        """
+        self.assignments = assignments
+        self.categories = categories
+        self.by_id = {assignment.assignment_id: assignment for assignment in assignments}
+        self.by_category = {category: [] for category in categories}
+        self.by_number = {}
+        for assignment in assignments:
+            self.by_category[assignment.category].append(assignment)
+            if assignment.number is not None:
+                self.by_number[(assignment.category, assignment.number, assignment.part)] = assignment
+
+    @classmethod
+    def from_page(cls, page, rules=DEFAULT_RULES):
+        """
+        Parses a Gradescope assignments page into a catalog.
+
+        Args:
+            page (bytes or String): The assignments page.
+            rules (list): The compiled category rules. Defaults to DEFAULT_CATEGORY_RULES.
+        Returns:
+            AssignmentCatalog: The catalog.
+        """
+        sequence_counts = {}
+        assignments = []
+        for assignment_id, title, sheet_title in extract_assignments(page):
+            for rule in rules:
+                if rule.pattern.search(title):
+                    break
+            else:
+                rule = None
+            if rule is None:
+                assignments.append(Assignment(assignment_id, title, OTHER_CATEGORY, legacy_title=sheet_title))
+                continue
+            if rule.key == "sequence":
+                sequence_counts[rule.category] = number = sequence_counts.get(rule.category, 0) + 1
+            else:
+                match = NUMBER_PATTERN.search(title)
+                number = int(match.group()) if match else None
+            assignments.append(Assignment(assignment_id, title, rule.category, number, rule.part_of(title), sheet_title))
+        categories = list(dict.fromkeys(rule.category for rule in rules)) + [OTHER_CATEGORY]
+        return cls(assignments, categories)
+
+    def find(self, category, number, part=None):
+        """
+        Returns the assignment with the given category, number and part, or None.
+        """
+        return self.by_number.get((category, int(number), part))
+
+    def id_to_names(self, legacy=False):
+        """
+        Returns a dict mapping the ID of every assignment on the page to its title, or to its legacy title if `legacy`.
+        """
+        return {assignment.assignment_id: assignment.legacy_title if legacy else assignment.title
+                for assignment in self.assignments}
+
+    def to_json(self):
+        """
+        Returns the catalog in the nested format of the API's /getAssignmentJSON: for each category, a dict from
+        number (as a string) to {"title", "assignment_id"}, sorted by number. Assignments with parts are nested
+        one level deeper, under their part name. "other" maps assignment IDs to titles.
+        Titles are legacy titles, which API clients already use as keys (e.g. in /fetchAllGrades).
+        """
+        catalog = {category: {} for category in self.categories}
+        for assignment in self.assignments:
+            entry = {"title": assignment.legacy_title, "assignment_id": assignment.assignment_id}
+            if assignment.category == OTHER_CATEGORY:
+                catalog[OTHER_CATEGORY][assignment.assignment_id] = assignment.legacy_title
+            elif assignment.number is None:
+                continue
+            elif assignment.part is not None:
+                catalog[assignment.category].setdefault(str(assignment.number), {})[assignment.part] = entry
+            else:
+                catalog[assignment.category][str(assignment.number)] = entry
+        for category in self.categories:
+            if category != OTHER_CATEGORY:
+                catalog[category] = dict(sorted(catalog[category].items(), key=lambda item: int(item[0])))
+        return catalog
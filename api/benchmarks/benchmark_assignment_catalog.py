@@ -0,0 +1,141 @@
+#!/usr/local/bin/python
+"""
+Benchmarks the assignment catalog parser in assignment_catalog.py against the regex-and-json.loads implementation
+it replaced, on a captured Gradescope assignments page or a large synthetic one, and checks that both categorize
+the assignments the same way.
+
+To capture a page, save the response of https://www.gradescope.com/courses/<course id>/assignments while logged in.
+
+Usage (from the api folder):
+    python benchmarks/benchmark_assignment_catalog.py [--page assignments.html] [--assignments 3000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from assignment_catalog import AssignmentCatalog
+
+TITLE_TEMPLATES = [
+    "Lecture Quiz {n}: Topic {n}", "Discussion {n}: Worksheet", "Lab {n}: Exercises (Conceptual)",
+    "Lab {n}: Exercises (Code)", "Project {n}: Build", "Midterm {n}", "Practice Midterm {n}",
+    "Postterm {n}", "Extra Credit Survey {n}",
+]
+
+
+def make_synthetic_page(number_of_assignments, seed=0):
+    """
+    Builds a page shaped like Gradescope's: HTML around a JavaScript string holding the assignments as escaped JSON.
+    """
+    rng = random.Random(seed)
+    rows = []
+    table_data = []
+    for index in range(number_of_assignments):
+        assignment = {"id": 5000000 + index, "title": rng.choice(TITLE_TEMPLATES).format(n=rng.randint(1, 200))}
+        points = rng.choice([1.0, 10.0, 100.0])
+        rows.append(f"<tr><td>{assignment['title']}</td><td>{points}</td></tr>\n")
+        table_data.append({"assignment": assignment, "submissions": rng.randint(0, 400),
+                           "due_date": "2025-01-01T00:00:00", "points": points})
+    rows = "".join(rows)
+    props = json.dumps(json.dumps({"table_data": table_data}, separators=(",", ":")))
+    return (f"<html><head><title>Assignments</title></head><body><table>{rows}</table>"
+            f"<script>window.props = JSON.parse({props});</script></body></html>").encode("utf-8")
+
+
+def legacy_convert(page):
+    """
+    The implementation the API and the sync script used before assignment_catalog.py: stringify the page,
+    strip backslashes, find every assignment with an uncompiled regex, json.loads each one, and categorize
+    the titles with a chain of substring checks.
+    """
+    course_info_response = str(page).replace("\\", "").replace("\\u0026", "&")
+    pattern = '{"id":[0-9]+,"title":"[^}"]+?"}'
+    info_for_all_assignments = re.findall(pattern, course_info_response)
+    categories = {"lecture_quizzes": {}, "labs": {}, "discussions": {}, "midterms": {}, "projects": {}, "other": {}}
+    for assignment in info_for_all_assignments:
+        assignment_as_json = json.loads(assignment)
+        assignment_id = str(assignment_as_json["id"])
+        title = assignment_as_json["title"]
+        entry = {"title": title, "assignment_id": assignment_id}
+        if "Lecture Quiz" in title:
+            number = re.search(r'\d+', title)
+            if number:
+                categories["lecture_quizzes"][number.group()] = entry
+        elif "Discussion" in title:
+            number = re.search(r'\d+', title)
+            if number:
+                categories["discussions"][number.group()] = entry
+        elif "Midterm" in title or "Practice Midterm" in title:
+            categories["midterms"][str(len(categories["midterms"]) + 1)] = entry
+        elif "Project" in title:
+            number = re.search(r'\d+', title)
+            if number:
+                categories["projects"][number.group()] = entry
+        elif "Lab" in title:
+            number = re.search(r'\d+', title)
+            if number:
+                key = number.group()
+                if key not in categories["labs"]:
+                    categories["labs"][key] = {}
+                if "Conceptual" in title:
+                    categories["labs"][key]["conceptual"] = entry
+                elif "Code" in title:
+                    categories["labs"][key]["code"] = entry
+                else:
+                    categories["labs"][key] = entry
+        else:
+            categories["other"][assignment_id] = title
+    for category in ["lecture_quizzes", "labs", "projects", "discussions", "midterms"]:
+        categories[category] = dict(sorted(categories[category].items(), key=lambda item: int(item[0])))
+    return categories
+
+
+def catalog_convert(page):
+    """
+    The current implementation, in assignment_catalog.py.
+    """
+    return AssignmentCatalog.from_page(page).to_json()
+
+
+def time_best_of(function, repeat, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", help="A captured assignments page. Defaults to a synthetic page.")
+    parser.add_argument("--assignments", type=int, default=3000, help="The number of assignments on the synthetic page.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.page:
+        with open(args.page, "rb") as page_file:
+            page = page_file.read()
+    else:
+        page = make_synthetic_page(args.assignments)
+    legacy_seconds, legacy_catalog = time_best_of(legacy_convert, args.repeat, page)
+    catalog_seconds, catalog = time_best_of(catalog_convert, args.repeat, page)
+
+    # Titles with escaped characters are decoded by the new parser but mangled by the old one, so compare the rest.
+    assert catalog == legacy_catalog or args.page, "The catalogs differ"
+    if catalog != legacy_catalog:
+        print("warning: the catalogs differ, probably on titles with escaped characters")
+
+    print(f"{len(page) / 1e6:.1f} MB page, {len(AssignmentCatalog.from_page(page).assignments)} assignments")
+    print(f"legacy:  {legacy_seconds * 1000:.1f} ms")
+    print(f"catalog: {catalog_seconds * 1000:.1f} ms ({legacy_seconds / catalog_seconds:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import orjson
+
+
+class TTLCache:
+    """
+    A thread-safe, in-process cache whose entries expire after `ttl` seconds.
+
+    When more than `max_entries` entries are stored, the least recently used entry is evicted.
+    If `persist_path` is given, the cache is loaded from that JSON file on startup and written back
+    to it whenever it changes, so entries survive restarts. Values must be JSON-serializable to be persisted.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 128, persist_path: str = None):
+        """
+        Parameters:
+            ttl (float): Number of seconds an entry stays valid after it is set.
+            max_entries (int): Maximum number of entries kept before the least recently used one is evicted.
+            persist_path (str, optional): JSON file used to persist the cache. Defaults to `None` (no persistence).
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.lock = threading.Lock()
+        # Maps keys to (time the entry was set, value), ordered from least to most recently used.
+        self.entries = OrderedDict()
+        self.counts = {"hits": 0, "misses": 0}
+        if persist_path:
+            self._load()
+
+    def get(self, key):
+        """
+        Returns the value stored for `key`, or `None` if there is no value or it has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counts["misses"] += 1
+                return None
+            set_at, value = entry
+            if time.time() - set_at > self.ttl:
+                del self.entries[key]
+                self.counts["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counts["hits"] += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Stores `value` for `key`, evicting the least recently used entry if the cache is full.
+        """
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._save()
+
+    def invalidate(self, key=None):
+        """
+        Removes the entry for `key`, or every entry if `key` is `None`.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        with self.lock:
+            if key is None:
+                removed = len(self.entries)
+                self.entries.clear()
+            else:
+                removed = 1 if self.entries.pop(key, None) is not None else 0
+            self._save()
+            return removed
+
+    def stats(self):
+        """
+        Returns the number of entries and the hit and miss counts.
+        """
+        with self.lock:
+            return {"entries": len(self.entries), **self.counts}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _load(self):
+        """
+        Loads unexpired entries from `persist_path`. A missing or unreadable file leaves the cache empty.
+        """
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r") as cache_file:
+                persisted = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable cache file {self.persist_path}: {e}")
+            return
+        now = time.time()
+        for key, (set_at, value) in persisted.items():
+            if now - set_at <= self.ttl:
+                self.entries[key] = (set_at, value)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _save(self):
+        """
+        Writes all entries to `persist_path`, replacing the file atomically. Must be called with the lock held.
+        """
+        if not self.persist_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            temporary_path = self.persist_path + ".tmp"
+            with open(temporary_path, "w") as cache_file:
+                json.dump(self.entries, cache_file)
+            os.replace(temporary_path, self.persist_path)
+        except (OSError, TypeError) as e:
+            logging.warning(f"Failed to persist cache to {self.persist_path}: {e}")
+
+
+class CachedResponse:
+    """
+    A value stored in a `ResponseCache`, with its strong ETag.
+    """
+
+    def __init__(self, value, etag: str, loaded_at: float):
+        self.value = value
+        self.etag = etag
+        self.loaded_at = loaded_at
+
+
+def etag_for(value) -> str:
+    """
+    Returns a strong ETag for a JSON-serializable value: the quoted SHA-256 of its canonical JSON encoding.
+    """
+    encoded = orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return '"' + hashlib.sha256(encoded).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Returns whether an If-None-Match header matches `etag`. Weak validators (W/"...") match their strong
+    counterpart, as If-None-Match uses the weak comparison.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class ResponseCache:
+    """
+    A thread-safe, in-process read-through cache of responses, with a strong ETag for every entry.
+
+    An entry is fresh for `ttl` seconds after it is loaded, and is then served stale for up to `stale_ttl` more
+    seconds while a background thread loads it again (stale-while-revalidate). After that, it is loaded again
+    before it is served. Only values for which `cacheable(value)` is true are stored, so errors are not cached.
+    When more than `max_entries` entries are stored, the least recently used entry is evicted.
+
+    The hit, stale hit, miss, refresh and 304 counts are kept for monitoring; see `stats`.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float = 0, max_entries: int = 128, cacheable=None):
+        """
+        Parameters:
+            ttl (float): Number of seconds an entry is fresh after it is loaded.
+            stale_ttl (float): Number of seconds after `ttl` during which a stale entry is served while it is reloaded.
+                Defaults to `0` (never serve stale entries).
+            max_entries (int): Maximum number of entries kept before the least recently used one is evicted.
+            cacheable (callable, optional): Returns whether a loaded value may be stored. Defaults to storing every value.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.cacheable = cacheable or (lambda value: True)
+        self.lock = threading.Lock()
+        # Maps keys to CachedResponse, ordered from least to most recently used.
+        self.entries = OrderedDict()
+        # Keys being reloaded in the background, so that each stale entry is reloaded by one thread only.
+        self.refreshing = set()
+        self.counts = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0, "not_modified": 0}
+
+    def get(self, key, load):
+        """
+        Returns the entry for `key`. If there is none, or it is too old to be served, `load()` is called and its
+        value is stored. A stale entry is returned at once, and reloaded in a background thread.
+
+        Parameters:
+            key: The cache key.
+            load (callable): Loads the value from upstream. It is called with no arguments.
+        Returns:
+            CachedResponse: The entry. If the value just loaded is not cacheable, it is returned with an `etag` of `None`
+            and is not stored.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                age = time.time() - entry.loaded_at
+                if age <= self.ttl:
+                    self.counts["hits"] += 1
+                    self.entries.move_to_end(key)
+                    return entry
+                if age <= self.ttl + self.stale_ttl:
+                    self.counts["stale_hits"] += 1
+                    self.entries.move_to_end(key)
+                    if key not in self.refreshing:
+                        self.refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, load), daemon=True).start()
+                    return entry
+            self.counts["misses"] += 1
+        return self._load(key, load)
+
+    def record_not_modified(self):
+        """
+        Counts a request answered with 304 Not Modified because its If-None-Match matched an entry.
+        """
+        with self.lock:
+            self.counts["not_modified"] += 1
+
+    def invalidate(self, key=None):
+        """
+        Removes the entry for `key`, or every entry if `key` is `None`.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        with self.lock:
+            if key is None:
+                removed = len(self.entries)
+                self.entries.clear()
+            else:
+                removed = 1 if self.entries.pop(key, None) is not None else 0
+            return removed
+
+    def stats(self):
+        """
+        Returns the number of entries and the hit, stale hit, miss, refresh, failed refresh and 304 counts.
+        """
+        with self.lock:
+            return {"entries": len(self.entries), **self.counts}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _load(self, key, load):
+        """
+        Calls `load()` and stores its value for `key` if it is cacheable.
+        """
+        value = load()
+        if not self.cacheable(value):
+            return CachedResponse(value, None, time.time())
+        entry = CachedResponse(value, etag_for(value), time.time())
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def _refresh(self, key, load):
+        """
+        Reloads a stale entry in the background. If loading fails, the stale entry is kept until it expires.
+        """
+        try:
+            entry = self._load(key, load)
+            with self.lock:
+                self.counts["refreshes" if entry.etag is not None else "refresh_failures"] += 1
+        except Exception as e:
+            logging.warning(f"Failed to refresh cache entry {key}: {e}")
+            with self.lock:
+                self.counts["refresh_failures"] += 1
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
@@ -1,19 +1,86 @@
 # https://pypi.org/project/fullGSapi/
 from fullGSapi.api.client import GradescopeClient as GradescopeBaseClient
+from bs4 import BeautifulSoup
+import asyncio
+import httpx
+import os
 import threading
+import time
+from urllib.parse import urlparse
+
+# The Gradescope server. Set the GRADESCOPE_BASE_URL environment variable to send every Gradescope request,
+# including the login, to another server, such as the stand-in servers of the benchmarks in /benchmarks.
+GRADESCOPE_BASE_URL = os.getenv("GRADESCOPE_BASE_URL", "https://www.gradescope.com").rstrip("/")
+
+
+def session_validity_of(res, login_path: str):
+    """
+    Returns what a Gradescope response shows about whether the session is logged in:
+    - False for a 401 response or a redirect to the login page,
+    - True for any other successful response,
+    - None if the response says nothing either way. Responses from the login page itself say nothing, because
+      a logged-in session that visits the login page receives a 401 response, and `verify_logged_in` handles those.
+
+    Works with both `requests.Response` and `httpx.Response`.
+    """
+    if urlparse(str(res.url)).path == login_path:
+        return None
+    if res.status_code == 401:
+        return False
+    if res.is_redirect:
+        return False if urlparse(res.headers.get("location", "")).path == login_path else None
+    return True if 200 <= res.status_code < 300 else None
+
 
 class GradescopeClient(GradescopeBaseClient):
-    def __init__(self, timeout: int = 1800):
+    base_url = GRADESCOPE_BASE_URL
+
+    def __init__(self, timeout: int = 1800, verify_interval: int = 300):
         """
         Initializes the extended fullGSapi Gradescope client with an inactivity timer.
 
         Parameters:
             timeout (int): Timeout in seconds for inactivity logout. Default is 1800 seconds (30 minutes).
+            verify_interval (int): Number of seconds for which a successful response from Gradescope is trusted
+                as proof that the session is logged in, so `log_in` can skip `verify_logged_in`. Default is 300 seconds.
         """
         super().__init__()  # Initialize the parent class (GradescopeBaseClient)
         self.timeout = timeout
         self.inactivity_timer = None
         self.lock = threading.Lock() # This is used for login synchronization
+        self.verify_interval = verify_interval
+        self.last_verified_at = None
+        self.login_count = 0
+        self.session.hooks["response"].append(self.track_session_validity)
+
+    def track_session_validity(self, res, *args, **kwargs):
+        """
+        A `requests` response hook. A successful response proves the session is still logged in;
+        a 401 response or a redirect to the login page means it must be verified again.
+        """
+        session_validity = session_validity_of(res, self.login_path)
+        if session_validity is False:
+            self.last_verified_at = None
+        elif session_validity and self.logged_in:
+            self.last_verified_at = time.monotonic()
+
+    def recently_verified(self) -> bool:
+        """
+        Returns whether the session was seen to be logged in within the last `verify_interval` seconds.
+        """
+        return (self.logged_in and self.last_verified_at is not None
+                and time.monotonic() - self.last_verified_at < self.verify_interval)
+
+    def verify_logged_in(self) -> bool:
+        """
+        Checks with Gradescope whether the session is still logged in, and records when it was verified.
+        """
+        if super().verify_logged_in():
+            self.last_verified_at = time.monotonic()
+            return True
+        # The session has expired, so the next login attempt must log in again.
+        self.logged_in = False
+        return False
 
     def reset_inactivity_timer(self):
         """
@@ -38,7 +105,12 @@ class GradescopeClient(GradescopeBaseClient):
     def log_in(self, email: str, password: str) -> bool:
         """
         Logs into Gradescope. This overriden method is thread-safe.
+        The session is only re-verified with Gradescope if it has not been seen to be logged in
+        within the last `verify_interval` seconds.
         """
+        if self.recently_verified():
+            self.reset_inactivity_timer()
+            return True
         if not self.logged_in or not self.verify_logged_in():
             with self.lock:  # Ensures only one thread can execute this block at a time
                 if self.logged_in:  # Double-check inside the lock to avoid redundant login attempts
@@ -60,6 +132,8 @@ class GradescopeClient(GradescopeBaseClient):
                 self.last_res = res = self.submit_form(url, url, data=payload)
                 if res.ok:
                     self.logged_in = True
+                    self.last_verified_at = time.monotonic()
+                    self.login_count += 1
                     print("Logged in to Gradescope")
                     self.reset_inactivity_timer()
                     return True
@@ -77,11 +151,189 @@ class GradescopeClient(GradescopeBaseClient):
                 print("You must be logged in!")
                 return False
 
-            base_url = "https://www.gradescope.com"
-            url = base_url + "/logout"
-            ref_url = base_url + "/account"
+            url = self.base_url + "/logout"
+            ref_url = self.base_url + "/account"
             self.last_res = res = self.session.get(url, headers={"Referer": ref_url})
             if res.ok:
                 self.logged_in = False
+                self.last_verified_at = None
+                return True
+            return False
+
+
+class AsyncGradescopeClient:
+    base_url = GRADESCOPE_BASE_URL
+    login_path = "/login"
+
+    def __init__(self, timeout: int = 1800, max_connections: int = 20, request_timeout: float = 30.0,
+                 verify_interval: int = 300):
+        """
+        Initializes an asynchronous Gradescope client with an inactivity timer.
+
+        The client logs in with the same cookie-based form login as `GradescopeClient`, but all requests go
+        through a pooled `httpx.AsyncClient`, so many requests can be in flight on one event loop.
+
+        Parameters:
+            timeout (int): Timeout in seconds for inactivity logout. Default is 1800 seconds (30 minutes).
+            max_connections (int): Maximum number of pooled connections to Gradescope. Default is 20.
+            request_timeout (float): Timeout in seconds for each request to Gradescope. Default is 30 seconds.
+            verify_interval (int): Number of seconds for which a successful response from Gradescope is trusted
+                as proof that the session is logged in, so `log_in` can skip `verify_logged_in`. Default is 300 seconds.
+        """
+        self.timeout = timeout
+        self.verify_interval = verify_interval
+        self.last_verified_at = None
+        self.session = httpx.AsyncClient(
+            headers={"User-Agent": "fullGSapi"},
+            follow_redirects=True,
+            timeout=request_timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            event_hooks={"response": [self.track_session_validity]},
+        )
+        self.logged_in = False
+        self.last_res = None
+        self.inactivity_timer = None
+        self.lock = asyncio.Lock() # This is used for login synchronization
+        self.login_count = 0
+
+    def reset_inactivity_timer(self):
+        """
+        Resets or starts the inactivity timer for logging out the Gradescope client.
+
+        Cancels any existing timer and schedules a new one on the running event loop. When the timer expires,
+        it schedules the `logout` coroutine from this class to log out the client.
+        """
+        if self.inactivity_timer is not None:
+            self.inactivity_timer.cancel()
+        loop = asyncio.get_running_loop()
+        self.inactivity_timer = loop.call_later(self.timeout, lambda: asyncio.ensure_future(self.logout()))
+
+    def set_timer(self, newTimeout: int):
+        """
+        Set the timeout to the new timeout.
+        """
+        self.timeout = newTimeout
+
+    async def track_session_validity(self, res: httpx.Response):
+        """
+        An `httpx` response hook. A successful response proves the session is still logged in;
+        a 401 response or a redirect to the login page means it must be verified again.
+        """
+        session_validity = session_validity_of(res, self.login_path)
+        if session_validity is False:
+            self.last_verified_at = None
+        elif session_validity and self.logged_in:
+            self.last_verified_at = time.monotonic()
+
+    def recently_verified(self) -> bool:
+        """
+        Returns whether the session was seen to be logged in within the last `verify_interval` seconds.
+        """
+        return (self.logged_in and self.last_verified_at is not None
+                and time.monotonic() - self.last_verified_at < self.verify_interval)
+
+    async def verify_logged_in(self) -> bool:
+        """
+        Checks whether the session cookies are still logged in, and records when they were verified.
+        A logged-in session that visits the login page receives a 401 response.
+        """
+        if not self.logged_in:
+            return False
+        self.last_res = res = await self.session.get(self.base_url + self.login_path)
+        if res.status_code == 401:
+            self.last_verified_at = time.monotonic()
+            return True
+        return False
+
+    async def get_token(self, url: str) -> str:
+        """
+        Retrieves the authenticity token of the form on the page at `url`.
+        """
+        self.last_res = res = await self.session.get(url)
+        soup = BeautifulSoup(res.content, "html.parser")
+        return soup.find("form").find("input", {"name": "authenticity_token"})["value"]
+
+    async def submit_form(self, url: str, ref_url: str, data: dict = None) -> httpx.Response:
+        headers = {
+            "Host": urlparse(self.base_url).netloc,
+            "Origin": self.base_url,
+            "Referer": ref_url
+        }
+        self.last_res = res = await self.session.post(url, data=data, headers=headers)
+        return res
+
+    async def log_in(self, email: str, password: str) -> bool:
+        """
+        Logs into Gradescope. Concurrent callers share a single login.
+        The session is only re-verified with Gradescope if it has not been seen to be logged in
+        within the last `verify_interval` seconds.
+        """
+        if self.recently_verified():
+            self.reset_inactivity_timer()
+            return True
+        if self.logged_in and await self.verify_logged_in():
+            # We are already logged in, so reset the inactivity timer
+            self.reset_inactivity_timer()
+            return True
+        login_count = self.login_count
+        async with self.lock:  # Ensures only one coroutine can execute this block at a time
+            if self.logged_in and self.login_count != login_count:  # Another coroutine logged in while we waited
+                self.reset_inactivity_timer()
+                return True
+
+            url = self.base_url + self.login_path
+            token = await self.get_token(url)
+            payload = {
+                "utf8": "✓",
+                "authenticity_token": token,
+                "session[email]": email,
+                "session[password]": password,
+                "session[remember_me]": 1,
+                "commit": "Log In",
+                "session[remember_me_sso]": 0,
+            }
+            res = await self.submit_form(url, url, data=payload)
+            if res.is_success:
+                self.logged_in = True
+                self.last_verified_at = time.monotonic()
+                self.login_count += 1
+                print("Logged in to Gradescope")
+                self.reset_inactivity_timer()
+                return True
+            self.logged_in = False
+            return False
+
+    async def logout(self) -> bool:
+        """
+        Logs out of Gradescope.
+        """
+        async with self.lock:  # Ensures only one coroutine can execute this block at a time
+            print("Logging out")
+            if not self.logged_in:  # Double-check within the lock to avoid redundant logout attempts
+                print("You must be logged in!")
+                return False
+
+            url = self.base_url + "/logout"
+            ref_url = self.base_url + "/account"
+            self.last_res = res = await self.session.get(url, headers={"Referer": ref_url})
+            if res.is_success:
+                self.logged_in = False
+                self.last_verified_at = None
+                self.session.cookies.clear()
                 return True
             return False
+
+    async def get(self, path: str) -> httpx.Response:
+        """
+        Makes an authenticated GET request for a path on Gradescope, e.g. `/courses/{class_id}/assignments`.
+        """
+        self.last_res = res = await self.session.get(self.base_url + path)
+        return res
+
+    async def aclose(self):
+        """
+        Cancels the inactivity timer and closes the pooled connections.
+        """
+        if self.inactivity_timer is not None:
+            self.inactivity_timer.cancel()
+        await self.session.aclose()
@@ -0,0 +1,317 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from gradescopeClient import GradescopeClient
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+# The client checked out of the pool by the endpoint currently executing. Set by `GradescopeSessionPool.session`.
+current_client = ContextVar("current_gradescope_client", default=None)
+
+
+def get_current_client() -> GradescopeClient:
+    """
+    Returns the Gradescope client checked out for the endpoint currently executing.
+    """
+    client = current_client.get()
+    if client is None:
+        raise RuntimeError("No Gradescope session is checked out; decorate the endpoint with pooled_gradescope_session.")
+    return client
+
+
+def cookies_of(client: GradescopeClient) -> list:
+    """
+    Returns the cookies of a client's session as a list of JSON-serializable dicts.
+    """
+    return [
+        {"name": cookie.name, "value": cookie.value, "domain": cookie.domain, "path": cookie.path}
+        for cookie in client.session.cookies
+    ]
+
+
+class PooledGradescopeClient(GradescopeClient):
+    """
+    A Gradescope client owned by a `GradescopeSessionPool`. Pooled clients share one login, so they never log out
+    on their own; the pool logs all of them out together once the whole pool (and, with a shared cookie store,
+    every other process) has been inactive.
+    """
+
+    def reset_inactivity_timer(self):
+        pass
+
+
+class SQLiteCookieStore:
+    """
+    Stores the cookies of logged-in Gradescope sessions in a SQLite file, keyed by account, so that every
+    worker process on a machine can reuse one login instead of logging in separately. `updated_at` is the last time
+    any process logged in or used the session, so a process only ends the session once all of them are idle.
+    """
+
+    def __init__(self, path: str):
+        """
+        Parameters:
+            path (str): The SQLite file. It is created if it does not exist.
+        """
+        self.path = path
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cookies (account TEXT PRIMARY KEY, cookies TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def connect(self):
+        # A new connection per call, since connections cannot be shared between threads.
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self, account: str):
+        """
+        Returns the stored cookies for `account` as a list of dicts, or `None` if there are none.
+        """
+        with self.connect() as connection:
+            row = connection.execute("SELECT cookies FROM cookies WHERE account = ?", (account,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, account: str, cookies: list):
+        """
+        Stores `cookies` for `account`, replacing any cookies stored before.
+        """
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cookies (account, cookies, updated_at) VALUES (?, ?, ?)",
+                (account, json.dumps(cookies), time.time())
+            )
+
+    def touch(self, account: str):
+        """
+        Records that the session of `account` was just used.
+        """
+        with self.connect() as connection:
+            connection.execute("UPDATE cookies SET updated_at = ? WHERE account = ?", (time.time(), account))
+
+    def clear(self, account: str, idle_for: float = None):
+        """
+        Removes the stored cookies for `account`.
+
+        Parameters:
+            idle_for (float, optional): If given, the cookies are only removed if the session has not been used
+                for this many seconds.
+        Returns:
+            bool: Whether cookies were removed.
+        """
+        with self.connect() as connection:
+            if idle_for is None:
+                cursor = connection.execute("DELETE FROM cookies WHERE account = ?", (account,))
+            else:
+                cursor = connection.execute(
+                    "DELETE FROM cookies WHERE account = ? AND updated_at <= ?", (account, time.time() - idle_for)
+                )
+        return cursor.rowcount > 0
+
+
+class GradescopeSessionPool:
+    """
+    A pool of logged-in Gradescope clients, keyed by course.
+
+    Each key has up to `size` clients, so parallel requests for one course do not share one session, and requests
+    for different courses do not wait on each other. All clients log in to one account and share its cookies,
+    so a login is only needed when the shared session has expired. If `cookie_store_path` is given, the cookies
+    are also shared with other worker processes through a SQLite file.
+    """
+
+    def __init__(self, email: str, password: str, size: int = 4, timeout: int = 1800, verify_interval: int = 300,
+                 cookie_store_path: str = None):
+        """
+        Parameters:
+            email (str): The Gradescope account email.
+            password (str): The Gradescope account password.
+            size (int): Maximum number of clients per key. Default is 4.
+            timeout (int): Timeout in seconds for inactivity logout of the whole pool. Default is 1800 seconds (30 minutes).
+            verify_interval (int): See `GradescopeClient`. Default is 300 seconds.
+            cookie_store_path (str, optional): SQLite file used to share cookies between processes. Defaults to `None`.
+        """
+        self.email = email
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.verify_interval = verify_interval
+        self.cookie_store = SQLiteCookieStore(cookie_store_path) if cookie_store_path else None
+        self.available = threading.Condition()
+        self.login_lock = threading.Lock() # Ensures that clients logging in at the same time share one login
+        self.idle_clients = {}
+        self.client_counts = {}
+        self.shared_cookies = None
+        self.login_count = 0
+        self.inactivity_timer = None
+        # Releases record activity in the cookie store at most this often, so that the other processes know the
+        # session is in use without a write per request.
+        self.touch_interval = min(60, timeout / 10)
+        self.last_touched_at = 0
+
+    @contextmanager
+    def session(self, key: str):
+        """
+        Checks a logged-in client out of the pool for `key`, and makes it available to `get_current_client`.
+        Nested checkouts in the same context reuse the client that is already checked out.
+        """
+        if current_client.get() is not None:
+            yield current_client.get()
+            return
+        client = self.acquire(key)
+        token = current_client.set(client)
+        try:
+            yield client
+        finally:
+            current_client.reset(token)
+            self.release(key, client)
+
+    def acquire(self, key: str) -> GradescopeClient:
+        """
+        Returns a logged-in client for `key`, waiting for one to be released if `size` clients are already in use.
+        """
+        with self.available:
+            while True:
+                idle = self.idle_clients.setdefault(key, deque())
+                if idle:
+                    client = idle.popleft()
+                    break
+                if self.client_counts.get(key, 0) < self.size:
+                    self.client_counts[key] = self.client_counts.get(key, 0) + 1
+                    client = PooledGradescopeClient(timeout=self.timeout, verify_interval=self.verify_interval)
+                    break
+                self.available.wait()
+        try:
+            self.ensure_logged_in(client)
+        except Exception:
+            self.discard(key)
+            raise
+        return client
+
+    def release(self, key: str, client: GradescopeClient):
+        """
+        Returns a client to the pool for `key`.
+        """
+        with self.available:
+            self.idle_clients[key].append(client)
+            self.available.notify()
+        if self.cookie_store is not None and time.monotonic() - self.last_touched_at >= self.touch_interval:
+            self.last_touched_at = time.monotonic()
+            self.cookie_store.touch(self.email)
+        self.reset_inactivity_timer()
+
+    def discard(self, key: str):
+        """
+        Forgets a checked-out client for `key` that is broken, so that a new one can be created in its place.
+        """
+        with self.available:
+            self.client_counts[key] -= 1
+            self.available.notify()
+
+    def ensure_logged_in(self, client: GradescopeClient):
+        """
+        Makes sure `client` is logged in: adopts the shared cookies if they differ from the client's,
+        and only logs in to Gradescope if the shared session has expired.
+        """
+        if client.recently_verified():
+            return
+        with self.login_lock:
+            cookies = self.load_shared_cookies()
+            if cookies and cookies != cookies_of(client):
+                client.session.cookies.clear()
+                for cookie in cookies:
+                    client.session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"])
+                client.logged_in = True
+                client.last_verified_at = None
+            login_count = client.login_count
+            if client.log_in(self.email, self.password) is False:
+                raise ConnectionError("Failed to log in to Gradescope")
+            if client.login_count != login_count:
+                self.login_count += 1
+                self.save_shared_cookies(cookies_of(client))
+
+    def load_shared_cookies(self):
+        if self.cookie_store is not None:
+            return self.cookie_store.load(self.email)
+        return self.shared_cookies
+
+    def save_shared_cookies(self, cookies: list):
+        self.shared_cookies = cookies
+        if self.cookie_store is not None:
+            self.cookie_store.save(self.email, cookies)
+
+    def health_check(self) -> dict:
+        """
+        Verifies every idle client with Gradescope, and drops the ones that are no longer logged in.
+
+        Returns:
+            dict: The number of healthy and dropped clients.
+        """
+        with self.available:
+            idle_clients = {key: list(clients) for key, clients in self.idle_clients.items()}
+            for clients in self.idle_clients.values():
+                clients.clear()
+        healthy = dropped = 0
+        for key, clients in idle_clients.items():
+            for client in clients:
+                if client.verify_logged_in():
+                    healthy += 1
+                    self.release(key, client)
+                else:
+                    dropped += 1
+                    client.session.close()
+                    self.discard(key)
+        return {"healthy": healthy, "dropped": dropped}
+
+    def stats(self) -> dict:
+        """
+        Returns the number of clients, idle clients and logins for each key.
+        """
+        with self.available:
+            return {
+                "logins": self.login_count,
+                "courses": {
+                    key: {"clients": count, "idle": len(self.idle_clients.get(key, ()))}
+                    for key, count in self.client_counts.items()
+                },
+            }
+
+    def reset_inactivity_timer(self):
+        """
+        Resets or starts the inactivity timer for logging out the whole pool.
+        Logout automatically if there are X minutes of inactivity for security reasons.
+        """
+        if self.inactivity_timer is not None:
+            self.inactivity_timer.cancel()
+        self.inactivity_timer = threading.Timer(self.timeout, self.logout)
+        self.inactivity_timer.daemon = True
+        self.inactivity_timer.start()
+
+    def logout(self):
+        """
+        Drops every idle client and, unless another process used the shared session within `timeout`,
+        logs the session out of Gradescope.
+        Clients that are checked out at the time log in again once they notice the session has ended.
+        """
+        with self.available:
+            idle_clients = [client for clients in self.idle_clients.values() for client in clients]
+            for key, clients in self.idle_clients.items():
+                self.client_counts[key] -= len(clients)
+                clients.clear()
+            self.shared_cookies = None
+            self.available.notify_all()
+        # With a shared cookie store, this process being idle does not mean the others are: the session is only
+        # ended if no process has used it within the timeout. Otherwise only this process's clients are dropped.
+        # Activity is recorded up to touch_interval late, which is allowed for so that this process's own last use
+        # does not keep it from ending the session.
+        ends_session = self.cookie_store is None or self.cookie_store.clear(
+            self.email, idle_for=self.timeout - self.touch_interval
+        )
+        logged_in_clients = [client for client in idle_clients if client.logged_in]
+        if ends_session and logged_in_clients:
+            try:
+                GradescopeClient.logout(logged_in_clients[0])
+            except Exception as e:
+                logging.error(f"Failed to log out of Gradescope: {e}")
+        for client in idle_clients:
+            client.session.close()
@@ -0,0 +1,168 @@
+from contextlib import contextmanager
+import os
+import time
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Latency buckets, in seconds, from fast cache hits up to slow Gradescope downloads.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty folder so that /metrics reports the requests
+# of every worker, not only those of the worker that answers. See `metrics_registry`.
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "gradesync_http_requests_in_flight", "The number of requests being served.", multiprocess_mode="livesum"
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "gradesync_http_request_duration_seconds", "How long requests took to serve, until the last byte was sent.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "gradesync_upstream_request_duration_seconds",
+    "How long calls to Gradescope, PrairieLearn and Google Sheets took, by status (or \"error\" if no response came).",
+    ["upstream", "operation", "status"], buckets=LATENCY_BUCKETS
+)
+ENDPOINT_ERRORS = Counter(
+    "gradesync_endpoint_errors_total", "Exceptions raised by endpoints, by exception type and the status returned.",
+    ["exception", "status"]
+)
+
+
+class UpstreamCall:
+    """
+    The outcome of a call timed by `track_upstream`. Set `status` to the status of the response.
+    """
+
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = None
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str):
+    """
+    Times a call to an upstream service, e.g. `with track_upstream("gradescope", "scores") as call:`, and records it
+    with the status set on `call`. A call that raises is recorded with the status "error".
+
+    Parameters:
+        upstream (str): "gradescope", "prairielearn" or "sheets".
+        operation (str): What was requested, e.g. "scores" or "gradebook". Keep the number of operations small.
+    """
+    call = UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call.status = "error"
+        raise
+    finally:
+        UPSTREAM_REQUEST_DURATION.labels(upstream, operation, str(call.status or "unknown")).observe(time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the number of requests in flight and the duration of each request, by method,
+    route template (e.g. `/getGradeScopeAssignmentID/{category_type}/{assignment_number}`) and status.
+    A streamed response is timed until its last chunk has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_and_record_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_record_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope. Unmatched paths share one label, to bound the cardinality.
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(scope["method"], getattr(route, "path", "unmatched"), str(status)).observe(
+                time.perf_counter() - start)
+
+
+class ServiceStatsCollector:
+    """
+    Reports the counters the service already keeps, read when /metrics is scraped: the hits and misses of the caches,
+    the upstream fetches made and coalesced, and the Gradescope logins. They describe the worker that answers.
+    """
+
+    def __init__(self, caches: dict, single_flights: dict, gradescope_login_counts: dict):
+        """
+        Parameters:
+            caches (dict): Maps names to `ResponseCache`s and `TTLCache`s, e.g. {"grades": GRADES_CACHE}.
+            single_flights (dict): Maps names to `SingleFlight`s or `AsyncSingleFlight`s.
+            gradescope_login_counts (dict): Maps client names to functions returning their number of logins.
+        """
+        self.caches = caches
+        self.single_flights = single_flights
+        self.gradescope_login_counts = gradescope_login_counts
+
+    def collect(self):
+        events = CounterMetricFamily("gradesync_cache_events", "Cache lookups and refreshes, by cache and outcome.",
+                                     labels=["cache", "event"])
+        entries = GaugeMetricFamily("gradesync_cache_entries", "The number of entries in each cache.", labels=["cache"])
+        hit_ratio = GaugeMetricFamily("gradesync_cache_hit_ratio",
+                                      "The share of lookups served from each cache, fresh or stale, since the worker started.",
+                                      labels=["cache"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            entries.add_metric([name], stats.pop("entries"))
+            for event, count in stats.items():
+                events.add_metric([name, event], count)
+            hits = stats.get("hits", 0) + stats.get("stale_hits", 0)
+            lookups = hits + stats.get("misses", 0)
+            if lookups:
+                hit_ratio.add_metric([name], hits / lookups)
+        yield events
+        yield entries
+        yield hit_ratio
+
+        fetches = CounterMetricFamily("gradesync_upstream_fetches",
+                                      "Upstream fetches that were made, and requests that shared another request's fetch.",
+                                      labels=["flight", "result"])
+        fetches_in_flight = GaugeMetricFamily("gradesync_upstream_fetches_in_flight", "Upstream fetches in flight.",
+                                              labels=["flight"])
+        for name, single_flight in self.single_flights.items():
+            stats = single_flight.stats()
+            fetches.add_metric([name, "executed"], stats["executed"])
+            fetches.add_metric([name, "coalesced"], stats["coalesced"])
+            fetches_in_flight.add_metric([name], stats["in_flight"])
+        yield fetches
+        yield fetches_in_flight
+
+        logins = CounterMetricFamily("gradesync_gradescope_logins", "Logins to Gradescope, by client.", labels=["client"])
+        for name, login_count in self.gradescope_login_counts.items():
+            logins.add_metric([name], login_count())
+        yield logins
+
+
+def metrics_registry():
+    """
+    Returns the registry /metrics reports: the default one, or, if PROMETHEUS_MULTIPROC_DIR is set,
+    one that merges the metrics of every worker process.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics(*registries) -> bytes:
+    """
+    Renders the metrics of every registry in the Prometheus text format.
+    """
+    return b"".join(generate_latest(registry) for registry in registries)
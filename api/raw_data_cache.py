@@ -0,0 +1,159 @@
+# A local, columnar cache of the raw grade data fetched from Gradescope, PrairieLearn and iClicker.
+# This file is shared by the sync scripts and the API. Each is deployed from its own folder,
+# so an identical copy lives in each of them; keep the copies in sync.
+
+from datetime import datetime, timezone
+import hashlib
+import logging
+import os
+import uuid
+from urllib.parse import quote
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Every source is stored with the same schema. course, source and assignment are also the partition keys,
+# so reads that filter on them only open the matching files.
+SCHEMA = pa.schema([
+    ("course", pa.string()),
+    ("source", pa.string()),
+    ("assignment", pa.string()),
+    ("fetched_at", pa.timestamp("us", tz="UTC")),
+    ("content_type", pa.string()),
+    ("sha256", pa.string()),
+    ("payload", pa.binary()),
+])
+PARTITION_KEYS = ["course", "source", "assignment"]
+PARTITIONING = ds.partitioning(pa.schema([(key, pa.string()) for key in PARTITION_KEYS]), flavor="hive")
+
+
+class RawDataCache:
+    """
+    Stores the raw data fetched for each assignment (a scores CSV, a JSON response, an export file) as Parquet files,
+    one file per fetch, in hive partitions: `{root}/course=.../source=.../assignment=.../{fetched_at}.parquet`.
+
+    A fetch whose payload is identical to the latest stored one is not written again; the latest file's modification
+    time is set to the fetch time instead, so it records when the payload was last seen. Only the newest
+    `keep_versions` fetches of each assignment are kept.
+    """
+
+    def __init__(self, root, keep_versions=5):
+        """
+        Args:
+            root (String): The folder holding the cache. It is created if it does not exist.
+            keep_versions (int): The number of fetches kept for each assignment. Default is 5.
+        """
+        self.root = root
+        self.keep_versions = keep_versions
+        os.makedirs(root, exist_ok=True)
+
+    def partition_path(self, course, source, assignment):
+        # Values are URI-encoded, which is how pyarrow decodes hive partition values.
+        return os.path.join(self.root, *[f"{key}={quote(str(value), safe='')}"
+                                         for key, value in zip(PARTITION_KEYS, (course, source, assignment))])
+
+    def versions(self, course, source, assignment):
+        """
+        Returns the files of an assignment's stored fetches, from oldest to newest.
+        """
+        path = self.partition_path(course, source, assignment)
+        if not os.path.isdir(path):
+            return []
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".parquet")]
+
+    def write(self, course, source, assignment, payload, content_type, fetched_at=None):
+        """
+        Stores one fetch of an assignment's raw data.
+
+        Args:
+            course (String): The course ID on the source, e.g. the Gradescope course ID.
+            source (String): Where the data comes from: "gradescope", "prairielearn" or "iclicker".
+            assignment (String): The assignment (or assessment, or export) the data belongs to.
+            payload (bytes or String): The raw data. Strings are stored as UTF-8.
+            content_type (String): The format of the payload, e.g. "text/csv" or "application/json".
+            fetched_at (datetime, optional): When the data was fetched. Defaults to now.
+        Returns:
+            bool: True if a new version was stored, False if the payload is the same as the latest stored one.
+        """
+        course, assignment = str(course), str(assignment)
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        sha256 = hashlib.sha256(payload).hexdigest()
+        fetched_at = fetched_at or datetime.now(timezone.utc)
+        latest = self.read_latest(course, source, assignment)
+        if latest is not None and latest["sha256"] == sha256:
+            # The payload is not stored again, but the fetch is recorded, so that max_age reads keep hitting
+            # data that has not changed since it was first stored.
+            try:
+                os.utime(latest["path"], (fetched_at.timestamp(), fetched_at.timestamp()))
+            except OSError as e:
+                logger.warning(f"Could not record the fetch time of {latest['path']}: {e}")
+            return False
+
+        table = pa.Table.from_pylist([{
+            "course": course, "source": source, "assignment": assignment, "fetched_at": fetched_at,
+            "content_type": content_type, "sha256": sha256, "payload": payload,
+        }], schema=SCHEMA)
+        path = self.partition_path(course, source, assignment)
+        os.makedirs(path, exist_ok=True)
+        # Sortable by fetch time; the suffix keeps concurrent writers from colliding.
+        file_name = f"{fetched_at.strftime('%Y%m%dT%H%M%S%fZ')}-{uuid.uuid4().hex[:8]}.parquet"
+        temporary_path = os.path.join(path, f".{file_name}.tmp")
+        pq.write_table(table.drop_columns(PARTITION_KEYS), temporary_path)
+        os.replace(temporary_path, os.path.join(path, file_name))
+        os.utime(os.path.join(path, file_name), (fetched_at.timestamp(), fetched_at.timestamp()))
+
+        for old_version in self.versions(course, source, assignment)[:-self.keep_versions]:
+            os.remove(old_version)
+        return True
+
+    def read_latest(self, course, source, assignment, max_age=None):
+        """
+        Returns the latest stored fetch of an assignment's raw data.
+
+        Args:
+            max_age (float, optional): If given, the fetch is ignored if its payload was last seen more than this many
+                seconds ago.
+        Returns:
+            dict: The fetch, with the keys of SCHEMA plus `last_seen_at` (when the payload was last fetched) and
+                `path` (the file it is stored in), or None if there is none (or none recent enough).
+        """
+        course, assignment = str(course), str(assignment)
+        versions = self.versions(course, source, assignment)
+        if not versions:
+            return None
+        path = versions[-1]
+        try:
+            row = pq.read_table(path).to_pylist()[0]
+            last_seen_at = max(row["fetched_at"], datetime.fromtimestamp(os.path.getmtime(path), timezone.utc))
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"Ignoring unreadable cache file {path}: {e}")
+            return None
+        if max_age is not None and (datetime.now(timezone.utc) - last_seen_at).total_seconds() > max_age:
+            return None
+        return {"course": course, "source": source, "assignment": assignment, **row,
+                "last_seen_at": last_seen_at, "path": path}
+
+    def read(self, course=None, source=None, assignment=None, since=None, columns=None):
+        """
+        Reads every stored fetch that matches the given filters. The filters are pushed down to the dataset scan,
+        so only the matching partitions are opened.
+
+        Args:
+            course, source, assignment (String, optional): Keep only fetches with these keys.
+            since (datetime, optional): Keep only fetches made at or after this time.
+            columns (list, optional): The columns to read. Defaults to all of SCHEMA.
+        Returns:
+            pyarrow.Table: The matching fetches.
+        """
+        dataset = ds.dataset(self.root, format="parquet", partitioning=PARTITIONING, schema=SCHEMA)
+        conditions = [ds.field(key) == str(value)
+                      for key, value in zip(PARTITION_KEYS, (course, source, assignment)) if value is not None]
+        if since is not None:
+            conditions.append(ds.field("fetched_at") >= pa.scalar(since, type=SCHEMA.field("fetched_at").type))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return dataset.to_table(columns=columns, filter=expression)
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """
+    One in-flight call of a `SingleFlight`, and its outcome once it has finished.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is in flight, other threads calling `do` with the
+    same key wait for it and get its result (or its exception) instead of making the call again.
+    Once the call has finished, the next call for the key is made again. This is thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Maps keys to the _Call currently in flight for them.
+        self.calls = {}
+        # The number of calls that were made, and the number that shared another call's result instead.
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Calls `func(*args, **kwargs)`, unless a call for `key` is already in flight, in which case waits for that
+        call and returns its result.
+
+        Parameters:
+            key: Identifies the upstream resource, e.g. `("gradescope_scores", class_id, assignment_id)`.
+            func (callable): Fetches the resource.
+        Returns:
+            The value returned by the call made for `key`.
+        Raises:
+            Exception: Whatever the call made for `key` raised.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self):
+        """
+        Returns the number of calls made, the number coalesced into another call, and the number in flight.
+        """
+        with self.lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self.calls)}
+
+
+class AsyncSingleFlight:
+    """
+    Asynchronous version of `SingleFlight`, for coroutines running on one event loop: while a call for a key is
+    in flight, other coroutines calling `do` with the same key await it instead of making the call again.
+    A caller that is cancelled does not cancel the call shared with the other callers.
+    """
+
+    def __init__(self):
+        # Maps keys to the task currently in flight for them.
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Awaits `func(*args, **kwargs)`, unless a call for `key` is already in flight, in which case awaits that call.
+
+        Parameters:
+            key: Identifies the upstream resource, e.g. `("gradescope_scores", class_id, assignment_id)`.
+            func (coroutine function): Fetches the resource.
+        Returns:
+            The value returned by the call made for `key`.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = self.calls[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda finished_task: self.calls.pop(key, None))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """
+        Returns the number of calls made, the number coalesced into another call, and the number in flight.
+        """
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self.calls)}
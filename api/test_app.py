@@ -1,4 +1,8 @@
+import asyncio
+import gc
+import weakref
 from fastapi.testclient import TestClient
+import app as app_module
 from app import app
 
 client = TestClient(app)
@@ -9,6 +13,11 @@ def test_fetch_grades():
     assert response.status_code == 200
     assert "message" not in response.json()  # Assuming success response does not include an error message
 
+def test_fetch_grades_async():
+    response = client.get("/async/getGrades", params={"class_id": "902165", "assignment_id": "5211665"})
+    assert response.status_code == 200
+    assert "message" not in response.json()
+
 def test_lab_conceptual():
     response = client.get("/getGradeScopeAssignmentID/labs/2", params={"lab_type": 1})
     print(response.content)
@@ -37,4 +46,49 @@ def test_PL():
     response = client.get("/getPLGrades")
     #print(response.content)
     assert response.status_code == 200
-    
\ No newline at end of file
+    
+def test_invalidate_assignment_cache():
+    response = client.post("/invalidateAssignmentJSON", params={"class_id": "902165"})
+    assert response.status_code == 200
+    assert "message" in response.json()
+
+def test_fetch_grades_not_modified():
+    params = {"class_id": "902165", "assignment_id": "5211665"}
+    response = client.get("/getGrades", params=params)
+    assert response.status_code == 200
+    assert "etag" in response.headers
+    response = client.get("/getGrades", params=params, headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+    assert client.get("/gradesCacheStats").json()["not_modified"] >= 1
+
+class Grades(list):
+    # Hashable by identity, so that the results can be tracked in a WeakSet.
+    __hash__ = object.__hash__
+
+def test_stream_holds_a_bounded_number_of_results(monkeypatch):
+    live_results = weakref.WeakSet()
+    started = []
+
+    async def load_grades_async(class_id, assignment_id, shape="records"):
+        started.append(assignment_id)
+        grades = Grades([{"Name": "test2", "Total Score": assignment_id}])
+        live_results.add(grades)
+        return grades
+
+    monkeypatch.setattr(app_module, "load_grades_async", load_grades_async)
+    all_ids = [(f"Lab {n}", str(n)) for n in range(50)]
+
+    async def read_slowly():
+        lines = []
+        async for line in app_module.stream_grades_as_ndjson("902165", all_ids):
+            lines.append(line)
+            # A slow client: the fetches have all finished by the time the next line is read.
+            await asyncio.sleep(0.001)
+            gc.collect()
+            assert len(live_results) <= app_module.MAX_CONCURRENT_GRADE_FETCHES
+            assert len(started) <= len(lines) + app_module.MAX_CONCURRENT_GRADE_FETCHES
+        return lines
+
+    lines = asyncio.run(read_slowly())
+    assert len(lines) == 50 and sorted(started, key=int) == [str(n) for n in range(50)]
+    assert all('"grades"' in line for line in lines)
@@ -0,0 +1,84 @@
+import threading
+import cache
+from cache import TTLCache, ResponseCache, etag_for, etag_matches
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_ttl_cache_expires_and_evicts(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    ttl_cache = TTLCache(ttl=10, max_entries=2)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    assert ttl_cache.get("a") == 1
+    ttl_cache.set("c", 3)
+    # "b" was the least recently used entry.
+    assert ttl_cache.get("b") is None and ttl_cache.get("a") == 1
+    clock.now += 11
+    assert ttl_cache.get("a") is None
+    assert ttl_cache.stats() == {"entries": 1, "hits": 2, "misses": 2}
+
+def test_ttl_cache_persists(tmp_path):
+    path = str(tmp_path / "cache.json")
+    TTLCache(ttl=60, persist_path=path).set("902165", {"labs": {}})
+    assert TTLCache(ttl=60, persist_path=path).get("902165") == {"labs": {}}
+    assert TTLCache(ttl=0, persist_path=path).get("902165") is None
+    (tmp_path / "cache.json").write_text("not json")
+    assert len(TTLCache(ttl=60, persist_path=path)) == 0
+
+def test_ttl_cache_invalidate():
+    ttl_cache = TTLCache(ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    assert ttl_cache.invalidate("a") == 1 and ttl_cache.invalidate("a") == 0
+    assert ttl_cache.invalidate() == 1 and len(ttl_cache) == 0
+
+def test_etags():
+    assert etag_for({"a": 1, "b": 2}) == etag_for({"b": 2, "a": 1}) != etag_for({"a": 2, "b": 2})
+    etag = etag_for([1])
+    assert etag_matches(etag, etag) and etag_matches(f'"x", W/{etag}', etag) and etag_matches("*", etag)
+    assert not etag_matches(None, etag) and not etag_matches('"x"', etag)
+
+def test_response_cache_serves_stale_while_revalidating(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    refreshed = threading.Event()
+    values = iter(["v1", "v2"])
+
+    def load():
+        value = next(values)
+        if value == "v2":
+            refreshed.set()
+        return value
+
+    response_cache = ResponseCache(ttl=10, stale_ttl=20)
+    first = response_cache.get("k", load)
+    assert first.value == "v1" and response_cache.get("k", load) is first
+    clock.now += 15
+    assert response_cache.get("k", load).value == "v1"
+    assert refreshed.wait(5)
+    while response_cache.refreshing:
+        threading.Event().wait(0.01)
+    assert response_cache.get("k", load).value == "v2"
+    assert response_cache.stats()["stale_hits"] == 1 and response_cache.stats()["refreshes"] == 1
+
+def test_response_cache_reloads_expired_entries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    values = iter(["v1", "v2"])
+    response_cache = ResponseCache(ttl=10, stale_ttl=5)
+    response_cache.get("k", lambda: next(values))
+    clock.now += 16
+    assert response_cache.get("k", lambda: next(values)).value == "v2"
+    assert response_cache.stats()["misses"] == 2
+
+def test_response_cache_does_not_store_errors():
+    response_cache = ResponseCache(ttl=60, cacheable=lambda value: "error" not in value)
+    entry = response_cache.get("k", lambda: {"error": "Gradescope Error"})
+    assert entry.etag is None and len(response_cache) == 0
+    assert response_cache.get("k", lambda: {"labs": {}}).etag == etag_for({"labs": {}})
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+from raw_data_cache import RawDataCache
+
+def test_refetched_unchanged_payload_is_fresh(tmp_path):
+    cache = RawDataCache(str(tmp_path))
+    first_fetch = datetime.now(timezone.utc) - timedelta(hours=2)
+    assert cache.write("902165", "gradescope", "5211665", "SID,Total Score\n1,10\n", "text/csv", fetched_at=first_fetch)
+    assert cache.read_latest("902165", "gradescope", "5211665", max_age=60) is None
+
+    # The same payload fetched again is not stored again, but counts as a recent fetch.
+    assert not cache.write("902165", "gradescope", "5211665", "SID,Total Score\n1,10\n", "text/csv")
+    cached = cache.read_latest("902165", "gradescope", "5211665", max_age=60)
+    assert cached is not None
+    assert cached["payload"] == b"SID,Total Score\n1,10\n"
+    assert cached["fetched_at"] == first_fetch
+    assert len(cache.versions("902165", "gradescope", "5211665")) == 1
+
+def test_changed_payload_is_stored(tmp_path):
+    cache = RawDataCache(str(tmp_path), keep_versions=2)
+    for score in range(3):
+        assert cache.write("902165", "gradescope", "5211665", f"SID,Total Score\n1,{score}\n", "text/csv")
+    assert len(cache.versions("902165", "gradescope", "5211665")) == 2
+    assert cache.read_latest("902165", "gradescope", "5211665", max_age=60)["payload"] == b"SID,Total Score\n1,2\n"
+
+def test_old_fetch_is_stale(tmp_path):
+    cache = RawDataCache(str(tmp_path))
+    cache.write("902165", "gradescope", "5211665", "a", "text/csv", fetched_at=datetime.now(timezone.utc) - timedelta(minutes=5))
+    assert cache.read_latest("902165", "gradescope", "5211665", max_age=60) is None
+    assert cache.read_latest("902165", "gradescope", "5211665")["payload"] == b"a"
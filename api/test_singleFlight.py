@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import pytest
+from singleFlight import SingleFlight, AsyncSingleFlight
+
+def test_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch(assignment_id):
+        calls.append(assignment_id)
+        started.set()
+        release.wait(5)
+        return f"scores of {assignment_id}"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("k", fetch, "1")))
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(single_flight.do("k", fetch, "1"))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while single_flight.stats()["coalesced"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert calls == ["1"] and results == ["scores of 1"] * 4
+    assert single_flight.stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+    # Once the call has finished, the next call for the key is made again.
+    assert single_flight.do("k", fetch, "2") == "scores of 2"
+
+def test_releases_the_key_after_an_exception():
+    def fail():
+        raise ValueError("boom")
+
+    single_flight = SingleFlight()
+    with pytest.raises(ValueError):
+        single_flight.do("k", fail)
+    assert single_flight.stats()["in_flight"] == 0
+    assert single_flight.do("k", lambda: "scores") == "scores"
+
+def test_async_coalesces_and_survives_cancellation():
+    async def main():
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "scores"
+
+        cancelled = asyncio.ensure_future(single_flight.do("k", fetch))
+        others = [asyncio.ensure_future(single_flight.do("k", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        results = await asyncio.gather(*others)
+        assert results == ["scores", "scores"] and calls == [1]
+        assert single_flight.stats() == {"executed": 1, "coalesced": 2, "in_flight": 0}
+
+    asyncio.run(main())
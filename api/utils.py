@@ -1,8 +1,10 @@
 import csv
 import io
+import inspect
 from fastapi import HTTPException
 from functools import wraps
 from requests.exceptions import RequestException
+from httpx import HTTPError as AsyncRequestException
 from dotenv import load_dotenv
 import os
 import re
@@ -10,6 +12,8 @@ import json
 from pydantic import BaseModel
 import logging
 import traceback
+from assignment_catalog import AssignmentCatalog, DEFAULT_RULES
+from metrics import ENDPOINT_ERRORS
 
 logging.basicConfig(level=logging.ERROR, format="%(asctime)s - %(levelname)s - %(message)s")
 load_dotenv()
@@ -29,6 +33,74 @@ def csv_to_json(csv_content: str):
     csv_reader = csv.DictReader(io.StringIO(csv_content))
     return [row for row in csv_reader]
 
+# Columns of a Gradescope scores CSV that hold numbers, besides the question columns, such as "1: Loops (1.0 pts)".
+SCORES_NUMERIC_COLUMNS = {"Total Score", "Max Points", "View Count", "Submission Count"}
+QUESTION_COLUMN_PATTERN = re.compile(r"\([\d.]+ pts\)$")
+
+# The shapes in which grades can be returned. See `convert_scores_csv`.
+GRADES_SHAPES = ["records", "typed", "columns"]
+
+
+def parse_number(value: str):
+    """
+    Converts a CSV value to a float, leaving values that are not numbers as they are.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def csv_to_columns(csv_content: str):
+    """
+    Parses a Gradescope scores CSV into typed columns, in one pass and without repeating the column names per row.
+    Score columns (see `SCORES_NUMERIC_COLUMNS` and `QUESTION_COLUMN_PATTERN`) become floats, and blank values
+    become `None`. Other columns, such as SIDs, are kept as strings.
+
+    Parameters:
+        csv_content (str): The raw CSV content as a string.
+
+    Returns:
+        dict: `{"columns": [column names], "rows": [[values of one student], ...]}`.
+    """
+    csv_reader = csv.reader(io.StringIO(csv_content))
+    columns = next(csv_reader, [])
+    numeric_indexes = [index for index, column in enumerate(columns)
+                       if column in SCORES_NUMERIC_COLUMNS or QUESTION_COLUMN_PATTERN.search(column)]
+    rows = []
+    for row in csv_reader:
+        if not row:
+            continue
+        row = [value or None for value in row]
+        for index in numeric_indexes:
+            if index < len(row) and row[index] is not None:
+                row[index] = parse_number(row[index])
+        rows.append(row)
+    return {"columns": columns, "rows": rows}
+
+
+def convert_scores_csv(csv_content: str, shape: str = "records"):
+    """
+    Converts a Gradescope scores CSV to one of the `GRADES_SHAPES`.
+
+    Parameters:
+        csv_content (str): The raw CSV content as a string.
+        shape (str): `records` (the default) is one dictionary of strings per student, as returned by `csv_to_json`.
+            `typed` is one dictionary per student with typed values, as parsed by `csv_to_columns`.
+            `columns` is the output of `csv_to_columns`, which is the most compact.
+
+    Returns:
+        list or dict: The grades in the requested shape.
+    """
+    if shape == "records":
+        return csv_to_json(csv_content)
+    table = csv_to_columns(csv_content)
+    if shape == "columns":
+        return table
+    columns = table["columns"]
+    return [dict(zip(columns, row)) for row in table["rows"]]
+
+
 def handle_errors(func):
     """
     Decorator to handle common exceptions in API endpoints.
@@ -61,37 +133,67 @@ def handle_errors(func):
         Apply this decorator to any FastAPI endpoint to handle errors consistently, without needing
         to duplicate error-handling logic across multiple endpoints.
     """
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                # Execute the wrapped coroutine
+                return await func(*args, **kwargs)
+            except Exception as e:
+                raise_http_exception_for(e)
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         try:
             # Execute the wrapped function
             return func(*args, **kwargs)
-        
-        except (ValueError, TypeError, AttributeError) as e:
-            # Handle client-side errors (400-level)
-            tb = traceback.format_exc()
-            logging.error(f"Client-side error: {e}\nTraceback:\n{tb}")
-            raise HTTPException(status_code=400, detail="Invalid request: missing or incorrect parameters.")
-        
-        except RequestException as e:
-            # Handle network-related errors (503-level)
-            tb = traceback.format_exc()
-            logging.error(f"Network error: {e}\nTraceback:\n{tb}")
-            raise HTTPException(status_code=503, detail="Service unavailable: network error while connecting to Gradescope.")
-        
         except Exception as e:
-            # Handle all other unexpected server-side errors (500-level)
-            tb = traceback.format_exc()
-            logging.error(f"Unexpected server error: {e}\nTraceback:\n{tb}")
-            raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+            raise_http_exception_for(e)
     return wrapper
 
+def raise_http_exception_for(e: Exception):
+    """
+    Logs an exception raised by an API endpoint and raises the matching `HTTPException`.
+    This is shared by the synchronous and asynchronous wrappers of `handle_errors`.
+    """
+    tb = traceback.format_exc()
+    if isinstance(e, (ValueError, TypeError, AttributeError)):
+        # Handle client-side errors (400-level)
+        logging.error(f"Client-side error: {e}\nTraceback:\n{tb}")
+        ENDPOINT_ERRORS.labels(type(e).__name__, "400").inc()
+        raise HTTPException(status_code=400, detail="Invalid request: missing or incorrect parameters.")
+    if isinstance(e, (RequestException, AsyncRequestException)):
+        # Handle network-related errors (503-level)
+        logging.error(f"Network error: {e}\nTraceback:\n{tb}")
+        ENDPOINT_ERRORS.labels(type(e).__name__, "503").inc()
+        raise HTTPException(status_code=503, detail="Service unavailable: network error while connecting to Gradescope.")
+    # Handle all other unexpected server-side errors (500-level)
+    logging.error(f"Unexpected server error: {e}\nTraceback:\n{tb}")
+    ENDPOINT_ERRORS.labels(type(e).__name__, "500").inc()
+    raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
 def gradescope_session(client):
     """
     A decorator to log in and log out to GradeScope.
     After `GRADESCOPE_TIMEOUT` seconds of inactivity, the client automatically logs out.
+    Coroutine endpoints are supported when `client` is an `AsyncGradescopeClient`.
     """
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    # Refresh the AsyncGradescopeClient inactivity period and log in again
+                    # if we were logged out automatically
+                    await client.log_in(GRADESCOPE_EMAIL, GRADESCOPE_PASSWORD)
+                    # Execute the decorated coroutine
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    return {"message": "Unknown error: " + str(e)}
+
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             try:
@@ -107,7 +209,29 @@ def gradescope_session(client):
     return decorator
 
 
-def convert_course_info_to_json(course_info_response: str):
+def pooled_gradescope_session(pool, key_argument: str = "class_id"):
+    """
+    A decorator that checks a logged-in Gradescope client out of a `GradescopeSessionPool` for the duration of
+    the decorated function. The pool key is the value of the function's `key_argument` argument, so each course
+    gets its own sessions. Inside the function, use `get_current_client()` to reach the checked-out client.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                bound_arguments = signature.bind_partial(*args, **kwargs).arguments
+                with pool.session(str(bound_arguments.get(key_argument))):
+                    # Execute the decorated function
+                    return func(*args, **kwargs)
+            except Exception as e:
+                return {"message": "Unknown error: " + str(e)}
+
+        return wrapper
+    return decorator
+
+def convert_course_info_to_json(course_info_response, rules: list = DEFAULT_RULES):
     """
     Parses course assignment information from a JSON-formatted string and categorizes assignments into
     structured dictionaries based on assignment types such as lecture quizzes, labs, discussions, etc.
@@ -129,13 +253,16 @@ def convert_course_info_to_json(course_info_response: str):
     - Other categories can be added to the structure as needed.
 
     Parameters:
-    - course_info_response (str): A JSON-formatted string containing assignment details, including 
-      unique "id" and "title" fields for each assignment.
+    - course_info_response (bytes or str): The Gradescope assignments page, which embeds assignment details,
+      including unique "id" and "title" fields for each assignment.
+    - rules (list, optional): The compiled category rules (see `assignment_catalog.compile_rules`).
+      Defaults to `assignment_catalog.DEFAULT_CATEGORY_RULES`.
 
     Returns:
     - dict: A dictionary with categorized assignments. Each category is structured as a dictionary
       where keys are assignment identifiers (or subcategories), and values are dictionaries 
-      containing "title" and "assignment_id".
+      containing "title" and "assignment_id". Titles are normalized as in earlier versions, without decoding
+      escapes: "Lab 1 & 2" is returned as "Lab 1 u0026 2". Numeric keys have no leading zeros ("Lab 01" is "1").
 
     Example Output:
     {
@@ -156,83 +283,7 @@ def convert_course_info_to_json(course_info_response: str):
         }
     }
     """
-    pattern = '{"id":[0-9]+,"title":"[^}"]+?"}'
-    info_for_all_assignments = re.findall(pattern, course_info_response)
-    assignment_to_categories = {
-        "lecture_quizzes": {},
-        "labs": {},
-        "discussions": {},
-        "midterms": {},
-        "projects": {},
-        "other": {}
-    }
-
-    for assignment in info_for_all_assignments:
-        assignment_as_json = json.loads(assignment)
-        assignment_id = str(assignment_as_json["id"])
-        title = assignment_as_json["title"]
-
-        # Categorize based on assignment title
-        if "Lecture Quiz" in title:
-            quiz_number = re.search(r'\d+', title)
-            if quiz_number:
-                key = quiz_number.group()
-                assignment_to_categories["lecture_quizzes"][key] = {
-                    "title": title,
-                    "assignment_id": assignment_id
-                }
-        elif "Discussion" in title:
-            discussion_number = re.search(r'\d+', title)
-            if discussion_number:
-                key = discussion_number.group()
-                assignment_to_categories["discussions"][key] = {
-                    "title": title,
-                    "assignment_id": assignment_id
-                }
-        elif "Midterm" in title or "Practice Midterm" in title:
-            midterm_key = len(assignment_to_categories["midterms"]) + 1
-            assignment_to_categories["midterms"][str(midterm_key)] = {
-                "title": title,
-                "assignment_id": assignment_id
-            }
-        elif "Project" in title:
-            project_number = re.search(r'\d+', title)
-            if project_number:
-                key = project_number.group()
-                assignment_to_categories["projects"][key] = {
-                    "title": title,
-                    "assignment_id": assignment_id
-                }
-        elif "Lab" in title:
-            lab_number = re.search(r'\d+', title)
-            if lab_number:
-                key = lab_number.group()
-                if key not in assignment_to_categories["labs"]:
-                    assignment_to_categories["labs"][key] = {}
-                if "Conceptual" in title:
-                    assignment_to_categories["labs"][key]["conceptual"] = {
-                        "title": title,
-                        "assignment_id": assignment_id
-                    }
-                elif "Code" in title:
-                    assignment_to_categories["labs"][key]["code"] = {
-                        "title": title,
-                        "assignment_id": assignment_id
-                    }
-                else:
-                    assignment_to_categories["labs"][key] = {
-                        "title": title,
-                        "assignment_id": assignment_id
-                    }
-        else:
-            assignment_to_categories["other"][assignment_id] = title
-
-    # Sort categories with numbers by extracting numbers
-    for category in ["lecture_quizzes", "labs", "projects", "discussions", "midterms"]:
-        sorted_items = dict(sorted(assignment_to_categories[category].items(), key=lambda item: int(item[0])))
-        assignment_to_categories[category] = sorted_items
-
-    return assignment_to_categories
+    return AssignmentCatalog.from_page(course_info_response, rules).to_json()
 
 def extract_assignment_ids(sub_dict: dict):
     """
@@ -0,0 +1,209 @@
+#!/usr/local/bin/python
+"""
+Records the Gradescope and PrairieLearn responses the sync scripts and the API read for one course, so that
+run_end_to_end.py can replay them with `--fixtures` instead of synthetic courses. The files are written in the layout
+RecordedCourse in upstream_stubs.py reads.
+
+Student names, emails, SIDs and UINs are replaced with pseudonyms unless `--keep-identities` is given. The same
+student gets the same pseudonym in every file, so Gradescope scores and PrairieLearn results still line up.
+Recordings hold grades: do not commit them.
+
+Reads GRADESCOPE_EMAIL, GRADESCOPE_PASSWORD and PL_API_TOKEN from the environment or a .env file, as the sync scripts do.
+
+Usage (from the repository root):
+    python benchmarks/record_fixtures.py --output recorded_course/ [--gradescope-course 123456] [--pl-course 654321]
+        [--max-assignments 20] [--max-assessments 5]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import requests
+from dotenv import load_dotenv
+from fullGSapi.api import client as GradescopeClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gradescope"))
+from assignment_catalog import extract_assignments
+
+GRADESCOPE_BASE_URL = os.getenv("GRADESCOPE_BASE_URL", "https://www.gradescope.com").rstrip("/")
+PL_SERVER = os.getenv("PL_SERVER", "https://us.prairielearn.com/pl/api/v1")
+# Columns of the Gradescope scores csv, and keys of PrairieLearn responses, that identify a student.
+GRADESCOPE_IDENTITY_COLUMNS = {"First Name": "first_name", "Last Name": "last_name", "SID": "sid", "Email": "email"}
+PL_IDENTITY_KEYS = {"user_name": "name", "user_uid": "email", "user_uin": "sid"}
+
+
+class Anonymizer:
+    """
+    Replaces identities with pseudonyms that are stable within one recording: the same value of the same kind
+    always gets the same pseudonym.
+    """
+
+    PSEUDONYMS = {
+        "first_name": lambda n: "Student",
+        "last_name": lambda n: str(n),
+        "name": lambda n: f"Student {n}",
+        "email": lambda n: f"student{n}@example.edu",
+        "sid": lambda n: str(30000000 + n),
+    }
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.seen = {kind: {} for kind in self.PSEUDONYMS}
+
+    def replace(self, kind, value):
+        if not self.enabled or value in (None, ""):
+            return value
+        key = str(value).strip().lower()
+        seen = self.seen[kind]
+        if key not in seen:
+            seen[key] = self.PSEUDONYMS[kind](len(seen) + 1)
+        return seen[key]
+
+    def scores_csv(self, content):
+        """
+        Returns a Gradescope scores csv with the identity columns replaced.
+        """
+        if not self.enabled:
+            return content
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8"))))
+        if not rows:
+            return content
+        kinds = {index: GRADESCOPE_IDENTITY_COLUMNS.get(column) for index, column in enumerate(rows[0])}
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator="\n")
+        writer.writerow(rows[0])
+        for row in rows[1:]:
+            writer.writerow([self.replace(kinds[index], value) if kinds.get(index) else value
+                             for index, value in enumerate(row)])
+        return output.getvalue().encode("utf-8")
+
+    def pl_response(self, data):
+        """
+        Returns a PrairieLearn response with the identity keys replaced, at any depth.
+        """
+        if not self.enabled:
+            return data
+        if isinstance(data, list):
+            return [self.pl_response(item) for item in data]
+        if isinstance(data, dict):
+            return {key: self.replace(PL_IDENTITY_KEYS[key], value) if key in PL_IDENTITY_KEYS else self.pl_response(value)
+                    for key, value in data.items()}
+        return data
+
+
+def write_fixture(directory, path, content):
+    path = os.path.join(directory, *path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fixture:
+        fixture.write(content)
+
+
+def record_gradescope(directory, course_id, anonymizer, max_assignments):
+    """
+    Records the assignments page of a Gradescope course and the scores csv of its assignments.
+
+    Args:
+        directory (String): The folder of the recording.
+        course_id (String): The Gradescope course ID.
+        anonymizer (Anonymizer): Replaces the identities in the scores.
+        max_assignments (int): Records the scores of at most this many assignments, in page order (0 for all).
+    Returns:
+        int: The number of scores csvs recorded.
+    """
+    gradescope_client = GradescopeClient.GradescopeClient()
+    gradescope_client.base_url = GRADESCOPE_BASE_URL
+    gradescope_client.log_in(os.getenv("GRADESCOPE_EMAIL"), os.getenv("GRADESCOPE_PASSWORD"))
+    page = gradescope_client.session.get(f"{GRADESCOPE_BASE_URL}/courses/{course_id}/assignments")
+    page.raise_for_status()
+    write_fixture(directory, ["gradescope", "assignments.html"], page.content)
+
+    assignment_ids = [assignment_id for assignment_id, *_ in extract_assignments(page.content)]
+    if max_assignments:
+        assignment_ids = assignment_ids[:max_assignments]
+    recorded = 0
+    for assignment_id in assignment_ids:
+        scores = gradescope_client.session.get(
+            f"{GRADESCOPE_BASE_URL}/courses/{course_id}/assignments/{assignment_id}/scores.csv")
+        if scores.status_code != 200:
+            print(f"Skipping assignment {assignment_id}: {scores.status_code}", file=sys.stderr)
+            continue
+        write_fixture(directory, ["gradescope", "scores", f"{assignment_id}.csv"], anonymizer.scores_csv(scores.content))
+        recorded += 1
+    return recorded
+
+
+def record_prairielearn(directory, course_id, anonymizer, max_assessments):
+    """
+    Records the gradebook and assessments of a PrairieLearn course instance, and the assessment instances and
+    instance questions of its assessments.
+
+    Args:
+        directory (String): The folder of the recording.
+        course_id (String): The PrairieLearn course instance ID.
+        anonymizer (Anonymizer): Replaces the identities in the responses.
+        max_assessments (int): Records the instances of at most this many assessments (0 for all).
+    Returns:
+        int: The number of assessment instances recorded.
+    """
+    session = requests.Session()
+    session.headers["Private-Token"] = os.getenv("PL_API_TOKEN", "")
+
+    def get(endpoint):
+        response = session.get(f"{PL_SERVER}/course_instances/{course_id}{endpoint}", timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def write(path, data):
+        write_fixture(directory, ["prairielearn", *path], json.dumps(anonymizer.pl_response(data)).encode("utf-8"))
+
+    gradebook = get("/gradebook")
+    assessments = get("/assessments")
+    if max_assessments:
+        # Only the recorded assessments are listed, so that the sync script does not request the others.
+        assessments = assessments[:max_assessments]
+        recorded_ids = {assessment["assessment_id"] for assessment in assessments}
+        for student in gradebook:
+            student["assessments"] = [assessment for assessment in student.get("assessments", [])
+                                      if assessment.get("assessment_id") in recorded_ids]
+    write(["gradebook.json"], gradebook)
+    write(["assessments.json"], assessments)
+    recorded = 0
+    for assessment in assessments:
+        instances = get(f"/assessments/{assessment['assessment_id']}/assessment_instances")
+        write(["assessment_instances", f"{assessment['assessment_id']}.json"], instances)
+        for instance in instances:
+            instance_id = instance["assessment_instance_id"]
+            write(["instance_questions", f"{instance_id}.json"], get(f"/assessment_instances/{instance_id}/instance_questions"))
+            recorded += 1
+    return recorded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="The folder to write the recording to.")
+    parser.add_argument("--gradescope-course", help="The Gradescope course ID. Gradescope is skipped without one.")
+    parser.add_argument("--pl-course", help="The PrairieLearn course instance ID. PrairieLearn is skipped without one.")
+    parser.add_argument("--max-assignments", type=int, default=0, help="Record at most this many scores csvs.")
+    parser.add_argument("--max-assessments", type=int, default=0,
+                        help="Record the instances of at most this many assessments.")
+    parser.add_argument("--keep-identities", action="store_true", help="Do not replace student identities.")
+    args = parser.parse_args()
+    if not args.gradescope_course and not args.pl_course:
+        parser.error("give --gradescope-course, --pl-course or both")
+
+    load_dotenv()
+    anonymizer = Anonymizer(enabled=not args.keep_identities)
+    if args.gradescope_course:
+        recorded = record_gradescope(args.output, args.gradescope_course, anonymizer, args.max_assignments)
+        print(f"Recorded the assignments page and {recorded} scores csvs of Gradescope course {args.gradescope_course}")
+    if args.pl_course:
+        recorded = record_prairielearn(args.output, args.pl_course, anonymizer, args.max_assessments)
+        print(f"Recorded {recorded} assessment instances of PrairieLearn course instance {args.pl_course}")
+
+
+if __name__ == "__main__":
+    main()
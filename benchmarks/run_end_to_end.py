@@ -0,0 +1,471 @@
+#!/usr/local/bin/python
+"""
+Runs the Gradescope and PrairieLearn sync scripts and the API end to end against the stand-in servers of
+upstream_stubs.py, for courses of several sizes, and reports their throughput, latency percentiles and peak memory.
+No credentials or network access are needed.
+
+Each sync script runs in a copy of its folder, with a config file pointing at the stand-in course, so that the sync
+state and caches it writes stay out of the repository. Its first run starts from an empty copy ("cold"); each later
+run ("warm") reuses the copy after `--churn` of the grades changed, as the next run of the cron job would.
+The API runs under uvicorn in a copy of its folder, and each endpoint is requested `--requests` times by
+`--concurrency` clients, in the order of API_SCENARIOS, so later endpoints find the caches filled by earlier ones.
+
+Usage (from the repository root):
+    python benchmarks/run_end_to_end.py [--students 50,500,5000] [--targets gradescope,prairielearn,api] [--runs 2]
+        [--latency gradescope=0.2] [--error-rate sheets=0.05] [--set MAX_CONCURRENT_DOWNLOADS=16] [--output results.json]
+    python benchmarks/run_end_to_end.py --fixtures recorded_course/ [...]
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from upstream_stubs import (DEFAULT_ERROR_STATUSES, FakeSpreadsheet, Faults, GradescopeStub, PrairieLearnStub,
+                            RecordedCourse, SheetsStub, SyntheticCourse, fake_service_account_info)
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The folder and script of each sync.
+SYNC_SCRIPTS = {
+    "gradescope": ("gradescope", "gradescope_to_spreadsheet.py"),
+    "prairielearn": ("prairieLearn", "pl_to_spreadsheet.py"),
+}
+API_FOLDER = "api"
+TARGETS = list(SYNC_SCRIPTS) + ["api"]
+UPSTREAMS = ["gradescope", "prairielearn", "sheets"]
+# Left out of the copies: credentials, and the state and caches written by earlier runs.
+IGNORED_FILES = shutil.ignore_patterns(".env", "__pycache__", "raw_data", "sync_state", "cache", "benchmarks")
+# The IDs written to the config files. The stand-in servers answer for any course and spreadsheet.
+GRADESCOPE_COURSE_ID = "100000"
+PL_COURSE_ID = "200000"
+SPREADSHEET_ID = "benchmark-spreadsheet"
+# The JSON summary logged by sync_metrics.py at the end of every run.
+SYNC_METRICS_LINE = re.compile(r"Sync metrics: (\{.*\})")
+
+# Each scenario: (name, path, share of --requests). {assignment_id} cycles through the assignments of the course.
+# The heavy endpoints return every grade of the course, so they are requested less.
+API_SCENARIOS = [
+    ("getGrades", "/getGrades?class_id={class_id}&assignment_id={assignment_id}", 1),
+    ("getGrades shape=columns", "/getGrades?class_id={class_id}&assignment_id={assignment_id}&shape=columns", 1),
+    ("async/getGrades", "/async/getGrades?class_id={class_id}&assignment_id={assignment_id}", 1),
+    ("getAssignmentJSON", "/getAssignmentJSON?class_id={class_id}", 1),
+    ("async/getAssignmentJSON", "/async/getAssignmentJSON?class_id={class_id}", 1),
+    ("fetchAllGrades", "/fetchAllGrades?class_id={class_id}", 0.05),
+    ("fetchAllGrades stream=true", "/fetchAllGrades?class_id={class_id}&stream=true", 0.05),
+    ("async/fetchAllGrades", "/async/fetchAllGrades?class_id={class_id}", 0.05),
+    ("getPLGrades", "/getPLGrades", 0.25),
+]
+
+
+def parse_upstream_values(values, convert, default):
+    """
+    Parses `--latency gradescope=0.2`-style arguments into a dict with a value for every upstream.
+    "all=..." sets every upstream.
+    """
+    parsed = {upstream: default for upstream in UPSTREAMS}
+    for value in values or []:
+        upstream, _, number = value.partition("=")
+        if upstream != "all" and upstream not in UPSTREAMS:
+            raise SystemExit(f"Unknown upstream {upstream!r}; expected one of {', '.join(UPSTREAMS)} or all")
+        for name in UPSTREAMS if upstream == "all" else [upstream]:
+            parsed[name] = convert(number)
+    return parsed
+
+
+def parse_config_overrides(values):
+    """
+    Parses `--set KEY=VALUE` arguments. Values are JSON, or strings if they are not valid JSON.
+    """
+    overrides = {}
+    for value in values or []:
+        key, _, raw = value.partition("=")
+        try:
+            overrides[key] = json.loads(raw)
+        except ValueError:
+            overrides[key] = raw
+    return overrides
+
+
+def percentile(sorted_values, percent):
+    """
+    Returns the nearest-rank percentile of a sorted list, or None if it is empty.
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(percent / 100 * len(sorted_values)) - 1))]
+
+
+def peak_rss_megabytes(usage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def wait_measured(process, timeout=None):
+    """
+    Waits for a child process and returns its resource usage, so that its peak memory can be read.
+    Kills it if it has not exited after `timeout` seconds.
+    """
+    deadline = timeout and time.monotonic() + timeout
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG if deadline else 0)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return usage
+        if time.monotonic() > deadline:
+            process.kill()
+            deadline = None
+        time.sleep(0.05)
+
+
+def stats_difference(before, after):
+    """
+    Returns the counts of each route of a stand-in server between two snapshots.
+    """
+    return {route: {name: value - before.get(route, {}).get(name, 0) for name, value in stats.items()}
+            for route, stats in after.items() if stats["requests"] != before.get(route, {}).get("requests", 0)}
+
+
+def copy_folder(folder, workdir):
+    destination = os.path.join(workdir, folder)
+    if not os.path.exists(destination):
+        shutil.copytree(os.path.join(REPOSITORY, folder), destination, ignore=IGNORED_FILES)
+    return destination
+
+
+def write_config(config_path, overrides):
+    """
+    Updates the config file at `config_path` (the copy of the one the code reads) with `overrides`.
+    """
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path) as config_file:
+            config = json.load(config_file)
+    config.update(overrides)
+    os.makedirs(os.path.dirname(config_path), exist_ok=True)
+    with open(config_path, "w") as config_file:
+        json.dump(config, config_file, indent=2)
+
+
+def config_path_of(folder, source_file, pattern, config_folder=""):
+    """
+    Returns the path of the config file a script or app reads: the first group of `pattern` in its source,
+    in `config_folder`.
+    """
+    with open(os.path.join(folder, source_file)) as source:
+        match = re.search(pattern, source.read())
+    if not match:
+        raise SystemExit(f"Could not find the config file read by {source_file}")
+    return os.path.join(folder, config_folder, match.group(1))
+
+
+class Upstreams:
+    """
+    The stand-in servers for one course, and the environment that points the code at them.
+    """
+
+    def __init__(self, course, faults):
+        spreadsheet = FakeSpreadsheet(course.roster_sids())
+        self.servers = {
+            "gradescope": GradescopeStub(course, faults["gradescope"]).start(),
+            "prairielearn": PrairieLearnStub(course, faults["prairielearn"]).start(),
+            "sheets": SheetsStub(spreadsheet, faults["sheets"]).start(),
+        }
+        credentials = fake_service_account_info(self.servers["sheets"].url + "/token")
+        self.environment = dict(os.environ)
+        self.environment.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        self.environment.update({
+            "GRADESCOPE_EMAIL": "benchmark@berkeley.edu",
+            "GRADESCOPE_PASSWORD": "benchmark",
+            "PL_API_TOKEN": "benchmark",
+            "SERVICE_ACCOUNT_CREDENTIALS": json.dumps(credentials),
+            "GRADESCOPE_BASE_URL": self.servers["gradescope"].url,
+            "PL_SERVER": self.servers["prairielearn"].api_url,
+            "SHEETS_API_ENDPOINT": self.servers["sheets"].url,
+            "NO_PROXY": "127.0.0.1,localhost",
+            "no_proxy": "127.0.0.1,localhost",
+            "PYTHONUNBUFFERED": "1",
+        })
+
+    def snapshot(self):
+        return {name: server.snapshot() for name, server in self.servers.items()}
+
+    def requests_since(self, before):
+        after = self.snapshot()
+        return {name: stats_difference(before[name], after[name]) for name in self.servers}
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+
+
+def make_faults(args):
+    latencies = parse_upstream_values(args.latency, float, 0.0)
+    error_rates = parse_upstream_values(args.error_rate, float, 0.0)
+    error_statuses = parse_upstream_values(args.error_status, int, None)
+    return {upstream: Faults(latency=latencies[upstream], jitter=args.jitter, error_rate=error_rates[upstream],
+                             error_status=error_statuses[upstream] or DEFAULT_ERROR_STATUSES[upstream], seed=args.seed)
+            for upstream in UPSTREAMS}
+
+
+def benchmark_sync(target, course, args, workdir, log):
+    """
+    Runs one sync script `args.runs` times against fresh stand-in servers, and returns the result of each run.
+    """
+    folder_name, script = SYNC_SCRIPTS[target]
+    folder = copy_folder(folder_name, workdir)
+    roster = course.roster_sids()
+    write_config(config_path_of(folder, script, r"class_json_name = '([^']+)'", "config"), {
+        "GRADESCOPE_COURSE_ID": GRADESCOPE_COURSE_ID,
+        "PL_COURSE_ID": PL_COURSE_ID,
+        "SPREADSHEET_ID": SPREADSHEET_ID,
+        "NUMBER_OF_STUDENTS": len(roster),
+        # The stand-in servers are not rate limited. Set PL_MAX_REQUESTS_PER_SECOND with --set to include the limiter.
+        "PL_MAX_REQUESTS_PER_SECOND": 0,
+        **args.config_overrides,
+    })
+    upstreams = Upstreams(course, args.faults)
+    results = []
+    try:
+        for run in range(1, args.runs + 1):
+            if run > 1:
+                course.churn(args.churn, seed=run)
+                course.generate()
+            before = upstreams.snapshot()
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, script], cwd=folder, env=upstreams.environment,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            output = process.stdout.read()
+            process.stdout.close()
+            usage = wait_measured(process)
+            wall_seconds = time.perf_counter() - start
+            metrics_lines = SYNC_METRICS_LINE.findall(output)
+            metrics = json.loads(metrics_lines[-1]) if metrics_lines else {}
+            counters = metrics.get("counters", {})
+            items = (counters.get("assignments", 0) * len(roster) if target == "gradescope"
+                     else counters.get("instances", 0))
+            sync_seconds = metrics.get("duration_seconds")
+            result = {
+                "target": target,
+                "students": len(roster),
+                "run": run,
+                "kind": "cold" if run == 1 else "warm",
+                "status": metrics.get("status", "failure") if process.returncode == 0 else "failure",
+                "exit_code": process.returncode,
+                "wall_seconds": round(wall_seconds, 3),
+                "sync_seconds": sync_seconds,
+                "items": items,
+                "items_per_second": round(items / sync_seconds, 1) if sync_seconds else None,
+                "peak_rss_mb": peak_rss_megabytes(usage),
+                "stages": metrics.get("stages", {}),
+                "counters": counters,
+                "upstream_requests": upstreams.requests_since(before),
+            }
+            results.append(result)
+            log(f"{target:<13} {len(roster):>6} students  run {run} ({result['kind']}): {result['status']} "
+                f"in {wall_seconds:.2f} s, peak {result['peak_rss_mb']} MB")
+            if result["status"] != "success":
+                log("\n".join(output.splitlines()[-20:]))
+    finally:
+        upstreams.stop()
+    return results
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def load_test(base_url, paths, concurrency):
+    """
+    Requests every path, `concurrency` at a time, and returns the throughput, latency percentiles and statuses.
+    """
+    latencies = []
+    statuses = {}
+    received = [0]
+    lock = threading.Lock()
+    local = threading.local()
+
+    def fetch(path):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = local.session.get(base_url + path, timeout=600)
+            status, size = str(response.status_code), len(response.content)
+        except requests.RequestException as error:
+            status, size = type(error).__name__, 0
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            received[0] += size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch, paths))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    milliseconds = lambda value: value and round(value * 1000, 1)
+    return {
+        "requests": len(paths),
+        "seconds": round(seconds, 3),
+        "requests_per_second": float(f"{len(paths) / seconds:.3g}"),
+        "p50_ms": milliseconds(percentile(latencies, 50)),
+        "p90_ms": milliseconds(percentile(latencies, 90)),
+        "p99_ms": milliseconds(percentile(latencies, 99)),
+        "max_ms": milliseconds(latencies[-1] if latencies else None),
+        "statuses": statuses,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith(("2", "3"))),
+        "megabytes_received": round(received[0] / 1e6, 2),
+    }
+
+
+def benchmark_api(course, args, workdir, log):
+    """
+    Starts the API under uvicorn against fresh stand-in servers, load tests each endpoint of API_SCENARIOS,
+    and returns the results and the peak memory of the server.
+    """
+    folder = copy_folder(API_FOLDER, workdir)
+    roster = course.roster_sids()
+    write_config(config_path_of(folder, "app.py", r'config_path = os\.path\.join\(os\.path\.dirname\(__file__\), "([^"]+)"\)'), {
+        "GRADESCOPE_COURSE_ID": GRADESCOPE_COURSE_ID,
+        "PL_COURSE_ID": PL_COURSE_ID,
+        **args.config_overrides,
+    })
+    upstreams = Upstreams(course, args.faults)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server_log = open(os.path.join(folder, "uvicorn.log"), "w")
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                                "--workers", str(args.api_workers), "--log-level", "warning"],
+                               cwd=folder, env=upstreams.environment, stdout=server_log, stderr=subprocess.STDOUT)
+    scenarios = {}
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"The API exited with status {process.returncode}; see {server_log.name}")
+            try:
+                requests.get(base_url + "/", timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"The API did not start within 60 seconds; see {server_log.name}")
+                time.sleep(0.2)
+        assignment_ids = course.assignment_ids()
+        for name, path, share in API_SCENARIOS:
+            count = max(1, round(args.requests * share))
+            paths = [path.format(class_id=GRADESCOPE_COURSE_ID, assignment_id=assignment_ids[index % len(assignment_ids)])
+                     for index in range(count)]
+            before = upstreams.snapshot()
+            scenarios[name] = {**load_test(base_url, paths, args.concurrency), "upstream_requests": upstreams.requests_since(before)}
+            log(f"api           {len(roster):>6} students  {name}: {scenarios[name]['requests_per_second']} requests/s, "
+                f"p50 {scenarios[name]['p50_ms']} ms, p99 {scenarios[name]['p99_ms']} ms, {scenarios[name]['errors']} errors")
+    finally:
+        process.send_signal(signal.SIGINT)
+        usage = wait_measured(process, timeout=15)
+        server_log.close()
+        upstreams.stop()
+    return {"target": "api", "students": len(roster), "workers": args.api_workers, "concurrency": args.concurrency,
+            "peak_rss_mb": peak_rss_megabytes(usage), "scenarios": scenarios}
+
+
+def print_summary(results):
+    sync_results = [result for result in results if result["target"] in SYNC_SCRIPTS]
+    if sync_results:
+        print("\nSync scripts (items are score rows for Gradescope and assessment instances for PrairieLearn)")
+        print(f"{'target':<13} {'students':>8} {'run':<7} {'status':<8} {'wall s':>8} {'sync s':>8} {'items/s':>10} "
+              f"{'peak MB':>8}  upstream requests")
+        for result in sync_results:
+            upstream_requests = ", ".join(
+                f"{name} {sum(stats['requests'] for stats in routes.values())}"
+                for name, routes in result["upstream_requests"].items() if routes)
+            print(f"{result['target']:<13} {result['students']:>8} {result['kind']:<7} {result['status']:<8} "
+                  f"{result['wall_seconds']:>8} {result['sync_seconds'] or '-':>8} {result['items_per_second'] or '-':>10} "
+                  f"{result['peak_rss_mb']:>8}  {upstream_requests}")
+    for result in results:
+        if result["target"] != "api":
+            continue
+        print(f"\nAPI with {result['students']} students ({result['workers']} worker(s), {result['concurrency']} clients, "
+              f"peak {result['peak_rss_mb']} MB)")
+        print(f"{'endpoint':<28} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+              f"{'errors':>7} {'MB':>8}")
+        for name, scenario in result["scenarios"].items():
+            print(f"{name:<28} {scenario['requests']:>8} {scenario['requests_per_second']:>8} {scenario['p50_ms']:>8} "
+                  f"{scenario['p90_ms']:>8} {scenario['p99_ms']:>8} {scenario['max_ms']:>8} {scenario['errors']:>7} "
+                  f"{scenario['megabytes_received']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", default="50,500,5000", help="Comma-separated course sizes. Default: 50,500,5000.")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"Comma-separated, among {', '.join(TARGETS)}.")
+    parser.add_argument("--fixtures", help="A course recorded with record_fixtures.py, replayed instead of synthetic courses.")
+    parser.add_argument("--assignments", type=int, default=60, help="Gradescope assignments of a synthetic course.")
+    parser.add_argument("--assessments", type=int, default=10, help="PrairieLearn assessments of a synthetic course.")
+    parser.add_argument("--questions", type=int, default=5, help="Questions of each PrairieLearn assessment.")
+    parser.add_argument("--runs", type=int, default=2, help="Runs of each sync script: one cold, the rest warm.")
+    parser.add_argument("--churn", type=float, default=0.1, help="Share of the grades changed before each warm run.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests to each API endpoint, before its share.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent API clients.")
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn workers. Peak memory is the main process's.")
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=SECONDS",
+                        help="Latency added to each response of gradescope, prairielearn, sheets or all. Repeatable.")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Latency varies by up to this share. Default: 0.25.")
+    parser.add_argument("--error-rate", action="append", metavar="UPSTREAM=RATE",
+                        help="Share of the responses of an upstream that fail. Repeatable.")
+    parser.add_argument("--error-status", action="append", metavar="UPSTREAM=STATUS",
+                        help=f"Status of the failed responses. Defaults: {DEFAULT_ERROR_STATUSES}.")
+    parser.add_argument("--set", dest="config_overrides", action="append", metavar="KEY=VALUE",
+                        help="A config key set in every config file, such as MAX_CONCURRENT_DOWNLOADS=16. Repeatable.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Where to copy the folders. Defaults to a temporary folder, deleted afterwards.")
+    parser.add_argument("--output", help="A file to write every result to, as JSON.")
+    args = parser.parse_args()
+    args.faults = make_faults(args)
+    args.config_overrides = parse_config_overrides(args.config_overrides)
+    targets = [target for target in args.targets.split(",") if target]
+    unknown_targets = set(targets) - set(TARGETS)
+    if unknown_targets:
+        raise SystemExit(f"Unknown targets: {', '.join(sorted(unknown_targets))}")
+    sizes = [None] if args.fixtures else [int(size) for size in args.students.split(",")]
+    log = lambda message: print(message, file=sys.stderr, flush=True)
+
+    results = []
+    for students in sizes:
+        if args.fixtures:
+            course = RecordedCourse(args.fixtures)
+        else:
+            course = SyntheticCourse(students, args.assignments, args.assessments, args.questions, seed=args.seed)
+        course.generate()
+        workdir = args.workdir and os.path.join(args.workdir, f"{len(course.roster_sids())}_students")
+        with tempfile.TemporaryDirectory(prefix="gradesync-benchmark-") as temporary_workdir:
+            workdir = workdir or temporary_workdir
+            for target in targets:
+                if target == "api":
+                    results.append(benchmark_api(course, args, workdir, log))
+                else:
+                    results += benchmark_sync(target, course, args, workdir, log)
+
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,768 @@
+"""
+Stand-in servers for Gradescope, PrairieLearn and the Google Sheets API, so that the sync scripts and the API can be
+run and measured without credentials or network access. Each server listens on 127.0.0.1 and replays the responses
+of a course: either a synthetic course of any size (`SyntheticCourse`), or responses recorded from the real services
+with record_fixtures.py (`RecordedCourse`). Every server can add latency to its responses and fail a share of them,
+and counts the requests it serves.
+
+Point the code at the servers with these environment variables:
+- GRADESCOPE_BASE_URL: `GradescopeStub.url`
+- PL_SERVER: `PrairieLearnStub.api_url`
+- SHEETS_API_ENDPOINT: `SheetsStub.url`, with service account credentials from `fake_service_account_info`, whose
+  token_uri points at the same server.
+"""
+
+import csv
+import io
+import json
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# The columns of a Gradescope scores CSV, before the question columns. The sync script reads the SID (column C),
+# the total score (column F) and the status (column H).
+SCORES_CSV_COLUMNS = ["First Name", "Last Name", "SID", "Email", "Sections", "Total Score", "Max Points", "Status",
+                      "Submission ID", "Submission Time", "Lateness (H:M:S)", "View Count", "Submission Count"]
+# The subsheets of the gradebook, each with the SID of the student in each row in column C.
+GRADEBOOK_CATEGORIES = ["Labs", "Discussions", "Projects", "Lecture Quizzes", "Midterms", "Postterms"]
+# Statuses returned by injected errors, by default. The Sheets API fails with 429 when a quota is exceeded.
+DEFAULT_ERROR_STATUSES = {"gradescope": 503, "prairielearn": 503, "sheets": 429}
+# Where a session cookie is set by the Gradescope stand-in.
+GRADESCOPE_SESSION_COOKIE = "_gradescope_session"
+
+
+def make_assignment_titles(count):
+    """
+    Returns `count` assignment titles in the pattern of a CS10 semester: each week has a lab in two parts, a discussion
+    and a lecture quiz, with a project every 4 weeks, a midterm every 6 weeks and a postterm every 12 weeks.
+    """
+    titles = []
+    week = 0
+    while len(titles) < count:
+        week += 1
+        titles += [f"Lab {week}: Exercises (Code)", f"Lab {week}: Exercises (Conceptual)",
+                   f"Discussion {week}: Worksheet", f"Lecture Quiz {week}: Topic {week}"]
+        if week % 4 == 0:
+            titles.append(f"Project {week // 4}: Build")
+        if week % 6 == 0:
+            titles.append(f"Midterm {week // 6}")
+        if week % 12 == 0:
+            titles.append(f"Postterm {week // 12}")
+    return titles[:count]
+
+
+def make_assignments_page(assignments):
+    """
+    Builds a page shaped like Gradescope's assignments page: HTML around a JavaScript string holding the assignments
+    as escaped JSON.
+
+    Args:
+        assignments (list): (assignment ID, title) tuples.
+    Returns:
+        bytes: The page.
+    """
+    rows = "".join(f"<tr><td>{title}</td></tr>\n" for _, title in assignments)
+    table_data = [{"assignment": {"id": int(assignment_id), "title": title}, "submissions": 0}
+                  for assignment_id, title in assignments]
+    props = json.dumps(json.dumps({"table_data": table_data}, separators=(",", ":")))
+    return (f"<html><head><title>Assignments</title></head><body><table>{rows}</table>"
+            f"<script>window.props = JSON.parse({props});</script></body></html>").encode("utf-8")
+
+
+class SyntheticCourse:
+    """
+    A Gradescope course and a PrairieLearn course instance with the same students, generated from a seed. Responses
+    are generated when first requested; large responses are kept, and instance questions are generated every time.
+    `churn` changes part of the grades, as happens between two syncs.
+    """
+
+    def __init__(self, students, assignments=60, assessments=10, questions=5, seed=0):
+        """
+        Args:
+            students (int): The number of students.
+            assignments (int): The number of Gradescope assignments.
+            assessments (int): The number of PrairieLearn assessments.
+            questions (int): The number of questions of each PrairieLearn assessment.
+            seed (int): Seeds every generated value.
+        """
+        self.seed = seed
+        self.questions = questions
+        self.students = [("Student", f"{index:05d}", str(3030000000 + index), f"student{index}@berkeley.edu",
+                          f"Lab {101 + index % 20}") for index in range(students)]
+        self.assignments = [(str(5000000 + index), title) for index, title in enumerate(make_assignment_titles(assignments))]
+        self.assignment_titles = dict(self.assignments)
+        self.assessments = [{"assessment_id": 100 + index, "assessment_name": f"hw{index + 1}",
+                             "title": f"Homework {index + 1}", "type": "Homework", "number": str(index + 1)}
+                            for index in range(assessments)]
+        self.lock = threading.Lock()
+        self.cache = {}
+        # The number of times the grades of each assignment and assessment instance were changed by `churn`.
+        self.assignment_versions = {}
+        self.instance_versions = {}
+        # The assessment instances of each assessment, as (assessment instance ID, student index) tuples.
+        self.instances_by_assessment = {}
+        rng = random.Random(seed)
+        next_instance_id = 1
+        for student_index in range(students):
+            for assessment in self.assessments:
+                # Roughly one in ten students has not started a given assessment.
+                if rng.random() < 0.1:
+                    continue
+                self.instances_by_assessment.setdefault(assessment["assessment_id"], []).append((next_instance_id, student_index))
+                next_instance_id += 1
+        self.instance_owners = {instance_id: (assessment_id, student_index)
+                                for assessment_id, instances in self.instances_by_assessment.items()
+                                for instance_id, student_index in instances}
+
+    def cached(self, key, build):
+        with self.lock:
+            if key not in self.cache:
+                self.cache[key] = build()
+            return self.cache[key]
+
+    def churn(self, fraction, seed=None):
+        """
+        Changes the grades of `fraction` of the assignments and of the assessment instances, picked at random.
+        """
+        rng = random.Random(seed)
+        with self.lock:
+            for assignment_id, _ in rng.sample(self.assignments, round(len(self.assignments) * fraction)):
+                self.assignment_versions[assignment_id] = self.assignment_versions.get(assignment_id, 0) + 1
+                self.cache.pop(("scores", assignment_id), None)
+            for instance_id in rng.sample(sorted(self.instance_owners), round(len(self.instance_owners) * fraction)):
+                self.instance_versions[instance_id] = self.instance_versions.get(instance_id, 0) + 1
+
+    def generate(self):
+        """
+        Generates the responses that are kept, so that the first requests for them are not slowed down.
+        """
+        self.assignments_page()
+        self.gradebook()
+        for assignment_id in self.assignment_ids():
+            self.scores_csv(assignment_id)
+
+    def roster_sids(self):
+        return [student[2] for student in self.students]
+
+    def assignment_ids(self):
+        return [assignment_id for assignment_id, _ in self.assignments]
+
+    def number_of_instances(self):
+        return len(self.instance_owners)
+
+    def assignments_page(self):
+        return self.cached("page", lambda: make_assignments_page(self.assignments))
+
+    def scores_csv(self, assignment_id):
+        if assignment_id not in self.assignment_titles:
+            return None
+        return self.cached(("scores", assignment_id), lambda: self.make_scores_csv(assignment_id))
+
+    def make_scores_csv(self, assignment_id):
+        rng = random.Random(f"{self.seed}:{assignment_id}:{self.assignment_versions.get(assignment_id, 0)}")
+        number_of_questions = rng.randint(1, 6)
+        points_per_question = rng.choice([1.0, 2.0, 5.0])
+        max_points = number_of_questions * points_per_question
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(SCORES_CSV_COLUMNS + [f"{question}: Question {question} ({points_per_question} pts)"
+                                              for question in range(1, number_of_questions + 1)])
+        for index, (first_name, last_name, sid, email, section) in enumerate(self.students):
+            if rng.random() < 0.1:
+                writer.writerow([first_name, last_name, sid, email, section, "", max_points, "Missing",
+                                 "", "", "", "", ""] + [""] * number_of_questions)
+                continue
+            question_scores = [rng.choice([0.0, points_per_question / 2, points_per_question])
+                               for _ in range(number_of_questions)]
+            writer.writerow([first_name, last_name, sid, email, section, sum(question_scores), max_points, "Graded",
+                             100000000 + index, "2025-03-01 12:00:00 -0800", "00:00:00", rng.randint(0, 5),
+                             rng.randint(1, 3)] + question_scores)
+        return output.getvalue().encode("utf-8")
+
+    def modified_at(self, instance_id):
+        modified = datetime(2025, 3, 1, tzinfo=timezone.utc) + timedelta(seconds=self.instance_versions.get(instance_id, 0))
+        return modified.isoformat()
+
+    def gradebook(self):
+        return self.cached("gradebook", lambda: json.dumps(self.make_gradebook()).encode("utf-8"))
+
+    def make_gradebook(self):
+        assessments_by_student = {}
+        for assessment in self.assessments:
+            for instance_id, student_index in self.instances_by_assessment.get(assessment["assessment_id"], []):
+                assessments_by_student.setdefault(student_index, []).append({
+                    "assessment_id": assessment["assessment_id"],
+                    "assessment_name": assessment["assessment_name"],
+                    "assessment_label": f"HW{assessment['number']}",
+                    "assessment_instance_id": instance_id,
+                    "points": 0,
+                    "max_points": 2 * self.questions,
+                })
+        return [{
+            "user_id": index,
+            "user_uid": email,
+            "user_uin": sid,
+            "user_name": f"{first_name} {last_name}",
+            "user_role": "Student",
+            "assessments": assessments_by_student.get(index, []),
+        } for index, (first_name, last_name, sid, email, _) in enumerate(self.students)]
+
+    def assessments_json(self):
+        return json.dumps(self.assessments).encode("utf-8")
+
+    def assessment_instances(self, assessment_id):
+        instances = self.instances_by_assessment.get(int(assessment_id))
+        if instances is None:
+            return None
+        return json.dumps([{
+            "assessment_instance_id": instance_id,
+            "assessment_id": int(assessment_id),
+            "user_uid": self.students[student_index][3],
+            "modified_at": self.modified_at(instance_id),
+        } for instance_id, student_index in instances]).encode("utf-8")
+
+    def instance_questions(self, instance_id):
+        instance_id = int(instance_id)
+        if instance_id not in self.instance_owners:
+            return None
+        assessment_id, _ = self.instance_owners[instance_id]
+        assessment_name = f"hw{assessment_id - 99}"
+        rng = random.Random(f"{self.seed}:{instance_id}:{self.instance_versions.get(instance_id, 0)}")
+        return json.dumps([{
+            "zone_number": question // 2 + 1,
+            "zone_title": f"Zone {question // 2 + 1}",
+            "question_name": f"{assessment_name}/q{question}",
+            "instance_question_id": instance_id * 100 + question,
+            "instance_question_points": rng.choice([0, 0.5, 1, 2, None]),
+            "assessment_question_max_points": 2,
+            "instance_question_score_perc": rng.random() * 100,
+            "instance_question_auto_points": rng.random(),
+            "assessment_question_max_auto_points": 2,
+            "instance_question_manual_points": 0,
+            "assessment_question_max_manual_points": 0,
+            "highest_submission_score": rng.random(),
+            "last_submission_score": rng.random(),
+            "number_attempts": rng.randint(0, 5),
+            "duration_seconds": rng.randint(0, 3600),
+        } for question in range(self.questions)]).encode("utf-8")
+
+
+class RecordedCourse:
+    """
+    Responses recorded from Gradescope and PrairieLearn by record_fixtures.py, read from a folder laid out as:
+
+        gradescope/assignments.html
+        gradescope/scores/<assignment id>.csv
+        prairielearn/gradebook.json
+        prairielearn/assessments.json
+        prairielearn/assessment_instances/<assessment id>.json
+        prairielearn/instance_questions/<assessment instance id>.json
+
+    Missing files are answered with 404 Not Found. Course IDs in request paths are ignored.
+    """
+
+    def __init__(self, directory, assignment_ids=None):
+        """
+        Args:
+            directory (String): The folder of the recording.
+            assignment_ids (list, optional): The IDs of the assignments on the recorded assignments page.
+                Defaults to the IDs of the recorded scores.
+        """
+        self.directory = directory
+        scores_directory = os.path.join(directory, "gradescope", "scores")
+        recorded_ids = sorted(name[:-len(".csv")] for name in os.listdir(scores_directory)) if os.path.isdir(scores_directory) else []
+        self.recorded_assignment_ids = assignment_ids if assignment_ids is not None else recorded_ids
+
+    def read(self, *path):
+        try:
+            with open(os.path.join(self.directory, *path), "rb") as fixture:
+                return fixture.read()
+        except FileNotFoundError:
+            return None
+
+    def churn(self, fraction, seed=None):
+        # Recorded responses do not change.
+        pass
+
+    def generate(self):
+        pass
+
+    def roster_sids(self):
+        sids = {}
+        for assignment_id in self.assignment_ids():
+            scores = self.scores_csv(assignment_id)
+            if not scores:
+                continue
+            for row in list(csv.reader(io.StringIO(scores.decode("utf-8"))))[1:]:
+                if len(row) > 2 and row[2].strip():
+                    sids.setdefault(row[2].strip(), None)
+        return list(sids)
+
+    def assignment_ids(self):
+        return list(self.recorded_assignment_ids)
+
+    def number_of_instances(self):
+        directory = os.path.join(self.directory, "prairielearn", "instance_questions")
+        return len(os.listdir(directory)) if os.path.isdir(directory) else 0
+
+    def assignments_page(self):
+        return self.read("gradescope", "assignments.html")
+
+    def scores_csv(self, assignment_id):
+        return self.read("gradescope", "scores", f"{assignment_id}.csv")
+
+    def gradebook(self):
+        return self.read("prairielearn", "gradebook.json")
+
+    def assessments_json(self):
+        return self.read("prairielearn", "assessments.json")
+
+    def assessment_instances(self, assessment_id):
+        return self.read("prairielearn", "assessment_instances", f"{assessment_id}.json")
+
+    def instance_questions(self, instance_id):
+        return self.read("prairielearn", "instance_questions", f"{instance_id}.json")
+
+
+class Faults:
+    """
+    Latency and errors added to the responses of a stand-in server. Each response is delayed by `latency` seconds,
+    give or take `jitter` of it, and a share `error_rate` of them fail with `error_status` instead. This is thread-safe.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.25, error_rate=0.0, error_status=503, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def next_fault(self):
+        """
+        Returns (seconds to wait, whether to fail) for the next response.
+        """
+        with self.lock:
+            delay = self.latency * (1 + self.rng.uniform(-self.jitter, self.jitter)) if self.latency else 0
+            return delay, self.rng.random() < self.error_rate
+
+
+class Request:
+    """
+    A request received by a stand-in server.
+    """
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+    def form(self):
+        return {name: values[0] for name, values in parse_qs(self.body.decode("utf-8")).items()}
+
+    def cookie(self, name):
+        match = re.search(rf"(?:^|;\s*){re.escape(name)}=([^;]*)", self.headers.get("Cookie", ""))
+        return match and match.group(1)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive, as the real services do, so clients reuse their pooled connections.
+    protocol_version = "HTTP/1.1"
+
+    def handle_request(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        request = Request(self.command, unquote(parsed.path), parse_qs(parsed.query), self.headers, body)
+        status, headers, content = self.server.dispatch(request)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_HEAD = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    A stand-in server on 127.0.0.1 and a free port, answering each request with the first of its routes whose method
+    and path match, and counting requests, bytes and injected errors by route. Call `start` to serve in a thread.
+    """
+
+    daemon_threads = True
+    name = "stub"
+
+    def __init__(self, faults=None):
+        super().__init__(("127.0.0.1", 0), StubRequestHandler)
+        self.faults = faults or Faults(error_status=DEFAULT_ERROR_STATUSES.get(self.name, 503))
+        self.routes = []
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method, pattern, handler, name, injectable=True):
+        """
+        Answers requests for `method` and paths matching the regular expression `pattern` with
+        `handler(request, *groups)`, which returns (status, headers, body). Injected latency and errors only apply
+        to `injectable` routes.
+        """
+        self.routes.append((method, re.compile(pattern + "$"), handler, name, injectable))
+
+    def dispatch(self, request):
+        for method, pattern, handler, name, injectable in self.routes:
+            match = pattern.match(request.path)
+            if method == request.method and match:
+                break
+        else:
+            name, injectable = "unmatched", False
+            handler = lambda request: (404, {"Content-Type": "text/plain"}, b"Not Found")
+            match = None
+        failed = False
+        if injectable:
+            delay, failed = self.faults.next_fault()
+            if delay:
+                time.sleep(delay)
+        if failed:
+            status, headers, content = self.error_response(self.faults.error_status)
+        else:
+            status, headers, content = handler(request, *(match.groups() if match else ()))
+        self.count(name, status, len(request.body), len(content), failed)
+        return status, headers, content
+
+    def error_response(self, status):
+        return status, {"Content-Type": "application/json"}, json.dumps({"error": "Injected error"}).encode("utf-8")
+
+    def count(self, route, status, bytes_received, bytes_sent, injected):
+        with self.stats_lock:
+            stats = self.stats.setdefault(route, {"requests": 0, "errors": 0, "injected_errors": 0,
+                                                  "bytes_received": 0, "bytes_sent": 0})
+            stats["requests"] += 1
+            stats["errors"] += status >= 400
+            stats["injected_errors"] += injected
+            stats["bytes_received"] += bytes_received
+            stats["bytes_sent"] += bytes_sent
+
+    def snapshot(self):
+        """
+        Returns a copy of the counts of each route since the server started.
+        """
+        with self.stats_lock:
+            return {route: dict(stats) for route, stats in self.stats.items()}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name=f"{self.name}-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def respond(content, content_type="application/json"):
+    """
+    Returns a 200 response with `content`, or 404 Not Found if it is None.
+    """
+    if content is None:
+        return 404, {"Content-Type": "text/plain"}, b"Not Found"
+    return 200, {"Content-Type": content_type}, content
+
+
+class GradescopeStub(StubServer):
+    """
+    Serves the login form, the assignments page and the scores CSVs of a course. Logging in with any email and
+    password sets a session cookie, and the login page answers 401 to a session that sends it back, as Gradescope does.
+    Other pages do not check the session: fullGSapi posts the login form with `Host: www.gradescope.com`, so its
+    cookie jar files the cookie under that host and never sends it to the stand-in.
+    """
+
+    name = "gradescope"
+
+    def __init__(self, course, faults=None):
+        super().__init__(faults)
+        self.course = course
+        self.sessions = set()
+        self.route("GET", r"/login", self.login_page, "login", injectable=False)
+        self.route("POST", r"/login", self.log_in, "login", injectable=False)
+        self.route("GET", r"/logout", self.log_out, "logout", injectable=False)
+        self.route("GET", r"/courses/\d+/assignments", self.assignments_page, "assignments")
+        self.route("GET", r"/courses/\d+/assignments/(\d+)/scores\.csv", self.scores_csv, "scores")
+
+    def logged_in(self, request):
+        return request.cookie(GRADESCOPE_SESSION_COOKIE) in self.sessions
+
+    def login_page(self, request):
+        if self.logged_in(request):
+            return 401, {"Content-Type": "application/json"}, b'{"warning":"You must be logged out to access this page."}'
+        form = (f'<html><body><form action="/login" method="post">'
+                f'<input type="hidden" name="authenticity_token" value="{secrets.token_hex(16)}">'
+                f'</form></body></html>')
+        return 200, {"Content-Type": "text/html"}, form.encode("utf-8")
+
+    def log_in(self, request):
+        if not request.form().get("authenticity_token"):
+            return 422, {"Content-Type": "text/plain"}, b"Missing authenticity token"
+        session = secrets.token_hex(16)
+        self.sessions.add(session)
+        return 200, {"Content-Type": "text/html", "Set-Cookie": f"{GRADESCOPE_SESSION_COOKIE}={session}; Path=/"}, b"<html></html>"
+
+    def log_out(self, request):
+        self.sessions.discard(request.cookie(GRADESCOPE_SESSION_COOKIE))
+        return 200, {"Content-Type": "text/html"}, b"<html></html>"
+
+    def assignments_page(self, request):
+        return respond(self.course.assignments_page(), "text/html")
+
+    def scores_csv(self, request, assignment_id):
+        return respond(self.course.scores_csv(assignment_id), "text/csv")
+
+
+class PrairieLearnStub(StubServer):
+    """
+    Serves the PrairieLearn API endpoints used by GradeSync, under `api_url`. Requests need a Private-Token header.
+    """
+
+    name = "prairielearn"
+    prefix = "/pl/api/v1"
+
+    def __init__(self, course, faults=None):
+        super().__init__(faults)
+        self.course = course
+        course_instance = rf"{self.prefix}/course_instances/\d+"
+        self.route("GET", rf"{course_instance}/gradebook", lambda request: self.authorized(request, self.course.gradebook), "gradebook")
+        self.route("GET", rf"{course_instance}/assessments", lambda request: self.authorized(request, self.course.assessments_json), "assessments")
+        self.route("GET", rf"{course_instance}/assessments/(\d+)/assessment_instances",
+                   lambda request, assessment_id: self.authorized(request, self.course.assessment_instances, assessment_id),
+                   "assessment_instances")
+        self.route("GET", rf"{course_instance}/assessment_instances/(\d+)/instance_questions",
+                   lambda request, instance_id: self.authorized(request, self.course.instance_questions, instance_id),
+                   "instance_questions")
+
+    @property
+    def api_url(self):
+        return self.url + self.prefix
+
+    def authorized(self, request, read, *args):
+        if not request.headers.get("Private-Token"):
+            return 401, {"Content-Type": "application/json"}, b'{"message":"Unauthorized"}'
+        return respond(read(*args))
+
+
+class FakeSpreadsheet:
+    """
+    An in-memory spreadsheet holding the subsheets a sync writes to. It starts with the gradebook subsheets, each with
+    a header row and the roster's SIDs in column C. Subsheets that exist from the start keep their values, so they can
+    be read back; the others, such as one subsheet per assignment, only keep their size, to keep the stand-in small.
+    """
+
+    def __init__(self, roster_sids, categories=GRADEBOOK_CATEGORIES):
+        self.lock = threading.Lock()
+        self.sheets = {}
+        self.next_sheet_id = 1
+        for category in categories:
+            self.add_sheet(category, [["Name", "Email", "SID"]] + [["", "", sid] for sid in roster_sids])
+
+    def add_sheet(self, title, rows=None):
+        """
+        Adds a subsheet and returns its properties. `rows` are its values, or None to only keep its size.
+        """
+        sheet = {"sheetId": self.next_sheet_id, "title": title, "index": len(self.sheets), "rows": rows,
+                 "row_count": len(rows or []), "column_count": max((len(row) for row in rows or []), default=0)}
+        self.next_sheet_id += 1
+        self.sheets[title] = sheet
+        return sheet
+
+    def properties(self):
+        with self.lock:
+            return [{"properties": {"sheetId": sheet["sheetId"], "title": sheet["title"], "index": sheet["index"],
+                                    "sheetType": "GRID"}} for sheet in self.sheets.values()]
+
+    def apply(self, request):
+        """
+        Applies one request of a batchUpdate and returns its reply.
+
+        Raises:
+            ValueError: If the request cannot be applied, such as adding a subsheet that exists.
+        """
+        kind = next(iter(request))
+        with self.lock:
+            if kind == "addSheet":
+                title = request["addSheet"]["properties"]["title"]
+                if title in self.sheets:
+                    raise ValueError(f'A sheet with the name "{title}" already exists.')
+                sheet = self.add_sheet(title)
+                return {"addSheet": {"properties": {"sheetId": sheet["sheetId"], "title": title, "index": sheet["index"]}}}
+            if kind == "pasteData":
+                self.paste(request["pasteData"])
+        return {}
+
+    def paste(self, paste_data):
+        sheet = next((sheet for sheet in self.sheets.values()
+                      if sheet["sheetId"] == paste_data["coordinate"].get("sheetId", 0)), None)
+        if sheet is None:
+            raise ValueError(f"No grid with id: {paste_data['coordinate'].get('sheetId')}")
+        rows = list(csv.reader(io.StringIO(paste_data.get("data", "")), delimiter=paste_data.get("delimiter", ",")))
+        row_index = paste_data["coordinate"].get("rowIndex", 0)
+        column_index = paste_data["coordinate"].get("columnIndex", 0)
+        sheet["row_count"] = max(sheet["row_count"], row_index + len(rows))
+        sheet["column_count"] = max(sheet["column_count"], column_index + max((len(row) for row in rows), default=0))
+        if sheet["rows"] is None:
+            return
+        grid = sheet["rows"]
+        for offset, row in enumerate(rows):
+            while len(grid) <= row_index + offset:
+                grid.append([])
+            grid_row = grid[row_index + offset]
+            if len(grid_row) < column_index:
+                grid_row += [""] * (column_index - len(grid_row))
+            grid_row[column_index:column_index + len(row)] = row
+
+    def values(self, a1_range):
+        """
+        Returns the values in an A1 range such as "Labs!1:1" or "Labs!C2:C193", as the Sheets API does: a list of rows
+        without their trailing blank cells, and without trailing blank rows.
+        """
+        title, _, cells = a1_range.rpartition("!")
+        if not title:
+            title, cells = cells, ""
+        title = title.strip("'")
+        with self.lock:
+            sheet = self.sheets.get(title)
+            if sheet is None:
+                raise ValueError(f"Unable to parse range: {a1_range}")
+            grid = sheet["rows"] or []
+            first_row, first_column, last_row, last_column = parse_a1_cells(cells)
+            rows = []
+            for row in grid[first_row:None if last_row is None else last_row + 1]:
+                values = row[first_column:None if last_column is None else last_column + 1]
+                while values and values[-1] == "":
+                    values = values[:-1]
+                rows.append(values)
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+
+def column_number(letters):
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+def parse_a1_cells(cells):
+    """
+    Parses the cells of an A1 range, such as "C2:C193", "1:1" or "A:Z", into zero-based (first row, first column,
+    last row, last column), where None means unbounded.
+    """
+    if not cells:
+        return 0, 0, None, None
+    start, _, end = cells.partition(":")
+    end = end or start
+    start_column, start_row = re.fullmatch(r"([A-Za-z]*)(\d*)", start).groups()
+    end_column, end_row = re.fullmatch(r"([A-Za-z]*)(\d*)", end).groups()
+    return (int(start_row) - 1 if start_row else 0, column_number(start_column) - 1 if start_column else 0,
+            int(end_row) - 1 if end_row else None, column_number(end_column) - 1 if end_column else None)
+
+
+class SheetsStub(StubServer):
+    """
+    Serves the Google Sheets API calls made by the sync scripts (spreadsheets.get, values.get, values.batchGet and
+    batchUpdate) for one `FakeSpreadsheet`, whatever the spreadsheet ID, and the OAuth token endpoint of
+    `fake_service_account_info`. Besides the counts of every stand-in server, it counts the requests of each kind
+    in batchUpdate calls.
+    """
+
+    name = "sheets"
+
+    def __init__(self, spreadsheet, faults=None):
+        super().__init__(faults)
+        self.spreadsheet = spreadsheet
+        self.route("POST", r"/token", self.token, "token", injectable=False)
+        self.route("GET", r"/v4/spreadsheets/[^/]+/values:batchGet", self.batch_get, "values.batchGet")
+        self.route("GET", r"/v4/spreadsheets/[^/]+/values/(.+)", self.get_values, "values.get")
+        self.route("POST", r"/v4/spreadsheets/[^/]+:batchUpdate", self.batch_update, "batchUpdate")
+        self.route("GET", r"/v4/spreadsheets/[^/]+", self.get_spreadsheet, "get")
+
+    def error_response(self, status, message="Injected error"):
+        statuses = {400: "INVALID_ARGUMENT", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+        error = {"error": {"code": status, "message": message, "status": statuses.get(status, "UNKNOWN")}}
+        return status, {"Content-Type": "application/json"}, json.dumps(error).encode("utf-8")
+
+    def token(self, request):
+        return respond(json.dumps({"access_token": secrets.token_hex(16), "expires_in": 3600,
+                                   "token_type": "Bearer"}).encode("utf-8"))
+
+    def get_spreadsheet(self, request):
+        return respond(json.dumps({"sheets": self.spreadsheet.properties()}).encode("utf-8"))
+
+    def get_values(self, request, a1_range):
+        try:
+            values = self.spreadsheet.values(a1_range)
+        except ValueError as error:
+            return self.error_response(400, str(error))
+        return respond(json.dumps({"range": a1_range, "majorDimension": "ROWS", "values": values}).encode("utf-8"))
+
+    def batch_get(self, request):
+        try:
+            value_ranges = [{"range": a1_range, "majorDimension": "ROWS", "values": self.spreadsheet.values(a1_range)}
+                            for a1_range in request.query.get("ranges", [])]
+        except ValueError as error:
+            return self.error_response(400, str(error))
+        return respond(json.dumps({"valueRanges": value_ranges}).encode("utf-8"))
+
+    def batch_update(self, request):
+        requests = request.json().get("requests", [])
+        # The Sheets API accepts a single request in place of a list.
+        requests = [requests] if isinstance(requests, dict) else requests
+        try:
+            replies = [self.spreadsheet.apply(batch_request) for batch_request in requests]
+        except ValueError as error:
+            return self.error_response(400, str(error))
+        for batch_request in requests:
+            self.count(f"batchUpdate.{next(iter(batch_request))}", 200, 0, 0, False)
+        return respond(json.dumps({"replies": replies}).encode("utf-8"))
+
+
+def fake_service_account_info(token_uri):
+    """
+    Returns service account credentials, as in the SERVICE_ACCOUNT_CREDENTIALS environment variable, with a new
+    private key and a token_uri pointing at a stand-in token endpoint such as `SheetsStub.url + "/token"`.
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key_pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                                serialization.NoEncryption()).decode("utf-8")
+    return {
+        "type": "service_account",
+        "project_id": "gradesync-benchmark",
+        "private_key_id": secrets.token_hex(20),
+        "private_key": private_key_pem,
+        "client_email": "benchmark@gradesync-benchmark.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": token_uri,
+    }
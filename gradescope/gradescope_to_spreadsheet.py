@@ -7,10 +7,10 @@ import os.path
 import re
 import io
 import time
+import hashlib
 import warnings
 import functools
 from googleapiclient.errors import HttpError
-import gspread
 from googleapiclient.discovery import build
 from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
@@ -20,6 +20,13 @@ import pandas as pd
 import backoff_utils
 import requests
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import sheets_batch
+import sheets_backend
+import http_retry
+import raw_data_cache
+import sync_metrics
+from assignment_catalog import AssignmentCatalog
 
 load_dotenv()
 GRADESCOPE_EMAIL = os.getenv("GRADESCOPE_EMAIL")
@@ -56,6 +63,48 @@ SPREADSHEET_ID = config["SPREADSHEET_ID"]
 # Course metadata
 NUMBER_OF_STUDENTS = config["NUMBER_OF_STUDENTS"]
 
+# Upper bound on the number of Gradescope score downloads in flight at once.
+# All downloads share the single authenticated Gradescope session.
+MAX_CONCURRENT_DOWNLOADS = config.get("MAX_CONCURRENT_DOWNLOADS", 8)
+
+# Retry policy for requests to Gradescope: per-request timeout, exponential backoff with jitter, Retry-After,
+# an overall deadline per request, and a circuit breaker. See http_retry.py for the GRADESCOPE_* keys that tune it.
+# Set the GRADESCOPE_BASE_URL environment variable to send every Gradescope request, including the login, to another
+# server, such as the stand-in servers of the benchmarks in /benchmarks.
+GRADESCOPE_BASE_URL = os.getenv("GRADESCOPE_BASE_URL", "https://www.gradescope.com").rstrip("/")
+GRADESCOPE_RETRY_POLICY = http_retry.RetryPolicy.from_config(config, "GRADESCOPE_")
+
+# File recording a hash of each assignment's scores as of the last successful sync.
+# Assignments whose scores are unchanged since then are not pasted into sheets again.
+# On Cloud Run, point this at a mounted volume so that it persists between runs; if the file is missing, every assignment is pasted.
+SYNC_STATE_PATH = config.get("SYNC_STATE_PATH", os.path.join(os.path.dirname(__file__), 'sync_state/', class_json_name))
+
+# Local Parquet cache of the raw scores CSVs downloaded from Gradescope, shared with the other syncs. See raw_data_cache.py.
+# A relative path is relative to this folder; leave RAW_DATA_CACHE_PATH unset to disable the cache.
+# Scores cached less than RAW_DATA_MAX_AGE_SECONDS ago are read from the cache instead of downloaded again,
+# so that re-renders and backfills do not need Gradescope. The default of 0 always downloads.
+RAW_DATA_CACHE_PATH = config.get("RAW_DATA_CACHE_PATH")
+RAW_DATA_MAX_AGE_SECONDS = config.get("RAW_DATA_MAX_AGE_SECONDS", 0)
+RAW_DATA_CACHE = raw_data_cache.RawDataCache(os.path.join(os.path.dirname(__file__), RAW_DATA_CACHE_PATH)) if RAW_DATA_CACHE_PATH else None
+
+# Timings and counts for each stage of the run, logged as JSON when the run ends. See sync_metrics.py.
+# If METRICS_TEXTFILE_PATH is set (relative to this folder), they are also written there in the Prometheus text format,
+# for the node exporter's textfile collector.
+METRICS = sync_metrics.SyncMetrics("gradescope")
+METRICS_TEXTFILE_PATH = config.get("METRICS_TEXTFILE_PATH")
+METRICS_TEXTFILE_PATH = os.path.join(os.path.dirname(__file__), METRICS_TEXTFILE_PATH) if METRICS_TEXTFILE_PATH else None
+GRADESCOPE_RETRY_POLICY.on_retry = lambda url, failure: METRICS.increment("gradescope_retries")
+
+# Budgets for the batchUpdate calls that paste data into the spreadsheet. See sheets_batch.py.
+SHEETS_BATCH_MAX_BYTES = config.get("SHEETS_BATCH_MAX_BYTES", sheets_batch.DEFAULT_MAX_BATCH_BYTES)
+SHEETS_BATCH_MAX_REQUESTS = config.get("SHEETS_BATCH_MAX_REQUESTS", sheets_batch.DEFAULT_MAX_REQUESTS_PER_BATCH)
+SHEETS_MAX_BATCHES_PER_MINUTE = config.get("SHEETS_MAX_BATCHES_PER_MINUTE", sheets_batch.DEFAULT_MAX_BATCHES_PER_MINUTE)
+# Set the SHEETS_API_ENDPOINT environment variable to send Google Sheets requests to another server. Defaults to Google's.
+SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT")
+# Set the SHEETS_BACKEND environment variable to "memory" or "sqlite:<path>" to write to a stand-in spreadsheet instead
+# of Google Sheets, without credentials. See sheets_backend.py.
+SHEETS_BACKEND = os.getenv("SHEETS_BACKEND", sheets_backend.GOOGLE_BACKEND)
+
 # These constants are deprecated. 
 # The following explanation is for what their purpose was: 
 # ASSIGNMENT_ID is for users who wish to generate a sub-sheet (not update the dashboard) for one assignment. 
@@ -79,8 +128,26 @@ A submitted discussion is awarded full credit; discussions are not manually grad
 GRADE_RETRIEVAL_SPREADSHEET_FORMULA = '=XLOOKUP(C:C, INDIRECT( INDIRECT(ADDRESS(1, COLUMN(), 4)) & "!C:C"), INDIRECT(INDIRECT(ADDRESS(1, COLUMN(), 4)) & "!F:F"))'
 DISCUSSION_COMPLETION_INDICATOR_FORMULA = '=IF(XLOOKUP($C:$C, INDIRECT(INDIRECT(ADDRESS(1,COLUMN(),4)) & "!C:C"), INDIRECT(INDIRECT(ADDRESS(1,COLUMN(),4)) & "!H:H")) = "Missing", 0, 1)'
 
+# GRADEBOOK_MODE decides what is written to the category sheets (Labs, Discussions, ...):
+# "values" (the default) looks up every student's grades in Python and writes plain values, so the spreadsheet has nothing to recalculate.
+# "formulas" writes GRADE_RETRIEVAL_SPREADSHEET_FORMULA / DISCUSSION_COMPLETION_INDICATOR_FORMULA into every cell, as in earlier semesters.
+GRADEBOOK_MODE = config.get("GRADEBOOK_MODE", "values")
+
+# Zero-based columns of the Gradescope scores csv (and therefore of each assignment subsheet) that the formulas above read:
+# C holds the student's SID, F the total score and H the submission status.
+# Column C of each category sheet holds the SID of the student in that row.
+SCORES_CSV_SID_COLUMN = 2
+SCORES_CSV_TOTAL_SCORE_COLUMN = 5
+SCORES_CSV_STATUS_COLUMN = 7
+
+# The subsheets that make up the gradebook. Each has a header row of assignment names, starting in column D,
+# and the SID of the student in each row in column C.
+GRADEBOOK_CATEGORIES = ["Labs", "Discussions", "Projects", "Lecture Quizzes", "Midterms", "Postterms"]
+
 # This is not a constant; it is a variable that needs global scope. It should not be modified by the user
 subsheet_titles_to_ids = None
+# Also not a constant: the header rows and SIDs of the gradebook categories, read once per run. See get_category_snapshot.
+category_snapshot = None
 # Tracking the number of_attempts to_update a sheet.
 number_of_retries_needed_to_update_sheet = 0
 
@@ -100,22 +167,30 @@ def deprecated(func):
 
 # Connect the script to the Google Sheets API through authorizing the google cloud service account
 # The service account is created in order to automatically run the script in a Google Cloud Run Service through the docker containerization of a cron job.
-credentials_json = os.getenv("SERVICE_ACCOUNT_CREDENTIALS")
-credentials_dict = json.loads(credentials_json)
-credentials = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
-client = gspread.authorize(credentials)
+# The credentials are loaded on first use, so that runs against a stand-in SHEETS_BACKEND need none.
+@functools.lru_cache(maxsize=None)
+def load_credentials():
+    """
+    Loads the service account credentials from the SERVICE_ACCOUNT_CREDENTIALS environment variable.
+
+    Returns:
+        google.oauth2.service_account.Credentials: The credentials.
+    """
+    credentials_dict = json.loads(os.getenv("SERVICE_ACCOUNT_CREDENTIALS"))
+    return Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+
 
 def create_sheet_and_request_to_populate_it(sheet_api_instance, assignment_scores, assignment_name = ASSIGNMENT_NAME):
     """
     Creates a sheet and adds the request that will populate the sheet to request_list.
 
     Args:
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
         assignment_scores (String): The csv containing assignment scores
         assignment_name (String): The name of the assignment as listed on Gradescope
 
     Returns:
-        None: This function does not return a value.
+        bool: True if the request was created, False if an error occurred.
     """
     global number_of_retries_needed_to_update_sheet
     try:
@@ -134,18 +209,34 @@ def create_sheet_and_request_to_populate_it(sheet_api_instance, assignment_score
             request = sheet_api_instance.batchUpdate(spreadsheetId=SPREADSHEET_ID, body=create_sheet_rest_request)
             response = make_request(request)
             sheet_id = response['replies'][0]['addSheet']['properties']['sheetId']
+            sub_sheet_titles_to_ids[assignment_name] = sheet_id
         else:
             sheet_id = sub_sheet_titles_to_ids[assignment_name]
         assemble_rest_request_for_assignment(assignment_scores, sheet_id)
         logger.info(f"Created sheets request for {assignment_name}")
         number_of_retries_needed_to_update_sheet = 0
+        return True
     except HttpError as err:
         logger.error(f"An HttpError has occurred: {err}")
     except Exception as err:
         logger.error(f"An unknown error has occurred: {err}")
+    return False
 
 
+@functools.lru_cache(maxsize=None)
 def create_sheet_api_instance():
+    """
+    Creates the sheet api instance of the SHEETS_BACKEND: the Google Sheets API, or a stand-in spreadsheet.
+    Every call is counted in METRICS. The instance is created once and shared.
+
+    Returns:
+        sheets_backend.SheetsBackend: The sheet api instance.
+    """
+    return sheets_backend.create_backend(SHEETS_BACKEND, build_sheets_resource, metrics=METRICS,
+                                         directory=os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_sheets_resource():
     """
     Creates a sheet api instance through the googleapiclient library.
     The build function references "from googleapiclient.discovery import build" in the imports.
@@ -153,9 +244,9 @@ def create_sheet_api_instance():
     Returns:
         googleapiclient.discovery.Resource: The sheet api instance.
     """
-    service = build("sheets", "v4", credentials=credentials)
-    sheet_api_instance = service.spreadsheets()
-    return sheet_api_instance
+    client_options = {"api_endpoint": SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+    service = build("sheets", "v4", credentials=load_credentials(), client_options=client_options)
+    return service.spreadsheets()
 
 
 def get_sub_sheet_titles_to_ids(sheet_api_instance):
@@ -164,7 +255,7 @@ def get_sub_sheet_titles_to_ids(sheet_api_instance):
     return it. If not, retrieve that info from Google sheets.
 
     Args:
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
 
     Returns:
         dict: A dict mapping subsheet names (titles) to sheet ids.
@@ -173,8 +264,9 @@ def get_sub_sheet_titles_to_ids(sheet_api_instance):
     if subsheet_titles_to_ids:
         return subsheet_titles_to_ids
     logger.info("Retrieving subsheet titles to ids")
-    request = sheet_api_instance.get(spreadsheetId=SPREADSHEET_ID, fields='sheets/properties')
-    sheets = make_request(request)
+    with METRICS.timer("sheets_metadata"):
+        request = sheet_api_instance.get(spreadsheetId=SPREADSHEET_ID, fields='sheets/properties')
+        sheets = make_request(request)
     subsheet_titles_to_ids = {sheet['properties']['title']: sheet['properties']['sheetId'] for sheet in
                                sheets['sheets']}
     return subsheet_titles_to_ids
@@ -206,7 +298,7 @@ def backoff_handler(backoff_response=None):
     """
     global number_of_retries_needed_to_update_sheet
     number_of_retries_needed_to_update_sheet += 1
-    pass
+    METRICS.increment("sheets_retries")
 
 
 def store_request(request):
@@ -272,33 +364,87 @@ def assemble_rest_request_for_assignment(assignment_scores, sheet_id, rowIndex =
     store_request(push_grade_data_rest_request)
     return push_grade_data_rest_request
 
+def get_category_snapshot(sheet_api_instance):
+    """
+    If category_snapshot has already been created, return it. If not, read the header row and the SIDs of every
+    gradebook category that exists in the spreadsheet with one batch request, so that the rest of the run is served from memory.
+
+    Args:
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
+    Returns:
+        dict: A dict mapping each existing category in GRADEBOOK_CATEGORIES to a dict with
+        "header" (the values in its first row) and "sids" (the SIDs in column C of rows 2 onward, in row order).
+    """
+    global category_snapshot
+    if category_snapshot is not None:
+        return category_snapshot
+    categories = [category for category in GRADEBOOK_CATEGORIES if category in get_sub_sheet_titles_to_ids(sheet_api_instance)]
+    if not categories:
+        category_snapshot = {}
+        return category_snapshot
+    logger.info("Retrieving gradebook header rows and SIDs")
+    ranges = []
+    for category in categories:
+        ranges += [f"{category}!1:1", f"{category}!C2:C{NUMBER_OF_STUDENTS + 1}"]
+    with METRICS.timer("sheets_metadata"):
+        request = sheet_api_instance.values().batchGet(spreadsheetId=SPREADSHEET_ID, ranges=ranges)
+        value_ranges = make_request(request).get("valueRanges", [])
+    category_snapshot = {}
+    for index, category in enumerate(categories):
+        header_rows = value_ranges[2 * index].get("values", [])
+        sid_rows = value_ranges[2 * index + 1].get("values", [])
+        category_snapshot[category] = {
+            "header": header_rows[0] if header_rows else [],
+            "sids": [row[0].strip() if row else "" for row in sid_rows],
+        }
+    return category_snapshot
+
+
 def retrieve_preexisting_columns(assignment_type, sheet_api_instance):
     """
     Retrieves the columns in the subsheet corresponding to a given assignment type.
 
     Args:
-        assignment_type (String): One of the following assignment types: ["Labs", "Discussions", "Projects", "Midterms", "Postterms"]
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        assignment_type (String): One of the following assignment types: ["Labs", "Discussions", "Projects", "Lecture Quizzes", "Midterms", "Postterms"]
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
     Returns:
-        None
+        list: The assignment names in the header row of the subsheet, starting in column D.
     """
-    range = f'{assignment_type}!1:1'
-    result = sheet_api_instance.values().get(spreadsheetId=SPREADSHEET_ID, range=range).execute()
-    first_row = result.get('values', [])
-    return first_row[0][3:]
+    return get_category_snapshot(sheet_api_instance).get(assignment_type, {}).get("header", [])[3:]
 
 
 def retrieve_grades_from_gradescope(gradescope_client, assignment_id = ASSIGNMENT_ID):
     """
     Retrieves grades for one GradeScope assignment in csv form.
+    Downloaded scores are stored in RAW_DATA_CACHE, and read from it instead while younger than RAW_DATA_MAX_AGE_SECONDS.
 
     Args:
         gradescope_client (String): One of the following assignment types: ["Labs", "Discussions", "Projects", "Midterms", "Postterms"]
         assignment_id (String): The Gradescope assignment ID of the assignment for which grades are to be retrieved.
     Returns:
-        None
-    """
-    assignment_scores = str(gradescope_client.download_scores(GRADESCOPE_COURSE_ID, assignment_id)).replace("\\n", "\n")
+        String: The csv assignment scores, or None if Gradescope returned an error.
+    Raises:
+        http_retry.RetryError: If Gradescope could not be reached within GRADESCOPE_RETRY_POLICY.
+    """
+    if RAW_DATA_CACHE and RAW_DATA_MAX_AGE_SECONDS > 0:
+        cached = RAW_DATA_CACHE.read_latest(GRADESCOPE_COURSE_ID, "gradescope", assignment_id, max_age=RAW_DATA_MAX_AGE_SECONDS)
+        if cached is not None:
+            logger.info(f"Using scores for assignment {assignment_id} cached at {cached['fetched_at']}")
+            METRICS.increment("raw_data_cache_hits")
+            return str(cached["payload"]).replace("\\n", "\n")
+    if not gradescope_client.logged_in:
+        logger.error("You must be logged in to download grades!")
+        return None
+    url = f"{GRADESCOPE_BASE_URL}/courses/{GRADESCOPE_COURSE_ID}/assignments/{assignment_id}/scores.csv"
+    with METRICS.timer("assignment_download"):
+        res = GRADESCOPE_RETRY_POLICY.request(lambda timeout: gradescope_client.session.get(url, timeout=timeout), url)
+    if not res.ok:
+        logger.error(f"Failed to download scores for assignment {assignment_id}! Got: {res}")
+        METRICS.increment("download_failures")
+        return None
+    if RAW_DATA_CACHE:
+        RAW_DATA_CACHE.write(GRADESCOPE_COURSE_ID, "gradescope", assignment_id, res.content, "text/csv")
+    assignment_scores = str(res.content).replace("\\n", "\n")
     return assignment_scores
 
 
@@ -310,7 +456,13 @@ def initialize_gs_client():
         (GradescopeClient): GradeScope API client.
     """
     gradescope_client = GradescopeClient.GradescopeClient()
-    gradescope_client.log_in(GRADESCOPE_EMAIL, GRADESCOPE_PASSWORD)
+    gradescope_client.base_url = GRADESCOPE_BASE_URL
+    # Size the connection pool to the worker pool so concurrent downloads reuse connections instead of discarding them.
+    adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_CONCURRENT_DOWNLOADS, pool_maxsize=MAX_CONCURRENT_DOWNLOADS)
+    gradescope_client.session.mount("https://", adapter)
+    gradescope_client.session.mount("http://", adapter)
+    with METRICS.timer("login"):
+        gradescope_client.log_in(GRADESCOPE_EMAIL, GRADESCOPE_PASSWORD)
     return gradescope_client
 
 
@@ -327,7 +479,8 @@ def get_assignment_info(gs_instance, class_id: str) -> bytes:
     if not gs_instance.logged_in:
         logger.error("You must be logged in to download grades!")
         return False
-    gs_instance.last_res = res = gs_instance.session.get(f"https://www.gradescope.com/courses/{class_id}/assignments")
+    url = f"{GRADESCOPE_BASE_URL}/courses/{class_id}/assignments"
+    gs_instance.last_res = res = GRADESCOPE_RETRY_POLICY.request(lambda timeout: gs_instance.session.get(url, timeout=timeout), url)
     if not res or not res.ok:
         logger.error(f"Failed to get a response from gradescope! Got: {res}")
         return False
@@ -340,7 +493,7 @@ def prepare_request_for_one_assignment(sheet_api_instance, gradescope_client, as
     Encapsulates the entire process of creating a request for one assignment, from data retrieval from GradeScope to the sheets request.
 
     Args:
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
         gradescope_client (GradescopeClient): The Gradescope API instance.
         assignment_name (String): The name of the assignment.
         assignment_id (String): The Gradescope assignment ID of the assignment for which grades are to be retrieved.
@@ -348,9 +501,55 @@ def prepare_request_for_one_assignment(sheet_api_instance, gradescope_client, as
         None
     """
     assignment_scores = retrieve_grades_from_gradescope(gradescope_client = gradescope_client, assignment_id = assignment_id)
+    if assignment_scores is None:
+        return
     create_sheet_and_request_to_populate_it(sheet_api_instance, assignment_scores, assignment_name)
 
 
+def download_all_assignment_scores(gradescope_client, assignment_ids):
+    """
+    Retrieves grades for many GradeScope assignments concurrently, using at most MAX_CONCURRENT_DOWNLOADS workers.
+    Downloads that cannot reach Gradescope are requeued and tried once more after all other downloads,
+    so that one struggling assignment does not hold up the rest.
+
+    Args:
+        gradescope_client (GradescopeClient): The Gradescope API instance.
+        assignment_ids (list): The Gradescope assignment IDs of the assignments for which grades are to be retrieved.
+    Returns:
+        list: The csv assignment scores (of type String), in the same order as assignment_ids.
+        An assignment whose scores could not be downloaded has None instead.
+    """
+    requeued = []
+
+    def download(assignment_id):
+        try:
+            return retrieve_grades_from_gradescope(gradescope_client, assignment_id)
+        except http_retry.RetryError as err:
+            logger.warning(f"Requeueing the download of assignment {assignment_id}: {err}")
+            METRICS.increment("downloads_requeued")
+            requeued.append(assignment_id)
+            return None
+
+    logger.info(f"Downloading scores for {len(assignment_ids)} assignments with {MAX_CONCURRENT_DOWNLOADS} workers")
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
+        # executor.map yields results in submission order, regardless of the order in which downloads finish.
+        all_assignment_scores = list(executor.map(download, assignment_ids))
+
+    if requeued:
+        logger.info(f"Retrying {len(requeued)} requeued downloads")
+        GRADESCOPE_RETRY_POLICY.wait_for_recovery(GRADESCOPE_BASE_URL)
+        retried_ids = list(requeued)
+        requeued.clear()
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
+            retried_scores = dict(zip(retried_ids, executor.map(download, retried_ids)))
+        all_assignment_scores = [retried_scores.get(assignment_id, assignment_scores)
+                                 for assignment_id, assignment_scores in zip(assignment_ids, all_assignment_scores)]
+        for assignment_id in requeued:
+            logger.error(f"Could not download the scores of assignment {assignment_id}; it will not be updated")
+            METRICS.increment("download_failures")
+    return all_assignment_scores
+
+
 def get_assignment_id_to_names(gradescope_client):
     """
     This method returns a dictionary mapping assignment IDs to the names (titles) of GradeScope assignments
@@ -360,35 +559,79 @@ def get_assignment_id_to_names(gradescope_client):
     Returns:
         dict: A dictionary mapping assignment IDs to the names (titles) of GradeScope assignments (of type String).
     """
-    # The response cannot be parsed as a json as is.
-    course_info_response = str(get_assignment_info(gradescope_client, GRADESCOPE_COURSE_ID)).replace("\\", "").replace("\\u0026", "&")
-    pattern = '{"id":[0-9]+,"title":"[^}"]+?"}'
-    info_for_all_assignments = re.findall(pattern, course_info_response)
-    assignment_to_names = {}
-    #  = { json.loads(assignment)['id'] : json.loads(assignment)['title'] for assignment in info_for_all_assignments }
-    for assignment in info_for_all_assignments:
-        assignment_as_json = json.loads(assignment)
-        assignment_to_names[str(assignment_as_json["id"])] = assignment_as_json["title"]
-    return assignment_to_names
+    # The page embeds the assignments as JSON; the catalog parser extracts them in one pass.
+    # Subsheets and gradebook columns are named after the titles, so keep the titles as earlier versions normalized them.
+    with METRICS.timer("catalog_fetch"):
+        return AssignmentCatalog.from_page(get_assignment_info(gradescope_client, GRADESCOPE_COURSE_ID)).id_to_names(legacy=True)
+
+
+def hash_assignment_scores(assignment_scores):
+    """
+    Hashes the csv scores for one assignment, so that changes can be detected between runs.
+
+    Args:
+        assignment_scores (String): The csv containing assignment scores
+    Returns:
+        str: The hex digest of the sha256 hash of the scores.
+    """
+    return hashlib.sha256(assignment_scores.encode("utf-8")).hexdigest()
+
+
+def load_sync_state():
+    """
+    Loads the assignment score hashes recorded by the last successful sync.
+
+    Returns:
+        dict: A dictionary mapping assignment IDs to score hashes. Empty if no sync has been recorded.
+    """
+    if not os.path.exists(SYNC_STATE_PATH):
+        logger.info(f"No sync state found at {SYNC_STATE_PATH}; all assignments will be pasted")
+        return {}
+    try:
+        with open(SYNC_STATE_PATH, "r") as sync_state_file:
+            return json.load(sync_state_file)
+    except (OSError, ValueError) as err:
+        logger.warning(f"Could not read sync state at {SYNC_STATE_PATH}; all assignments will be pasted: {err}")
+        return {}
+
+
+def save_sync_state(assignment_id_to_hashes):
+    """
+    Records the assignment score hashes of a successful sync. The file is replaced atomically.
+
+    Args:
+        assignment_id_to_hashes (dict): A dictionary mapping assignment IDs to score hashes.
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(SYNC_STATE_PATH), exist_ok=True)
+    temporary_path = SYNC_STATE_PATH + ".tmp"
+    with open(temporary_path, "w") as sync_state_file:
+        json.dump(assignment_id_to_hashes, sync_state_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, SYNC_STATE_PATH)
 
 
 def make_batch_request(sheet_api_instance):
     """
-    Executes a batch request including all requests in our running list: request_list
+    Executes all requests in our running list, request_list, in as few batch requests as the configured budgets allow.
+    Chunks that fail are retried on their own, so chunks that were already applied are not sent again.
 
     Args:
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
     Returns:
         None
     """
     global request_list
-    rest_batch_request = {
-        "requests": request_list
-    }
-    logger.info(f"Preparing batch request with {len(request_list)} requests")
-    batch_request = sheet_api_instance.batchUpdate(spreadsheetId=SPREADSHEET_ID, body=rest_batch_request)
-    logger.info("Issuing batch request")
-    make_request(batch_request)
+    if not request_list:
+        logger.info("No requests to issue; skipping batch request")
+        return
+    logger.info(f"Issuing batch request with {len(request_list)} requests")
+    METRICS.increment("sheets_requests", len(request_list))
+    with METRICS.timer("batch_write"):
+        responses = sheets_batch.execute_batches(sheet_api_instance, SPREADSHEET_ID, request_list,
+                                                 max_bytes=SHEETS_BATCH_MAX_BYTES, max_requests=SHEETS_BATCH_MAX_REQUESTS,
+                                                 max_batches_per_minute=SHEETS_MAX_BATCHES_PER_MINUTE, on_backoff=backoff_handler)
+    METRICS.increment("sheets_batches", len(responses))
     logger.info("Completed batch request")
     request_list = []  # Clear the request list after successful batch update
 
@@ -403,27 +646,144 @@ def push_all_grade_data_to_sheets():
     gradescope_client = initialize_gs_client()
     assignment_id_to_names = get_assignment_id_to_names(gradescope_client)
     sheet_api_instance = create_sheet_api_instance()
-    get_sub_sheet_titles_to_ids(sheet_api_instance)
-
-    # For all assignments, create the request for each assignment
-    for id in assignment_id_to_names:
-        prepare_request_for_one_assignment(sheet_api_instance, gradescope_client=gradescope_client,
-                                                               assignment_name=assignment_id_to_names[id], assignment_id=id)
+    sub_sheet_titles_to_ids = get_sub_sheet_titles_to_ids(sheet_api_instance)
+
+    # Download the scores for all assignments concurrently
+    assignment_ids = list(assignment_id_to_names)
+    METRICS.increment("assignments", len(assignment_ids))
+    with METRICS.timer("download_all"):
+        all_assignment_scores = download_all_assignment_scores(gradescope_client, assignment_ids)
+
+    # For all assignments whose scores changed since the last sync, create the request for each assignment.
+    # This happens serially, in assignment order, so the batch request is the same as the one produced by
+    # downloading one assignment at a time.
+    synced_assignment_hashes = load_sync_state()
+    assignment_id_to_hashes = {}
+    for id, assignment_scores in zip(assignment_ids, all_assignment_scores):
+        assignment_name = assignment_id_to_names[id]
+        if assignment_scores is None:
+            continue
+        scores_hash = hash_assignment_scores(assignment_scores)
+        if synced_assignment_hashes.get(id) == scores_hash and assignment_name in sub_sheet_titles_to_ids:
+            logger.info(f"Scores for {assignment_name} are unchanged since the last sync; skipping")
+            METRICS.increment("assignments_unchanged")
+            assignment_id_to_hashes[id] = scores_hash
+            continue
+        if create_sheet_and_request_to_populate_it(sheet_api_instance, assignment_scores, assignment_name):
+            assignment_id_to_hashes[id] = scores_hash
+    logger.info(f"{len(request_list)} of {len(assignment_ids)} assignments changed since the last sync")
+    METRICS.increment("assignments_changed", len(request_list))
 
     # Populate the gradebook
-    populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance)
+    assignment_names_to_scores = {assignment_id_to_names[id]: assignment_scores
+                                  for id, assignment_scores in zip(assignment_ids, all_assignment_scores)
+                                  if assignment_scores is not None}
+    populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance, assignment_names_to_scores)
 
     # Create the batch google sheet request in order to populate the google sheet
     make_batch_request(sheet_api_instance)
 
+    # Only record the new hashes once the batch request has succeeded
+    save_sync_state(assignment_id_to_hashes)
+
+
+def retrieve_roster_sids(sheet_api_instance):
+    """
+    Retrieves the SIDs in column C of each category subsheet, in row order.
+
+    Args:
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
+    Returns:
+        dict: A dictionary mapping each category to the list of SIDs in rows 2 onward of its subsheet.
+    """
+    return {category: snapshot["sids"] for category, snapshot in get_category_snapshot(sheet_api_instance).items()}
+
 
-def populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance):
+def build_scores_table(assignment_names_to_scores):
+    """
+    Parses the csv scores of every assignment into one long table with one row per (assignment, student).
+
+    Args:
+        assignment_names_to_scores (dict): A dictionary mapping assignment names to their csv scores (of type String).
+    Returns:
+        pandas.DataFrame: A table with the columns "Assignment", "SID", "Score" (a float, or NaN if blank)
+        and "Completion" (0 if the submission is missing and 1 otherwise).
+    """
+    tables = []
+    for assignment_name, assignment_scores in assignment_names_to_scores.items():
+        scores_df = pd.read_csv(io.StringIO(assignment_scores), dtype=str, keep_default_na=False)
+        if scores_df.shape[1] <= SCORES_CSV_STATUS_COLUMN:
+            logger.warning(f"Scores for {assignment_name} do not have the expected columns; leaving its gradebook column blank")
+            continue
+        tables.append(pd.DataFrame({
+            "Assignment": assignment_name,
+            "SID": scores_df.iloc[:, SCORES_CSV_SID_COLUMN].str.strip(),
+            "Score": pd.to_numeric(scores_df.iloc[:, SCORES_CSV_TOTAL_SCORE_COLUMN], errors="coerce"),
+            "Completion": (scores_df.iloc[:, SCORES_CSV_STATUS_COLUMN] != "Missing").astype(int),
+        }))
+    if not tables:
+        return pd.DataFrame(columns=["Assignment", "SID", "Score", "Completion"])
+    scores_table = pd.concat(tables, ignore_index=True)
+    # Like XLOOKUP, use the first row for a student if they appear more than once.
+    return scores_table.drop_duplicates(subset=["Assignment", "SID"], keep="first")
+
+
+def lookup_grades_for_roster(scores_table, roster_sids, assignment_names, value_column):
+    """
+    Joins a category's roster to the scores of its assignments, producing the values the spreadsheet formulas would compute.
+
+    Args:
+        scores_table (pandas.DataFrame): The output of build_scores_table.
+        roster_sids (list): The SIDs of the students in the category subsheet, in row order.
+        assignment_names (list): The assignment columns of the category subsheet, in column order.
+        value_column (String): "Score" for the total score, or "Completion" for the discussion completion indicator.
+    Returns:
+        pandas.DataFrame: One column per assignment and one row per roster row, padded with blank rows to NUMBER_OF_STUDENTS
+        so that no stale values are left below the roster. Students without a submission are left blank.
+    """
+    category_scores = scores_table[scores_table["Assignment"].isin(assignment_names)]
+    grades_by_sid = category_scores.pivot(index="SID", columns="Assignment", values=value_column)
+    number_of_rows = max(NUMBER_OF_STUDENTS, len(roster_sids))
+    padded_roster_sids = list(roster_sids) + [""] * (number_of_rows - len(roster_sids))
+    grades = grades_by_sid.reindex(index=padded_roster_sids, columns=assignment_names).reset_index(drop=True)
+    # Rows without a student must stay blank, even if some submission has a blank SID.
+    grades.loc[[sid == "" for sid in padded_roster_sids]] = None
+    if value_column == "Completion":
+        grades = grades.astype("Int64")
+    return grades
+
+
+def split_into_fresh_runs(assignment_names, fresh_assignment_names):
+    """
+    Splits the columns of a category into the runs of adjacent columns that have fresh scores.
+
+    Args:
+        assignment_names (list): The assignment columns of the category subsheet, in column order.
+        fresh_assignment_names (set): The assignments whose scores were downloaded in this run.
+    Returns:
+        list: (offset, names) pairs, where names is a run of adjacent fresh columns and offset is the index of its
+        first column in assignment_names.
+    """
+    runs = []
+    for offset, assignment_name in enumerate(assignment_names):
+        if assignment_name not in fresh_assignment_names:
+            continue
+        if runs and runs[-1][0] + len(runs[-1][1]) == offset:
+            runs[-1][1].append(assignment_name)
+        else:
+            runs.append((offset, [assignment_name]))
+    return runs
+
+
+def populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance, assignment_names_to_scores=None):
     """
     Creates the gradebook, ensuring existing columns remain in order, and encapsulates the process of retrieving grades from GradeScope.
 
     Args:
         assignment_id_to_names (dict) A dictionary mapping assignment IDs to the names (titles) of GradeScope assignments (of type String).
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
+        assignment_names_to_scores (dict): A dictionary mapping assignment names to their csv scores (of type String).
+            Required when GRADEBOOK_MODE is "values".
 
     Returns:
         None
@@ -494,14 +854,33 @@ def populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance):
     # discussion_formula_list = [DISCUSSION_COMPLETION_INDICATOR_FORMULA]
     discussion_formula_list = [DISCUSSION_COMPLETION_INDICATOR_FORMULA] * NUMBER_OF_STUDENTS
 
-    def produce_gradebook_for_category(sorted_assignment_list, category, formula_list):
+    if GRADEBOOK_MODE == "values":
+        # Look up every student's grades in Python, instead of having the spreadsheet evaluate one formula per cell.
+        roster_sids_by_category = retrieve_roster_sids(sheet_api_instance)
+        with METRICS.timer("csv_build"):
+            scores_table = build_scores_table(assignment_names_to_scores)
+        # Only columns with fresh scores are written. The others (assignments whose download failed, or columns that no
+        # longer match a Gradescope assignment) keep what the spreadsheet has, rather than being pasted over with blanks.
+        fresh_assignment_names = set(scores_table["Assignment"])
+        keep_fresh = lambda assignment_names: [name for name in assignment_names if name in fresh_assignment_names]
+        # A new column without scores is left out until a run downloads it, so that it does not leave a gap in the header.
+        sorted_new_labs = keep_fresh(sorted_new_labs)
+        sorted_new_discussions = keep_fresh(sorted_new_discussions)
+        sorted_new_projects = keep_fresh(sorted_new_projects)
+        sorted_new_lecture_quizzes = keep_fresh(sorted_new_lecture_quizzes)
+        sorted_new_midterms = keep_fresh(sorted_new_midterms)
+        sorted_new_postterms = keep_fresh(sorted_new_postterms)
+
+    def produce_gradebook_for_category(sorted_assignment_list, category, formula_list, value_column="Score"):
         """
-        Produces a gradebook for a given assignment category by creating (and csv-ifying) a dataframe of column names and spreadsheet formulas.
+        Produces a gradebook for a given assignment category by creating (and csv-ifying) a dataframe of column names and either
+        grade values or spreadsheet formulas, depending on GRADEBOOK_MODE.
 
         Args:
             sorted_assignment_list (list): A numerically sorted list of assignment names for a given category.
             category (String): The assignment category, which can be one of the following ["Labs", "Discussions", "Projects", "Midterms", "Postterms"]
             formula_list (list): This list represents the contents of a given assignment's column. It contains a spreadsheet formula to retrieve grade information. The formulas are explained in comments above the constants GRADE_RETRIEVAL_SPREADSHEET_FORMULA and DISCUSSION_COMPLETION_INDICATOR_FORMULA
+            value_column (String): In "values" mode, the value equivalent to formula_list: "Score" or "Completion".
 
         Returns:
             None
@@ -509,12 +888,20 @@ def populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance):
         if not sorted_assignment_list:
             return
         global subsheet_titles_to_ids
-        grade_dict = {name : formula_list for name in sorted_assignment_list}
-        grade_df = pd.DataFrame(grade_dict).set_index(sorted_assignment_list[0])
-        output = io.StringIO()
-        grade_df.to_csv(output)
-        grades_as_csv = output.getvalue()
-        output.close()
+        if GRADEBOOK_MODE == "values":
+            for offset, assignment_run in split_into_fresh_runs(sorted_assignment_list, fresh_assignment_names):
+                with METRICS.timer("csv_build"):
+                    grade_df = lookup_grades_for_roster(scores_table, roster_sids_by_category.get(category, []), assignment_run, value_column)
+                    grades_as_csv = grade_df.to_csv(index=False)
+                assemble_rest_request_for_assignment(grades_as_csv, sheet_id=subsheet_titles_to_ids[category], rowIndex=0, columnIndex=3 + offset)
+            return
+        with METRICS.timer("csv_build"):
+            grade_dict = {name : formula_list for name in sorted_assignment_list}
+            grade_df = pd.DataFrame(grade_dict).set_index(sorted_assignment_list[0])
+            output = io.StringIO()
+            grade_df.to_csv(output)
+            grades_as_csv = output.getvalue()
+            output.close()
 
         assemble_rest_request_for_assignment(grades_as_csv, sheet_id=subsheet_titles_to_ids[category], rowIndex=0, columnIndex=3)
 
@@ -528,7 +915,7 @@ def populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance):
 
     # Create the gradebook for each category
     produce_gradebook_for_category(sorted_labs, "Labs", formula_list)
-    produce_gradebook_for_category(sorted_discussions, "Discussions", discussion_formula_list)
+    produce_gradebook_for_category(sorted_discussions, "Discussions", discussion_formula_list, value_column="Completion")
     produce_gradebook_for_category(sorted_projects, "Projects", formula_list)
     produce_gradebook_for_category(sorted_lecture_quizzes, "Lecture Quizzes", formula_list)
     produce_gradebook_for_category(sorted_midterms, "Midterms", formula_list)
@@ -561,9 +948,11 @@ def main():
         end_time = time.time()
         logger.info("Grade synchronization completed successfully")
         logger.info(f"Finished in {round(end_time - start_time, 2)} seconds")
-        
+        METRICS.report("success", METRICS_TEXTFILE_PATH)
+
     except Exception as e:
         logger.error(f"An error occurred during grade synchronization: {str(e)}")
+        METRICS.report("failure", METRICS_TEXTFILE_PATH)
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -20,12 +20,14 @@ import csv
 import pandas as pd
 import backoff_utils
 import requests
+from prairieLearnClient import PrairieLearnClient
 
 load_dotenv()
 GRADESCOPE_EMAIL = os.getenv("GRADESCOPE_EMAIL")
 GRADESCOPE_PASSWORD = os.getenv("GRADESCOPE_PASSWORD")
 PL_API_TOKEN = os.getenv("PL_API_TOKEN")
 PL_SERVER = "https://us.prairielearn.com/pl/api/v1"
+PL_CLIENT = PrairieLearnClient(PL_API_TOKEN, PL_SERVER)
 
 import logging
 import sys
@@ -588,9 +590,8 @@ def retrieve_PL_scores_for_one_assignment(assignment_id):
         Exception: Catches any unexpected errors and includes a descriptive message.
     """
     try:
-        headers = {'Private-Token': PL_API_TOKEN}
-        url = PL_SERVER + f"/course_instances/{PL_COURSE_ID}/assessments/{assignment_id}/assessment_instances"
-        r = backoff_utils.backoff(requests.get, args = [url], kwargs = {'headers': headers}, max_tries = 3,  max_delay = 30, strategy = backoff_utils.strategies.Exponential)
+        endpoint = f"/course_instances/{PL_COURSE_ID}/assessments/{assignment_id}/assessment_instances"
+        r = backoff_utils.backoff(PL_CLIENT.get, args = [endpoint], max_tries = 3,  max_delay = 30, strategy = backoff_utils.strategies.Exponential)
         data = r.json()
         return data
     except Exception as e:
@@ -0,0 +1,79 @@
+# A PrairieLearn API client that keeps its connections open between requests.
+# This file is shared by the PrairieLearn sync script, the Gradescope sync scripts and the API. Each is deployed
+# from its own folder, so an identical copy lives in each of them; keep the copies in sync.
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PL_SERVER = "https://us.prairielearn.com/pl/api/v1"
+
+
+class PrairieLearnClient:
+    """
+    Sends requests to the PrairieLearn API through one `requests.Session`, so that connections to PrairieLearn are
+    kept alive and reused instead of paying for a new TCP and TLS handshake on every call. Responses are
+    gzip-compressed when PrairieLearn supports it. The client can be shared between threads.
+    """
+
+    def __init__(self, token: str, server: str = PL_SERVER, pool_size: int = 10, timeout: float = 30):
+        """
+        Parameters:
+            token (str): A PrairieLearn personal access token.
+            server (str): The base URL of the PrairieLearn API. Defaults to `PL_SERVER`.
+            pool_size (int): The number of connections kept open. Set it to at least the number of threads
+                that call the client at once. Default is 10.
+            timeout (float): Timeout in seconds for requests that do not set their own. Default is 30 seconds.
+        """
+        self.server = server.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Private-Token": token or "",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url_for(self, endpoint: str) -> str:
+        """
+        Returns the full URL of an API endpoint, such as "/course_instances/1/gradebook".
+        """
+        return self.server + endpoint
+
+    def get(self, endpoint: str, timeout: float = None, **kwargs) -> requests.Response:
+        """
+        Sends a GET request to an API endpoint, such as "/course_instances/1/gradebook".
+
+        Parameters:
+            endpoint (str): The endpoint, relative to `server`.
+            timeout (float, optional): Timeout in seconds. Defaults to the client's timeout.
+            kwargs: Passed on to `requests.Session.get`.
+        Returns:
+            requests.Response: The response, whatever its status.
+        """
+        return self.session.get(self.url_for(endpoint), timeout=timeout or self.timeout, **kwargs)
+
+    def get_json(self, endpoint: str, timeout: float = None):
+        """
+        Sends a GET request to an API endpoint and returns the decoded JSON response.
+
+        Raises:
+            requests.HTTPError: If PrairieLearn responds with an error status.
+        """
+        response = self.get(endpoint, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        """
+        Closes every pooled connection.
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
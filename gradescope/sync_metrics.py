@@ -0,0 +1,157 @@
+# Timers and counters for the stages of one sync run, reported as a JSON summary and, optionally, a Prometheus textfile.
+# This file is shared by the Gradescope, PrairieLearn and iClicker sync scripts. Each is deployed from its own folder,
+# so an identical copy lives in each of them; keep the copies in sync.
+
+from contextlib import contextmanager
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Prefix of every metric in the Prometheus textfile.
+METRIC_PREFIX = "gradesync_sync"
+# Characters escaped in label values by the Prometheus text format.
+LABEL_VALUE_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+
+
+class SyncMetrics:
+    """
+    Collects how long each stage of a sync run takes and how often things happen during it. This is thread-safe,
+    so stages that run in worker threads, such as the download of one assignment, can be timed where they run.
+
+    A stage can be timed many times in one run; its summary has the number of calls, their total and their maximum.
+    Stages that run concurrently add up their calls, so their total can be longer than the run itself.
+    """
+
+    def __init__(self, job):
+        """
+        Args:
+            job (String): The name of the sync, e.g. "gradescope". It labels the summary and every Prometheus metric.
+        """
+        self.job = job
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        # Maps stage names to [number of calls, total seconds, maximum seconds], in the order stages first finish.
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Times the block it wraps as one call of `stage`. The call is recorded even if the block raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        """
+        Records one call of `stage` that took `seconds`.
+        """
+        with self.lock:
+            calls = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            calls[0] += 1
+            calls[1] += seconds
+            calls[2] = max(calls[2], seconds)
+
+    def increment(self, counter, amount=1):
+        """
+        Adds `amount` to `counter`, which starts at 0.
+        """
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def summary(self, status="success"):
+        """
+        Returns the metrics of the run so far.
+
+        Args:
+            status (String): How the run ended: "success" or "failure".
+        Returns:
+            dict: The job, status, start time (Unix seconds), duration, and, for each stage, its number of calls
+            and their total and maximum seconds, and the value of each counter.
+        """
+        with self.lock:
+            return {
+                "job": self.job,
+                "status": status,
+                "started_at": round(self.started_at, 3),
+                "duration_seconds": round(time.perf_counter() - self.start, 6),
+                "stages": {stage: {"calls": calls, "total_seconds": round(total, 6), "max_seconds": round(maximum, 6)}
+                           for stage, (calls, total, maximum) in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def report(self, status="success", textfile_path=None):
+        """
+        Logs the summary of the run as one line of JSON, and writes it to `textfile_path` in the Prometheus text format
+        if one is given. Call it once, at the end of the run. A textfile that cannot be written is logged and skipped.
+
+        Args:
+            status (String): How the run ended: "success" or "failure".
+            textfile_path (String, optional): Where to write the metrics for the node exporter's textfile collector.
+        Returns:
+            dict: The summary.
+        """
+        summary = self.summary(status)
+        logger.info(f"Sync metrics: {json.dumps(summary, sort_keys=True)}")
+        if textfile_path:
+            try:
+                write_prometheus_textfile(summary, textfile_path)
+            except OSError as e:
+                logger.warning(f"Could not write the metrics textfile {textfile_path}: {e}")
+        return summary
+
+
+def format_labels(labels):
+    """
+    Formats a dict of labels as `name="value",...`, escaping the values as the Prometheus text format requires.
+    """
+    return ",".join(f'{name}="{str(value).translate(LABEL_VALUE_ESCAPES)}"' for name, value in labels.items())
+
+
+def to_prometheus_text(summary):
+    """
+    Renders a summary returned by SyncMetrics.summary in the Prometheus text exposition format.
+    Every metric is a gauge describing the last run, as the file is replaced after every run.
+    """
+    job = {"job": summary["job"]}
+    metrics = [
+        ("run_success", "1 if the last run succeeded, 0 if it failed.",
+         [(job, 1 if summary["status"] == "success" else 0)]),
+        ("run_started_timestamp_seconds", "When the last run started, in Unix seconds.", [(job, summary["started_at"])]),
+        ("run_duration_seconds", "How long the last run took.", [(job, summary["duration_seconds"])]),
+        ("stage_calls", "The number of times each stage ran in the last run.",
+         [({**job, "stage": stage}, stats["calls"]) for stage, stats in summary["stages"].items()]),
+        ("stage_seconds", "The total time spent in each stage in the last run.",
+         [({**job, "stage": stage}, stats["total_seconds"]) for stage, stats in summary["stages"].items()]),
+        ("stage_max_seconds", "The longest single call of each stage in the last run.",
+         [({**job, "stage": stage}, stats["max_seconds"]) for stage, stats in summary["stages"].items()]),
+        ("events", "How many times each counted event happened in the last run.",
+         [({**job, "counter": counter}, value) for counter, value in summary["counters"].items()]),
+    ]
+    lines = []
+    for name, help_text, samples in metrics:
+        lines += [f"# HELP {METRIC_PREFIX}_{name} {help_text}", f"# TYPE {METRIC_PREFIX}_{name} gauge"]
+        lines += [f"{METRIC_PREFIX}_{name}{{{format_labels(labels)}}} {value}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(summary, path):
+    """
+    Writes a summary to `path` in the Prometheus text format. The file is replaced atomically, so the textfile
+    collector never reads a partial file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as textfile:
+        textfile.write(to_prometheus_text(summary))
+    os.replace(temporary_path, path)
@@ -16,9 +16,13 @@ import time
 import gspread
 import pandas as pd
 from google.oauth2.service_account import Credentials
+import raw_data_cache
+import sync_metrics
 
 load_dotenv()
 
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
 ICLICKER_USERNAME = os.getenv("ICLICKER_USERNAME")
 ICLICKER_PASSWORD = os.getenv("ICLICKER_PASSWORD")
 
@@ -40,6 +44,17 @@ client = gspread.authorize(credentials)
 base_dir = os.path.dirname(os.path.abspath(__file__)) # path to folder
 download_dir = os.path.join(base_dir, "iclicker_csv_exports") # ensure folder exists
 
+# local parquet cache of the raw attendance exports, shared with the other syncs (see raw_data_cache.py)
+# a relative path is relative to this folder; leave RAW_DATA_CACHE_PATH unset to disable the cache
+RAW_DATA_CACHE_PATH = config.get("RAW_DATA_CACHE_PATH")
+raw_data = raw_data_cache.RawDataCache(os.path.join(base_dir, RAW_DATA_CACHE_PATH)) if RAW_DATA_CACHE_PATH else None
+
+# timings and counts for each stage of the run, logged as json when the run ends (see sync_metrics.py)
+# if METRICS_TEXTFILE_PATH is set (relative to this folder), they are also written there in the prometheus text format
+METRICS = sync_metrics.SyncMetrics("iclicker")
+METRICS_TEXTFILE_PATH = config.get("METRICS_TEXTFILE_PATH")
+METRICS_TEXTFILE_PATH = os.path.join(base_dir, METRICS_TEXTFILE_PATH) if METRICS_TEXTFILE_PATH else None
+
 
 def selenium_bot():
     """
@@ -71,83 +86,87 @@ def selenium_bot():
 
     # bot signs in with credentials
     try:
-        # check if there is a cookie tab that needs to be closed. 
-        try:
-            close_button = WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "button.onetrust-close-btn-handler"))
-            )
-            close_button.click()
-            logging.info("Closed cookie banner")
-        except Exception as e:
-            # If it times out or the button isn't found/clickable, this will be triggered
-            logging.info("No cookie banner found or not clickable")
+        with METRICS.timer("login"):
+            # check if there is a cookie tab that needs to be closed. 
+            try:
+                close_button = WebDriverWait(driver, 5).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, "button.onetrust-close-btn-handler"))
+                )
+                close_button.click()
+                logging.info("Closed cookie banner")
+            except Exception as e:
+                # If it times out or the button isn't found/clickable, this will be triggered
+                logging.info("No cookie banner found or not clickable")
 
-        time.sleep(3)
-        WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.LINK_TEXT, "Sign in through your campus portal"))).click()
-        logging.info("Clicked campus portal login")
-        WebDriverWait(driver, 20).until(EC.visibility_of_element_located((By.ID, "institute")))
-        select_institution = Select(driver.find_element(By.ID, "institute"))
-        select_institution.select_by_visible_text("University of California Berkeley")
-        WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.CSS_SELECTOR, ".btn-primary"))).click()
+            time.sleep(3)
+            WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.LINK_TEXT, "Sign in through your campus portal"))).click()
+            logging.info("Clicked campus portal login")
+            WebDriverWait(driver, 20).until(EC.visibility_of_element_located((By.ID, "institute")))
+            select_institution = Select(driver.find_element(By.ID, "institute"))
+            select_institution.select_by_visible_text("University of California Berkeley")
+            WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.CSS_SELECTOR, ".btn-primary"))).click()
 
-        WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.ID, 'username'))).send_keys(ICLICKER_USERNAME)
-        WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.ID, 'password'))).send_keys(ICLICKER_PASSWORD)
-        WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.NAME, 'submit'))).click()
-        logging.info("Submitted login credentials")
+            WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.ID, 'username'))).send_keys(ICLICKER_USERNAME)
+            WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.ID, 'password'))).send_keys(ICLICKER_PASSWORD)
+            WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.NAME, 'submit'))).click()
+            logging.info("Submitted login credentials")
 
-        logging.info("Waiting for Duo authentication...")
+            logging.info("Waiting for Duo authentication...")
 
-        # allow time for duo authentication
-        time.sleep(15)  
+            # allow time for duo authentication
+            time.sleep(15)  
 
-        #Click this is my device button 
-        WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.ID, "trust-browser-button"))).click()
-        time.sleep(5)
+            #Click this is my device button 
+            WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.ID, "trust-browser-button"))).click()
+            time.sleep(5)
 
         # iterate over courses so bot can access lecture, lab, and discussion data without another duo push
         for course_name in COURSES:
             try:
-                logging.info(f"Processing course: {course_name}")
-                driver.get("https://instructor.iclicker.com/#/courses")
-                time.sleep(5)
-
-                # click course
-                WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, f"button[title='{course_name}']"))
-                ).click()
+                with METRICS.timer("course_export"):
+                    logging.info(f"Processing course: {course_name}")
+                    driver.get("https://instructor.iclicker.com/#/courses")
+                    time.sleep(5)
+
+                    # click course
+                    WebDriverWait(driver, 20).until(
+                        EC.element_to_be_clickable((By.CSS_SELECTOR, f"button[title='{course_name}']"))
+                    ).click()
                 
-                # click attendance
-                WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'Attendance')]"))
-                ).click()
+                    # click attendance
+                    WebDriverWait(driver, 20).until(
+                        EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'Attendance')]"))
+                    ).click()
 
-                # click export
-                WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Export')]"))
-                ).click()
+                    # click export
+                    WebDriverWait(driver, 20).until(
+                        EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Export')]"))
+                    ).click()
 
-                # select all files
-                time.sleep(2)
-                WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.ID, "check-box-header"))).click()
+                    # select all files
+                    time.sleep(2)
+                    WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.ID, "check-box-header"))).click()
 
-                # click export button
-                time.sleep(2)
-                WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable((By.XPATH, "//button[@type='submit' and contains(text(), 'Export')]"))
-                ).click()
+                    # click export button
+                    time.sleep(2)
+                    WebDriverWait(driver, 20).until(
+                        EC.element_to_be_clickable((By.XPATH, "//button[@type='submit' and contains(text(), 'Export')]"))
+                    ).click()
 
-                time.sleep(10)
+                    time.sleep(10)
 
-                # track which file belongs to which course
-                csv_files = glob.glob(os.path.join(download_dir, "*.csv"))
-                exported_files[course_name] = max(csv_files, key=os.path.getmtime)
+                    # track which file belongs to which course
+                    csv_files = glob.glob(os.path.join(download_dir, "*.csv"))
+                    exported_files[course_name] = max(csv_files, key=os.path.getmtime)
 
             except Exception as e:
                 logging.error(f"Error processing {course_name}: {e}")
+                METRICS.increment("export_failures")
                 continue  
 
     except Exception as e:
         logging.error(f"Login error: {e}")
+        METRICS.increment("login_failures")
 
     finally:
         driver.quit()
@@ -162,30 +181,42 @@ def export_to_google_sheets(course_name, file_path):
     """
     
     logging.info(f"Exporting {course_name} CSV to Google Sheets...")
-    df = pd.read_csv(file_path)
-    df["Total Tracked"] = df["Total Absent"] + df["Total Present"] + df["Total Excused"]
+    if raw_data:
+        # keep the raw export, as the local csv is deleted once it is uploaded
+        # the cache is optional, so a failed write must not stop the upload
+        try:
+            with open(file_path, "rb") as export_file:
+                raw_data.write(course_name, "iclicker", "attendance", export_file.read(), "text/csv")
+        except Exception as e:
+            logging.error(f"Error caching the raw export of {course_name}: {e}")
+    with METRICS.timer("csv_build"):
+        df = pd.read_csv(file_path)
+        df["Total Tracked"] = df["Total Absent"] + df["Total Present"] + df["Total Excused"]
 
-    # convert attendance values to binary (0 = absent, 1 = present/excused)
-    status_map = {"ABSENT": 0, "PRESENT": 1, "EXCUSED": 1}
-    df.replace(status_map, inplace=True)
-    df = df.dropna(subset=['Student Name'])  # remove empty rows
+        # convert attendance values to binary (0 = absent, 1 = present/excused)
+        status_map = {"ABSENT": 0, "PRESENT": 1, "EXCUSED": 1}
+        df.replace(status_map, inplace=True)
+        df = df.dropna(subset=['Student Name'])  # remove empty rows
 
-    # convert dataframe to a list format for google sheets
-    sheet_data = [df.columns.tolist()] + df.astype(str).values.tolist()
+        # convert dataframe to a list format for google sheets
+        sheet_data = [df.columns.tolist()] + df.astype(str).values.tolist()
+    METRICS.increment("rows", len(sheet_data) - 1)
 
     try:
-        sheet = client.open_by_key(SPREADSHEET_ID)
+        with METRICS.timer("sheets_metadata"):
+            sheet = client.open_by_key(SPREADSHEET_ID)
 
-        # use course name as sheet name
-        sheet_name = course_name.replace(" ", "_")
+            # use course name as sheet name
+            sheet_name = course_name.replace(" ", "_")
 
-        try:
-            worksheet = sheet.worksheet(sheet_name)
-            worksheet.clear()
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = sheet.add_worksheet(title=sheet_name, rows="100", cols="20")
+            try:
+                worksheet = sheet.worksheet(sheet_name)
+                worksheet.clear()
+            except gspread.exceptions.WorksheetNotFound:
+                worksheet = sheet.add_worksheet(title=sheet_name, rows="100", cols="20")
 
-        worksheet.update(sheet_data)
+        with METRICS.timer("sheets_write"):
+            worksheet.update(sheet_data)
         logging.info(f"Successfully uploaded {course_name} data to Google Sheets")
 
         # delete the local csv after uploading
@@ -194,6 +225,7 @@ def export_to_google_sheets(course_name, file_path):
 
     except Exception as e:
         logging.error(f"Error exporting {course_name} to Google Sheets: {e}")
+        METRICS.increment("upload_failures")
 
 
 def main():
@@ -202,11 +234,18 @@ def main():
     """
     
     logging.info("Starting main function")
-    exported_files = selenium_bot()
+    with METRICS.timer("browser_session"):
+        exported_files = selenium_bot()
+    METRICS.increment("courses", len(COURSES))
+    METRICS.increment("exports", len(exported_files))
 
     for course, file_path in exported_files.items():
         export_to_google_sheets(course, file_path)
 
+    # a course that could not be exported or uploaded is only logged, so the run fails if any course is missing
+    failed = METRICS.counters.get("upload_failures", 0) or len(exported_files) < len(COURSES)
+    METRICS.report("failure" if failed else "success", METRICS_TEXTFILE_PATH)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,151 @@
+#!/usr/local/bin/python
+"""
+Benchmarks the PrairieLearn gradebook transforms in pl_transforms.py against the row-by-row implementation they replaced,
+on synthetic data, and checks that both produce the same pivot table.
+
+Usage (from the prairieLearn folder):
+    python benchmarks/benchmark_transforms.py [--students 2000] [--assessments 20] [--questions 5] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import pl_transforms
+
+
+def make_synthetic_course(number_of_students, number_of_assessments, questions_per_assessment, seed=0):
+    """
+    Builds synthetic gradebook and instance questions responses shaped like the PrairieLearn API's.
+
+    Returns:
+        tuple: (gradebook_data, instance_questions_by_instance_id)
+    """
+    rng = random.Random(seed)
+    gradebook_data = []
+    instance_questions_by_instance_id = {}
+    next_instance_id = 1
+    for student in range(number_of_students):
+        assessments = []
+        for assessment in range(number_of_assessments):
+            # Roughly one in ten students has not started a given assessment.
+            if rng.random() < 0.1:
+                assessments.append({"assessment_name": f"hw{assessment}", "assessment_instance_id": None})
+                continue
+            instance_id = next_instance_id
+            next_instance_id += 1
+            assessments.append({"assessment_name": f"hw{assessment}", "assessment_instance_id": instance_id})
+            instance_questions_by_instance_id[instance_id] = [
+                {
+                    "zone_number": question // 2 + 1,
+                    "zone_title": f"Zone {question // 2 + 1}",
+                    "question_name": f"hw{assessment}/q{question}",
+                    "instance_question_id": instance_id * 100 + question,
+                    "instance_question_points": rng.choice([0, 0.5, 1, 2, None]),
+                    "assessment_question_max_points": 2,
+                    "instance_question_score_perc": rng.random() * 100,
+                    "instance_question_auto_points": rng.random(),
+                    "assessment_question_max_auto_points": 2,
+                    "instance_question_manual_points": 0,
+                    "assessment_question_max_manual_points": 0,
+                    "highest_submission_score": rng.random(),
+                    "last_submission_score": rng.random(),
+                    "number_attempts": rng.randint(0, 5),
+                    "duration_seconds": rng.randint(0, 3600),
+                }
+                for question in range(questions_per_assessment)
+            ]
+        gradebook_data.append({
+            "user_id": student,
+            "user_uid": f"student{student}@berkeley.edu",
+            "user_uin": str(3030000000 + student),
+            "user_name": f"Student {student}",
+            "user_role": "Student",
+            "assessments": assessments,
+        })
+    return gradebook_data, instance_questions_by_instance_id
+
+
+def legacy_transform(gradebook_data, instance_questions_by_instance_id):
+    """
+    The implementation pl_to_spreadsheet.py used before pl_transforms.py: one gradebook column per assessment filled in
+    with `.at` inside `iterrows`, then one record dict per question.
+    """
+    gradebook_df = pd.DataFrame.from_dict(gradebook_data)
+    for idx, row in gradebook_df.iterrows():
+        for assessment in row['assessments']:
+            gradebook_df.at[idx, assessment["assessment_name"]] = assessment["assessment_instance_id"]
+
+    fixed_cols = ['user_id', 'user_uid', 'user_uin', 'user_name', 'user_role', 'assessments']
+    assessment_columns = [col for col in gradebook_df.columns if col not in fixed_cols]
+    records = []
+    for idx, row in gradebook_df.iterrows():
+        for assessment in assessment_columns:
+            instance_id = row[assessment]
+            if pd.isnull(instance_id):
+                continue
+            for question in instance_questions_by_instance_id[int(instance_id)]:
+                record = {"UID": row.get('user_uid'), "UIN": row.get('user_uin'), "Username": None,
+                          "Name": row.get('user_name'), "Role": row.get('user_role'),
+                          "Assessment": assessment, "Assessment instance": instance_id}
+                for column, field in pl_transforms.INSTANCE_QUESTION_FIELDS.items():
+                    record[column] = question.get(field) if field else None
+                records.append(record)
+    return pd.DataFrame(records)
+
+
+def vectorized_transform(gradebook_data, instance_questions_by_instance_id):
+    """
+    The current implementation, in pl_transforms.py.
+    """
+    student_instances = pl_transforms.flatten_gradebook(gradebook_data)
+    all_instance_questions = [instance_questions_by_instance_id[instance_id]
+                              for instance_id in student_instances["assessment_instance_id"]]
+    return pl_transforms.build_instance_question_table(student_instances, all_instance_questions)
+
+
+def pivot(instance_question_df):
+    """
+    The score pivot that pl_to_spreadsheet.create_pivot_table builds from the instance question table.
+    """
+    return instance_question_df.pivot_table(
+        index='UIN', columns=['Assessment', 'Zone number', 'Zone title'], values='Question points', aggfunc='first'
+    ).sort_index(axis=1)
+
+
+def time_best_of(function, repeat, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--assessments", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    gradebook_data, instance_questions = make_synthetic_course(args.students, args.assessments, args.questions)
+    legacy_seconds, legacy_df = time_best_of(legacy_transform, args.repeat, gradebook_data, instance_questions)
+    vectorized_seconds, vectorized_df = time_best_of(vectorized_transform, args.repeat, gradebook_data, instance_questions)
+
+    pd.testing.assert_frame_equal(pivot(legacy_df), pivot(vectorized_df), check_dtype=False, check_column_type=False)
+
+    print(f"{args.students} students, {args.assessments} assessments, {args.questions} questions each: "
+          f"{len(vectorized_df)} instance question rows")
+    print(f"legacy:     {legacy_seconds:.3f} s")
+    print(f"vectorized: {vectorized_seconds:.3f} s ({legacy_seconds / vectorized_seconds:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# Retry policy for HTTP calls to PrairieLearn and Gradescope.
+# This file is shared by the Gradescope and PrairieLearn sync scripts. Each script is deployed from its own folder,
+# so an identical copy lives next to each of them; keep the copies in sync.
+
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import logging
+import random
+import threading
+import time
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: rate limiting and transient server errors.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryError(Exception):
+    """
+    Raised when a request could not be completed within the retry policy.
+    """
+
+
+class CircuitOpenError(RetryError):
+    """
+    Raised instead of sending a request while the circuit breaker for its host is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after `threshold` failures in a row, until `cooldown` seconds have passed.
+    After the cooldown, requests are let through again; the first success closes the circuit, and a failure reopens it.
+    This is thread-safe.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def seconds_until_retry(self):
+        """
+        Returns the number of seconds until requests are let through again, or 0 if they are let through now.
+        """
+        with self.lock:
+            if self.failures < self.threshold:
+                return 0
+            return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown:
+                    logger.warning(f"Circuit breaker opened after {self.failures} failures in a row")
+                self.opened_at = time.monotonic()
+
+
+def retry_after_seconds(response):
+    """
+    Returns the delay a response asks for in its Retry-After header, in seconds, or None if it does not ask for one.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retries HTTP requests that fail with a timeout, a connection error or a retryable status, with exponential backoff
+    and full jitter, or after the delay the server asks for with Retry-After.
+
+    Every attempt has a timeout of `timeout` seconds, and a request is given up on once `deadline` seconds have passed
+    since its first attempt, or after `max_tries` attempts. Each host has a circuit breaker: after
+    `circuit_breaker_threshold` failed attempts in a row, requests to the host fail immediately with CircuitOpenError,
+    until `circuit_breaker_cooldown` seconds have passed.
+
+    `on_retry`, if set, is called with the URL and the failure (e.g. "status 503") before every retry, to count them.
+    """
+
+    def __init__(self, max_tries=5, base_delay=1.0, max_delay=60.0, timeout=30.0, deadline=300.0,
+                 circuit_breaker_threshold=10, circuit_breaker_cooldown=60.0, on_retry=None):
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.deadline = deadline
+        self.circuit_breaker_threshold = circuit_breaker_threshold
+        self.circuit_breaker_cooldown = circuit_breaker_cooldown
+        self.on_retry = on_retry
+        self.circuit_breakers = {}
+        self.circuit_breakers_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, prefix):
+        """
+        Creates a policy from the keys of a course config that start with `prefix`, e.g. "PL_" for PL_RETRY_MAX_TRIES.
+        Keys that are missing take their default values.
+        """
+        defaults = cls()
+        return cls(
+            max_tries=config.get(f"{prefix}RETRY_MAX_TRIES", defaults.max_tries),
+            base_delay=config.get(f"{prefix}RETRY_BASE_DELAY_SECONDS", defaults.base_delay),
+            max_delay=config.get(f"{prefix}RETRY_MAX_DELAY_SECONDS", defaults.max_delay),
+            timeout=config.get(f"{prefix}REQUEST_TIMEOUT_SECONDS", defaults.timeout),
+            deadline=config.get(f"{prefix}RETRY_DEADLINE_SECONDS", defaults.deadline),
+            circuit_breaker_threshold=config.get(f"{prefix}CIRCUIT_BREAKER_THRESHOLD", defaults.circuit_breaker_threshold),
+            circuit_breaker_cooldown=config.get(f"{prefix}CIRCUIT_BREAKER_COOLDOWN_SECONDS", defaults.circuit_breaker_cooldown),
+        )
+
+    def circuit_breaker_for(self, url):
+        """
+        Returns the circuit breaker of the host of `url`, creating it if needed.
+        """
+        host = urlparse(url).netloc
+        with self.circuit_breakers_lock:
+            if host not in self.circuit_breakers:
+                self.circuit_breakers[host] = CircuitBreaker(self.circuit_breaker_threshold, self.circuit_breaker_cooldown)
+            return self.circuit_breakers[host]
+
+    def wait_for_recovery(self, url):
+        """
+        Sleeps until the circuit breaker of the host of `url` lets requests through again.
+        Call this before retrying requests that were requeued because the circuit was open.
+        """
+        delay = self.circuit_breaker_for(url).seconds_until_retry()
+        if delay > 0:
+            logger.info(f"Waiting {delay:.1f} seconds for {urlparse(url).netloc} to recover")
+            time.sleep(delay)
+
+    def backoff_delay(self, attempt):
+        """
+        Returns a random delay before retry number `attempt` (starting at 1), between 0 and base_delay * 2 ** (attempt - 1), capped at max_delay.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def request(self, send, url):
+        """
+        Sends a request, retrying it according to this policy.
+
+        Args:
+            send (callable): Sends the request once. Called with the keyword argument `timeout`; returns a requests.Response.
+            url (String): The URL of the request, used for its circuit breaker and in log messages.
+        Returns:
+            requests.Response: The first response whose status is not retryable. It may still be an error, such as a 404.
+        Raises:
+            CircuitOpenError: If the circuit breaker for the host is open.
+            RetryError: If the request still failed after max_tries attempts or at the deadline.
+        """
+        circuit_breaker = self.circuit_breaker_for(url)
+        give_up_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if circuit_breaker.seconds_until_retry() > 0:
+                raise CircuitOpenError(f"Not requesting {url}: too many requests to {urlparse(url).netloc} failed in a row")
+            attempt += 1
+            requested_delay = None
+            try:
+                response = send(timeout=self.timeout)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    circuit_breaker.record_success()
+                    return response
+                failure = f"status {response.status_code}"
+                requested_delay = retry_after_seconds(response)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                failure = type(e).__name__
+            circuit_breaker.record_failure()
+            if circuit_breaker.seconds_until_retry() > 0:
+                raise CircuitOpenError(f"Giving up on {url} after {failure}: too many requests to {urlparse(url).netloc} failed in a row")
+
+            delay = requested_delay if requested_delay is not None else self.backoff_delay(attempt)
+            if attempt >= self.max_tries:
+                raise RetryError(f"Giving up on {url} after {attempt} attempts; the last one failed with {failure}")
+            if time.monotonic() + delay > give_up_at:
+                raise RetryError(f"Giving up on {url}: retrying after {failure} would pass the {self.deadline} second deadline")
+            logger.warning(f"Request to {url} failed with {failure}; retrying in {delay:.1f} seconds (attempt {attempt} of {self.max_tries})")
+            if self.on_retry is not None:
+                self.on_retry(url, failure)
+            time.sleep(delay)
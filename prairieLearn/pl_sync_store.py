@@ -0,0 +1,77 @@
+# Local store of the instance questions fetched by earlier runs, for incremental PrairieLearn syncs.
+
+import json
+import os
+import sqlite3
+
+# Older SQLite builds allow at most 999 parameters per statement, so IDs are passed in chunks below that.
+MAX_IDS_PER_QUERY = 500
+
+
+class InstanceQuestionStore:
+    """
+    Stores the instance questions response of each assessment instance in a SQLite file, together with the instance's
+    modified_at timestamp when it was fetched. That timestamp is the instance's high-water mark: while PrairieLearn
+    reports the same modified_at, the stored response is still current and does not need to be fetched again.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (String): The SQLite file. It and its folder are created if they do not exist.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS instance_questions ("
+                "assessment_instance_id INTEGER PRIMARY KEY, modified_at TEXT NOT NULL, questions TEXT NOT NULL)"
+            )
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self, instance_ids):
+        """
+        Returns the stored entries for the given assessment instances.
+
+        Args:
+            instance_ids (iterable): Assessment instance IDs.
+        Returns:
+            dict: A dict mapping each stored assessment instance ID to (modified_at, instance questions response).
+            Instances that have never been stored are left out.
+        """
+        wanted = sorted({int(instance_id) for instance_id in instance_ids})
+        entries = {}
+        with self.connect() as connection:
+            for start in range(0, len(wanted), MAX_IDS_PER_QUERY):
+                chunk = wanted[start:start + MAX_IDS_PER_QUERY]
+                rows = connection.execute(
+                    "SELECT assessment_instance_id, modified_at, questions FROM instance_questions "
+                    f"WHERE assessment_instance_id IN ({', '.join('?' * len(chunk))})", chunk
+                )
+                for instance_id, modified_at, questions in rows:
+                    entries[instance_id] = (modified_at, json.loads(questions))
+        return entries
+
+    def save(self, entries, present_ids=None):
+        """
+        Stores entries, replacing any stored before for the same assessment instances.
+
+        Args:
+            entries (dict): A dict mapping assessment instance IDs to (modified_at, instance questions response).
+            present_ids (iterable, optional): Every assessment instance ID in the current gradebook. If given, stored
+                entries for other instances (deleted, or no longer in the course) are removed.
+        """
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO instance_questions (assessment_instance_id, modified_at, questions) VALUES (?, ?, ?)",
+                [(int(instance_id), str(modified_at), json.dumps(questions))
+                 for instance_id, (modified_at, questions) in entries.items()]
+            )
+            if present_ids is not None:
+                connection.execute("CREATE TEMP TABLE present_instances (assessment_instance_id INTEGER PRIMARY KEY)")
+                connection.executemany("INSERT OR IGNORE INTO present_instances VALUES (?)",
+                                       [(int(instance_id),) for instance_id in present_ids])
+                connection.execute("DELETE FROM instance_questions WHERE assessment_instance_id NOT IN "
+                                   "(SELECT assessment_instance_id FROM present_instances)")
@@ -10,7 +10,6 @@ import time
 import warnings
 import functools
 from googleapiclient.errors import HttpError
-import gspread
 from googleapiclient.discovery import build
 from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
@@ -19,7 +18,18 @@ import pandas as pd
 import requests
 import logging
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 from pprint import pprint
+import sheets_batch
+import sheets_backend
+import http_retry
+from prairieLearnClient import PrairieLearnClient
+import pl_transforms
+from pl_sync_store import InstanceQuestionStore
+import raw_data_cache
+import sync_metrics
 
 # ------------------------------------------------------------------------------------
 # SECTION 1: Importing credentials, configurations, setting up logging
@@ -27,7 +37,9 @@ from pprint import pprint
 
 load_dotenv()
 PL_API_TOKEN = os.getenv("PL_API_TOKEN")
-PL_SERVER = "https://us.prairielearn.com/pl/api/v1"
+# Set the PL_SERVER environment variable to send PrairieLearn requests to another server, such as the stand-in servers
+# of the benchmarks in /benchmarks.
+PL_SERVER = os.getenv("PL_SERVER", "https://us.prairielearn.com/pl/api/v1")
 
 # Configure logging to output to both file and console
 logging.basicConfig(
@@ -54,6 +66,60 @@ PL_COURSE_ID = str(config["PL_COURSE_ID"])
 SCOPES = config["SCOPES"]
 SPREADSHEET_ID = config["SPREADSHEET_ID"]
 
+# Concurrency limits for PrairieLearn API calls.
+# PL_MAX_CONCURRENT_REQUESTS bounds the number of requests in flight at once;
+# PL_MAX_REQUESTS_PER_SECOND bounds how quickly new requests are started against one host.
+PL_MAX_CONCURRENT_REQUESTS = config.get("PL_MAX_CONCURRENT_REQUESTS", 8)
+PL_MAX_REQUESTS_PER_SECOND = config.get("PL_MAX_REQUESTS_PER_SECOND", 10)
+
+# Retry policy for PrairieLearn API calls: per-request timeout, exponential backoff with jitter, Retry-After,
+# an overall deadline per request, and a circuit breaker. See http_retry.py for the PL_* keys that tune it.
+PL_RETRY_POLICY = http_retry.RetryPolicy.from_config(config, "PL_")
+
+# Timings and counts for each stage of the run, logged as JSON when the run ends. See sync_metrics.py.
+# If METRICS_TEXTFILE_PATH is set (relative to this folder), they are also written there in the Prometheus text format,
+# for the node exporter's textfile collector.
+METRICS = sync_metrics.SyncMetrics("prairielearn")
+METRICS_TEXTFILE_PATH = config.get("METRICS_TEXTFILE_PATH")
+METRICS_TEXTFILE_PATH = os.path.join(os.path.dirname(__file__), METRICS_TEXTFILE_PATH) if METRICS_TEXTFILE_PATH else None
+PL_RETRY_POLICY.on_retry = lambda url, failure: METRICS.increment("pl_retries")
+
+# One client for every PrairieLearn call, so that connections are reused across the thousands of instance question calls.
+PL_CLIENT = PrairieLearnClient(PL_API_TOKEN, PL_SERVER, pool_size=PL_MAX_CONCURRENT_REQUESTS, timeout=PL_RETRY_POLICY.timeout)
+
+# Budgets for the batchUpdate calls that paste data into the spreadsheet. See sheets_batch.py.
+SHEETS_BATCH_MAX_BYTES = config.get("SHEETS_BATCH_MAX_BYTES", sheets_batch.DEFAULT_MAX_BATCH_BYTES)
+SHEETS_BATCH_MAX_REQUESTS = config.get("SHEETS_BATCH_MAX_REQUESTS", sheets_batch.DEFAULT_MAX_REQUESTS_PER_BATCH)
+SHEETS_MAX_BATCHES_PER_MINUTE = config.get("SHEETS_MAX_BATCHES_PER_MINUTE", sheets_batch.DEFAULT_MAX_BATCHES_PER_MINUTE)
+# Set the SHEETS_API_ENDPOINT environment variable to send Google Sheets requests to another server. Defaults to Google's.
+SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT")
+# Set the SHEETS_BACKEND environment variable to "memory" or "sqlite:<path>" to write to a stand-in spreadsheet instead
+# of Google Sheets, without credentials. See sheets_backend.py.
+SHEETS_BACKEND = os.getenv("SHEETS_BACKEND", sheets_backend.GOOGLE_BACKEND)
+
+# File caching the course's assessment metadata (assessment names and titles) between runs.
+# It is refreshed once it is older than ASSESSMENT_METADATA_MAX_AGE_SECONDS, or when the gradebook has an assessment it does not know.
+# On Cloud Run, point this at a mounted volume so that it persists between runs.
+ASSESSMENT_METADATA_CACHE_PATH = config.get("ASSESSMENT_METADATA_CACHE_PATH",
+                                            os.path.join(os.path.dirname(__file__), 'cache/', f'assessments_{PL_COURSE_ID}.json'))
+ASSESSMENT_METADATA_MAX_AGE_SECONDS = config.get("ASSESSMENT_METADATA_MAX_AGE_SECONDS", 24 * 60 * 60)
+
+# Incremental sync: the instance questions of each assessment instance are stored locally with the instance's modified_at,
+# and only instances modified since they were stored are fetched again. Delete the file to fetch every instance again.
+# On Cloud Run, point PL_SYNC_STORE_PATH at a mounted volume so that it persists between runs.
+PL_INCREMENTAL_SYNC = config.get("PL_INCREMENTAL_SYNC", True)
+PL_SYNC_STORE_PATH = config.get("PL_SYNC_STORE_PATH",
+                                os.path.join(os.path.dirname(__file__), 'cache/', f'instance_questions_{PL_COURSE_ID}.sqlite'))
+
+# Local Parquet cache of the raw responses fetched from PrairieLearn, shared with the other syncs. See raw_data_cache.py.
+# The gradebook is stored as assignment "gradebook", and the instance questions of each assessment under its name.
+# A relative path is relative to this folder; leave RAW_DATA_CACHE_PATH unset to disable the cache.
+# A gradebook cached less than RAW_DATA_MAX_AGE_SECONDS ago is read from the cache instead of fetched again.
+# The default of 0 always fetches.
+RAW_DATA_CACHE_PATH = config.get("RAW_DATA_CACHE_PATH")
+RAW_DATA_MAX_AGE_SECONDS = config.get("RAW_DATA_MAX_AGE_SECONDS", 0)
+RAW_DATA_CACHE = raw_data_cache.RawDataCache(os.path.join(os.path.dirname(__file__), RAW_DATA_CACHE_PATH)) if RAW_DATA_CACHE_PATH else None
+
 # These constants are deprecated. 
 # The following explanation is for what their purpose was: 
 # ASSIGNMENT_ID is for users who wish to generate a sub-sheet (not update the dashboard) for one assignment. 
@@ -89,10 +155,18 @@ def deprecated(func):
 
 # Connect the script to the Google Sheets API through authorizing the google cloud service account
 # The service account is created in order to automatically run the script in a Google Cloud Run Service through the docker containerization of a cron job.
-credentials_json = os.getenv("SERVICE_ACCOUNT_CREDENTIALS")
-credentials_dict = json.loads(credentials_json)
-credentials = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
-client = gspread.authorize(credentials)
+# The credentials are loaded on first use, so that runs against a stand-in SHEETS_BACKEND need none.
+@functools.lru_cache(maxsize=None)
+def load_credentials():
+    """
+    Loads the service account credentials from the SERVICE_ACCOUNT_CREDENTIALS environment variable.
+
+    Returns:
+        google.oauth2.service_account.Credentials: The credentials.
+    """
+    credentials_dict = json.loads(os.getenv("SERVICE_ACCOUNT_CREDENTIALS"))
+    return Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+
 
 
 def create_sheet_and_request_to_populate_it(sheet_api_instance, assignment_scores, assignment_name = ASSIGNMENT_NAME):
@@ -100,7 +174,7 @@ def create_sheet_and_request_to_populate_it(sheet_api_instance, assignment_score
     Creates a sheet and adds the request that will populate the sheet to request_list.
 
     Args:
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
         assignment_scores (String): The csv containing assignment scores
         assignment_name (String): The name of the assignment as listed on Gradescope
 
@@ -137,7 +211,20 @@ def create_sheet_and_request_to_populate_it(sheet_api_instance, assignment_score
         logger.error(f"An unknown error has occurred: {err}")
 
 
+@functools.lru_cache(maxsize=None)
 def create_sheet_api_instance():
+    """
+    Creates the sheet api instance of the SHEETS_BACKEND: the Google Sheets API, or a stand-in spreadsheet.
+    Every call is counted in METRICS. The instance is created once and shared.
+
+    Returns:
+        sheets_backend.SheetsBackend: The sheet api instance.
+    """
+    return sheets_backend.create_backend(SHEETS_BACKEND, build_sheets_resource, metrics=METRICS,
+                                         directory=os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_sheets_resource():
     """
     Creates a sheet api instance through the googleapiclient library.
     The build function references "from googleapiclient.discovery import build" in the imports.
@@ -145,9 +232,9 @@ def create_sheet_api_instance():
     Returns:
         googleapiclient.discovery.Resource: The sheet api instance.
     """
-    service = build("sheets", "v4", credentials=credentials)
-    sheet_api_instance = service.spreadsheets()
-    return sheet_api_instance
+    client_options = {"api_endpoint": SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+    service = build("sheets", "v4", credentials=load_credentials(), client_options=client_options)
+    return service.spreadsheets()
 
 
 def get_sub_sheet_titles_to_ids(sheet_api_instance):
@@ -156,7 +243,7 @@ def get_sub_sheet_titles_to_ids(sheet_api_instance):
     return it. If not, retrieve that info from Google sheets.
 
     Args:
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
 
     Returns:
         dict: A dict mapping subsheet names (titles) to sheet ids.
@@ -165,8 +252,9 @@ def get_sub_sheet_titles_to_ids(sheet_api_instance):
     if subsheet_titles_to_ids:
         return subsheet_titles_to_ids
     logger.info("Retrieving subsheet titles to ids")
-    request = sheet_api_instance.get(spreadsheetId=SPREADSHEET_ID, fields='sheets/properties')
-    sheets = make_request(request)
+    with METRICS.timer("sheets_metadata"):
+        request = sheet_api_instance.get(spreadsheetId=SPREADSHEET_ID, fields='sheets/properties')
+        sheets = make_request(request)
     subsheet_titles_to_ids = {sheet['properties']['title']: sheet['properties']['sheetId'] for sheet in
                                sheets['sheets']}
     return subsheet_titles_to_ids
@@ -198,7 +286,7 @@ def backoff_handler(backoff_response=None):
     """
     global number_of_retries_needed_to_update_sheet
     number_of_retries_needed_to_update_sheet += 1
-    pass
+    METRICS.increment("sheets_retries")
 
 
 def store_request(request):
@@ -267,7 +355,7 @@ def retrieve_preexisting_columns(assignment_type, sheet_api_instance):
 
     Args:
         assignment_type (String): One of the following assignment types: ["Labs", "Discussions", "Projects", "Midterms", "Postterms", "Pyturis"]
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
     Returns:
         None
     """
@@ -279,21 +367,27 @@ def retrieve_preexisting_columns(assignment_type, sheet_api_instance):
 
 def make_batch_request(sheet_api_instance):
     """
-    Executes a batch request including all requests in our running list: request_list
+    Executes all requests in our running list, request_list, in as few batch requests as the configured budgets allow.
+    Chunks that fail are retried on their own, so chunks that were already applied are not sent again.
 
     Args:
-        sheet_api_instance (googleapiclient.discovery.Resource): The sheet api instance
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
     Returns:
         None
     """
     global request_list
-    rest_batch_request = {
-        "requests": request_list
-    }
-    batch_request = sheet_api_instance.batchUpdate(spreadsheetId=SPREADSHEET_ID, body=rest_batch_request)
+    if not request_list:
+        logger.info(f"No requests to issue; skipping batch request")
+        return
     logger.info(f"Issuing batch request")
-    make_request(batch_request)
+    METRICS.increment("sheets_requests", len(request_list))
+    with METRICS.timer("batch_write"):
+        responses = sheets_batch.execute_batches(sheet_api_instance, SPREADSHEET_ID, request_list,
+                                                 max_bytes=SHEETS_BATCH_MAX_BYTES, max_requests=SHEETS_BATCH_MAX_REQUESTS,
+                                                 max_batches_per_minute=SHEETS_MAX_BATCHES_PER_MINUTE, on_backoff=backoff_handler)
+    METRICS.increment("sheets_batches", len(responses))
     logger.info(f"Completing batch request")
+    request_list = []
     
 
 # ------------------------------------------------------------------------------------
@@ -339,148 +433,297 @@ def create_pivot_table(instance_question_df):
 
     return final_df_with_column_nums
 
-def assessment_name_mapping(instance_question_df):
-    '''
+def load_assessment_metadata():
+    """
+    Loads the assessment metadata cached by an earlier run.
+
+    Returns:
+        list: The cached response of the assessments endpoint, or None if there is none or it is older than ASSESSMENT_METADATA_MAX_AGE_SECONDS.
+    """
+    if not os.path.exists(ASSESSMENT_METADATA_CACHE_PATH):
+        return None
+    try:
+        with open(ASSESSMENT_METADATA_CACHE_PATH, "r") as cache_file:
+            cached = json.load(cache_file)
+    except (OSError, ValueError) as err:
+        logger.warning(f"Could not read assessment metadata cache at {ASSESSMENT_METADATA_CACHE_PATH}: {err}")
+        return None
+    if time.time() - cached.get("fetched_at", 0) > ASSESSMENT_METADATA_MAX_AGE_SECONDS:
+        logger.info("Cached assessment metadata has expired")
+        return None
+    return cached.get("assessments")
+
+
+def save_assessment_metadata(assessments):
+    """
+    Caches the response of the assessments endpoint for later runs. The file is replaced atomically.
+    """
+    try:
+        os.makedirs(os.path.dirname(ASSESSMENT_METADATA_CACHE_PATH), exist_ok=True)
+        temporary_path = ASSESSMENT_METADATA_CACHE_PATH + ".tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump({"fetched_at": time.time(), "assessments": assessments}, cache_file)
+        os.replace(temporary_path, ASSESSMENT_METADATA_CACHE_PATH)
+    except OSError as err:
+        logger.warning(f"Could not write assessment metadata cache at {ASSESSMENT_METADATA_CACHE_PATH}: {err}")
 
-    - Rename the columns in the instance_question_df to the assessment title
-    - Use the assessment endpoint to create a mapping of the assessment name to the assessment title
-    - Rename the columns in the instance_question_df to the assessment title
 
-    '''
+def get_assessment_metadata(assessment_names):
+    """
+    Returns the course's assessment metadata, from the local cache if it is fresh and knows every assessment in
+    assessment_names, or from the PrairieLearn assessments endpoint otherwise.
 
-    course_instance_path = f"/course_instances/{PL_COURSE_ID}"
+    Args:
+        assessment_names (iterable): The assessment names that need a title.
+    Returns:
+        list: The response of the assessments endpoint: one dict per assessment, with "assessment_name" and "title".
+    """
+    assessments = load_assessment_metadata()
+    if assessments is not None:
+        known_names = {assessment["assessment_name"] for assessment in assessments}
+        if known_names.issuperset(assessment_names):
+            logger.info("Using cached assessment metadata")
+            METRICS.increment("assessment_metadata_cache_hits")
+            return assessments
+        logger.info("Cached assessment metadata is missing assessments; refreshing it")
 
+    course_instance_path = f"/course_instances/{PL_COURSE_ID}"
     assessments = call_pl_api(f"{course_instance_path}/assessments")
+    save_assessment_metadata(assessments)
+    return assessments
+
 
-    assessment_name_mapping = {assessments[i]["assessment_name"]: assessments[i]["title"] for i in range(len(assessments))}
+def assessment_name_mapping(instance_question_df):
+    '''
 
-    for assessment_name, assessment_title in assessment_name_mapping.items():
-        instance_question_df['Assessment'] = instance_question_df['Assessment'].replace(assessment_name, assessment_title)
+    - Use the assessment endpoint (or its local cache) to create a mapping of the assessment name to the assessment title
+    - Rename the assessments in the instance_question_df to the assessment title, in one pass
 
-    return instance_question_df
+    '''
+    assessments = get_assessment_metadata(instance_question_df['Assessment'].dropna().unique())
+    return pl_transforms.rename_assessments(instance_question_df, assessments)
     
 
-def instance_question_endpoint(gradebook_df):
+def instance_question_endpoint(student_instances):
     """
-    For each student (row) in gradebook_df and for each assessment (dynamic column),
-    call the PrairieLearn instance questions endpoint, and build a record for each
-    returned question. The resulting DataFrame will contain one row per question
+    For each assessment instance in student_instances, call the PrairieLearn instance questions endpoint,
+    and build a record for each returned question. The resulting DataFrame will contain one row per question
     with columns:
     UID, UIN, Username, Name, Role, Assessment, Assessment instance,
     Zone number, Zone title, Question, Question instance, Question points,
     Max points, Question % score, Auto points, Max auto points, Manual points,
     Max manual points, Date, Highest submission score, Last submission score,
     Number attempts, Duration seconds, Assigned manual grader, Last manual grader.
+
+    If PL_INCREMENTAL_SYNC is set, instances that have not been modified since an earlier run are read from the local store instead.
+
+    Args:
+        student_instances (pandas.DataFrame): One row per (student, assessment instance), as returned by transform_gradebook_df.
     """
-    records = []
-    # Columns in original gradebook DataFrame.
-    fixed_cols = ['user_id', 'user_uid', 'user_uin', 'user_name', 'user_role', 'assessments']
-    # Assessment Columns
-    assessment_columns = [col for col in gradebook_df.columns if col not in fixed_cols]
-
-    for idx, row in gradebook_df.iterrows():
-        for assessment in assessment_columns:
-            instance_id = row[assessment]
-
-            # Skip if this student doesn't have an instance for that assessment.
-            if pd.isnull(instance_id):
-                continue
-
-            # Instance Question endpoint
-            endpoint = f"/course_instances/{PL_COURSE_ID}/assessment_instances/{int(instance_id)}/instance_questions"
-            
-            instance_questions = call_pl_api(endpoint)
-            
-            # Process each instance question.
-            for question in instance_questions:
-                record = {
-                    "UID": row.get('user_uid'),
-                    "UIN": row.get('user_uin'), 
-                    "Username": None, # Leave Empty
-                    "Name": row.get('user_name'),  
-                    "Role": row.get('user_role'),
-                    "Assessment": assessment,
-                    "Assessment instance": instance_id,
-                    "Zone number": question.get('zone_number'),       
-                    "Zone title": question.get('zone_title'),       
-                    "Question": question.get("question_name"),
-                    "Question instance": question.get("instance_question_id"),
-                    "Question points": question.get("instance_question_points"),
-                    "Max points": question.get("assessment_question_max_points"),
-                    "Question % score": question.get("instance_question_score_perc"),
-                    "Auto points": question.get("instance_question_auto_points"),
-                    "Max auto points": question.get("assessment_question_max_auto_points"),
-                    "Manual points": question.get("instance_question_manual_points"),
-                    "Max manual points": question.get("assessment_question_max_manual_points"),
-                    "Date": None,  #
-                    "Highest submission score": question.get("highest_submission_score"),
-                    "Last submission score": question.get("last_submission_score"),
-                    "Number attempts": question.get("number_attempts"),
-                    "Duration seconds": question.get("duration_seconds"),
-                    "Assigned manual grader": None,  # 
-                    "Last manual grader": None         # 
-                }
-                records.append(record)
-    
-    # Convert list of records to a DataFrame.
-    return pd.DataFrame(records)
+    instance_ids = [int(instance_id) for instance_id in student_instances["assessment_instance_id"]]
+    all_instance_questions = [None] * len(instance_ids)
+    indexes_to_fetch = list(range(len(instance_ids)))
+
+    if PL_INCREMENTAL_SYNC:
+        store = InstanceQuestionStore(PL_SYNC_STORE_PATH)
+        modified_times = retrieve_instance_modified_times(student_instances)
+        stored_entries = store.load(instance_ids)
+        indexes_to_fetch = []
+        for index, instance_id in enumerate(instance_ids):
+            modified_at = modified_times.get(instance_id)
+            stored_modified_at, stored_questions = stored_entries.get(instance_id, (None, None))
+            if modified_at is not None and stored_modified_at == str(modified_at):
+                all_instance_questions[index] = stored_questions
+            else:
+                indexes_to_fetch.append(index)
+        logger.info(f"{len(instance_ids) - len(indexes_to_fetch)} of {len(instance_ids)} assessment instances "
+                    f"are unchanged since they were last fetched")
+        METRICS.increment("instances_unchanged", len(instance_ids) - len(indexes_to_fetch))
+    METRICS.increment("instances", len(instance_ids))
+
+    # Instance Question endpoint, fetched for all instances in parallel.
+    def fetch_instance_questions(index):
+        endpoint = f"/course_instances/{PL_COURSE_ID}/assessment_instances/{instance_ids[index]}/instance_questions"
+        all_instance_questions[index] = call_pl_api(endpoint)
+
+    # Instances that cannot be fetched are requeued instead of holding up the rest, and tried once more at the end.
+    requeued = []
+
+    def fetch_or_requeue(index):
+        try:
+            fetch_instance_questions(index)
+        except http_retry.RetryError as err:
+            logger.warning(f"Requeueing assessment instance {instance_ids[index]}: {err}")
+            METRICS.increment("instances_requeued")
+            requeued.append(index)
+
+    logger.info(f"Fetching instance questions for {len(indexes_to_fetch)} assessment instances "
+                f"with {PL_MAX_CONCURRENT_REQUESTS} workers")
+    with METRICS.timer("instance_questions_fetch"), ThreadPoolExecutor(max_workers=PL_MAX_CONCURRENT_REQUESTS) as executor:
+        list(executor.map(fetch_or_requeue, indexes_to_fetch))
+
+    if requeued:
+        # Any instance that still fails now stops the sync, as the spreadsheet would otherwise be missing its scores.
+        logger.info(f"Retrying {len(requeued)} requeued assessment instances")
+        PL_RETRY_POLICY.wait_for_recovery(PL_SERVER)
+        with METRICS.timer("instance_questions_fetch"), ThreadPoolExecutor(max_workers=PL_MAX_CONCURRENT_REQUESTS) as executor:
+            list(executor.map(fetch_instance_questions, requeued))
+
+    if PL_INCREMENTAL_SYNC:
+        # Each stored response is paired with the modified_at read before it was fetched, so an instance modified
+        # in between is simply fetched again next time. Instances no longer in the gradebook are dropped.
+        store.save({instance_ids[index]: (modified_times[instance_ids[index]], all_instance_questions[index])
+                    for index in indexes_to_fetch if modified_times.get(instance_ids[index]) is not None},
+                   present_ids=instance_ids)
+
+    if RAW_DATA_CACHE:
+        cache_instance_questions(student_instances, all_instance_questions)
+
+    with METRICS.timer("transform"):
+        return pl_transforms.build_instance_question_table(student_instances, all_instance_questions)
+
+
+def cache_instance_questions(student_instances, all_instance_questions):
+    """
+    Stores the instance questions of each assessment in RAW_DATA_CACHE, as one JSON object mapping
+    each of its assessment instance IDs to that instance's instance questions response.
+    Assessments whose responses are unchanged since they were last stored are not written again.
 
+    Args:
+        student_instances (pandas.DataFrame): One row per (student, assessment instance), as returned by transform_gradebook_df.
+        all_instance_questions (list): For each row of student_instances, in order, its instance questions response.
+    """
+    responses_by_assessment = {}
+    for assessment_name, instance_id, instance_questions in zip(
+            student_instances["assessment_name"], student_instances["assessment_instance_id"], all_instance_questions):
+        responses_by_assessment.setdefault(assessment_name, {})[str(instance_id)] = instance_questions
+    for assessment_name, responses in responses_by_assessment.items():
+        RAW_DATA_CACHE.write(PL_COURSE_ID, "prairielearn", assessment_name,
+                             json.dumps(responses, sort_keys=True), "application/json")
 
-    
 
-def transform_gradebook_df(gradebook_df):
+def retrieve_instance_modified_times(student_instances):
+    """
+    Returns when each assessment instance was last modified. The gradebook's modified_at is used where it is reported;
+    otherwise the assessment_instances endpoint of each assessment is called, which is one call per assessment
+    rather than one per instance.
+
+    Args:
+        student_instances (pandas.DataFrame): One row per (student, assessment instance), as returned by transform_gradebook_df.
+    Returns:
+        dict: A dict mapping assessment instance IDs (int) to their modified_at timestamps (String).
+    """
+    reported = student_instances[student_instances["modified_at"].notna()]
+    modified_times = dict(zip(reported["assessment_instance_id"].astype(int), reported["modified_at"]))
+    unreported = student_instances[student_instances["modified_at"].isna()]
+    assessment_ids = [int(assessment_id) for assessment_id in unreported["assessment_id"].dropna().unique()]
+    if not assessment_ids:
+        return modified_times
+
+    def fetch_assessment_instances(assessment_id):
+        return call_pl_api(f"/course_instances/{PL_COURSE_ID}/assessments/{assessment_id}/assessment_instances")
+
+    logger.info(f"Fetching modification times for the instances of {len(assessment_ids)} assessments")
+    with METRICS.timer("modified_times_fetch"), ThreadPoolExecutor(max_workers=PL_MAX_CONCURRENT_REQUESTS) as executor:
+        for assessment_instances in executor.map(fetch_assessment_instances, assessment_ids):
+            for assessment_instance in assessment_instances:
+                if assessment_instance.get("modified_at") is not None:
+                    modified_times.setdefault(int(assessment_instance["assessment_instance_id"]), assessment_instance["modified_at"])
+    return modified_times
+
+
+def transform_gradebook_df(gradebook_data):
     '''
-    - Unnest the assessments column in the gradebook df 
-    - Create new columns with the assessment name as the title and assessment instance id as the value
+    - Unnest the assessments in the gradebook endpoint's response
+    - Return one row per student and assessment instance, with the assessment name and assessment instance id as columns
 
     '''
-    for idx, row in gradebook_df.iterrows():
-        
-        for assessment in row['assessments']:
-            
-            gradebook_df.at[idx, assessment["assessment_name"]] = assessment["assessment_instance_id"]
-    return gradebook_df
+    with METRICS.timer("transform"):
+        return pl_transforms.flatten_gradebook(gradebook_data)
 
 
 def gradebook_pl_endpoint():
     '''
-    -Create a pandas dataframe, gradebook_df, for the pl gradebook endpoint
+    -Return the response of the pl gradebook endpoint: one dict per student, with a list of their assessments
+    -The response is stored in RAW_DATA_CACHE, and read from it instead while younger than RAW_DATA_MAX_AGE_SECONDS
     '''
     course_instance_path = f"/course_instances/{PL_COURSE_ID}"
 
-    gradebook_data = call_pl_api(f"{course_instance_path}/gradebook")
+    if RAW_DATA_CACHE and RAW_DATA_MAX_AGE_SECONDS > 0:
+        cached = RAW_DATA_CACHE.read_latest(PL_COURSE_ID, "prairielearn", "gradebook", max_age=RAW_DATA_MAX_AGE_SECONDS)
+        if cached is not None:
+            logger.info(f"Using the gradebook cached at {cached['fetched_at']}")
+            METRICS.increment("raw_data_cache_hits")
+            return json.loads(cached["payload"])
+    with METRICS.timer("gradebook_fetch"):
+        gradebook_data = call_pl_api(f"{course_instance_path}/gradebook")
+    if RAW_DATA_CACHE:
+        RAW_DATA_CACHE.write(PL_COURSE_ID, "prairielearn", "gradebook", json.dumps(gradebook_data), "application/json")
+    return gradebook_data
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most `rate` calls per second are started. This is thread-safe.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_call_time = 0.0
+
+    def wait(self):
+        """
+        Blocks until the caller is allowed to make its next call.
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_call_time - now
+            self.next_call_time = max(now, self.next_call_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+# One rate limiter per host, shared by every thread calling that host.
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(url):
+    """
+    Returns the rate limiter for the host of the given url, creating it if necessary.
+
+    Args:
+        url (str): The url that is about to be requested.
 
-    gradebook_df = pd.DataFrame.from_dict(gradebook_data)
+    Returns:
+        RateLimiter: The rate limiter shared by all requests to the url's host.
+    """
+    host = urlparse(url).netloc
+    with rate_limiters_lock:
+        if host not in rate_limiters:
+            rate_limiters[host] = RateLimiter(PL_MAX_REQUESTS_PER_SECOND)
+        return rate_limiters[host]
 
-    return gradebook_df
 
 def call_pl_api(endpoint):
-    url = PL_SERVER + endpoint
-    headers = {"Private-Token": PL_API_TOKEN}
+    url = PL_CLIENT.url_for(endpoint)
+    rate_limiter = get_rate_limiter(url)
     
     logger.info(f"Calling PrairieLearn API: {url}")
 
-    retry_502_max = 30
-    retry_502_i = 0
-    while True:
-        r = requests.get(url, headers=headers)
-        if r.status_code == 200:
-            logger.info(f"PrairieLearn API call successful: {url}")
-            break
-        if r.status_code == 502:
-            retry_502_i += 1
-            logger.warning(f"502 Bad Gateway Error Encountered at {url} retrying in 10 seconds")
-            if retry_502_i >= retry_502_max:
-                logger.error(f"Maximum number of retries reached on 502 Bad Gateway Error for {url}")
-                raise ValueError(
-                    f"Maximum number of retries reached on 502 Bad Gateway Error for {url}"
-                )
-            #Bad Gateway Error Encountered at {url} retrying in 10 seconds
-            time.sleep(10)
-            continue
+    def send(timeout):
+        rate_limiter.wait()
+        return PL_CLIENT.get(endpoint, timeout=timeout)
+
+    # Raises http_retry.RetryError if PrairieLearn could not be reached within PL_RETRY_POLICY.
+    METRICS.increment("pl_api_calls")
+    with METRICS.timer("pl_api_call"):
+        r = PL_RETRY_POLICY.request(send, url)
+    if r.status_code != 200:
         logger.error(f"Error encountered at {url}: {r.status_code}")
         raise ValueError(f"Invalid status returned for {url}: {r.status_code}")
-    
+    logger.info(f"PrairieLearn API call successful: {url}")
+
     data = r.json()
 
     return data
@@ -532,7 +775,9 @@ def push_all_grade_data_to_sheets(df):
     get_sub_sheet_titles_to_ids(sheet_api_instance)
 
    
-    push_pl_csv_to_sheet(df_to_csv(df), "PrarieLearn Gradebook")
+    with METRICS.timer("csv_build"):
+        gradebook_csv = df_to_csv(df)
+    push_pl_csv_to_sheet(gradebook_csv, "PrarieLearn Gradebook")
 
     # populate_spreadsheet_gradebook(assignment_id_to_names, sheet_api_instance)
     make_batch_request(sheet_api_instance)
@@ -559,18 +804,25 @@ def main():
     # Use the logger to calculate the amount of time for starting and completing the request.
     start_time = time.time()
 
-    gradebook_df = transform_gradebook_df(gradebook_pl_endpoint())
+    try:
+        gradebook_df = transform_gradebook_df(gradebook_pl_endpoint())
 
-    instance_question_df = instance_question_endpoint(gradebook_df)
+        instance_question_df = instance_question_endpoint(gradebook_df)
 
-    assessment_name_mapping_df = assessment_name_mapping(instance_question_df)
+        with METRICS.timer("assessment_metadata"):
+            assessment_name_mapping_df = assessment_name_mapping(instance_question_df)
 
-    final_df = create_pivot_table(assessment_name_mapping_df)
+        with METRICS.timer("transform"):
+            final_df = create_pivot_table(assessment_name_mapping_df)
 
-    push_all_grade_data_to_sheets(final_df)
+        push_all_grade_data_to_sheets(final_df)
+    except Exception:
+        METRICS.report("failure", METRICS_TEXTFILE_PATH)
+        raise
 
     end_time = time.time()
     logger.info(f"Finished in {round(end_time - start_time, 2)} seconds")
+    METRICS.report("success", METRICS_TEXTFILE_PATH)
 
 if __name__ == "__main__":
     main()
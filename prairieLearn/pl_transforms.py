@@ -0,0 +1,128 @@
+# Pure transforms from PrairieLearn API responses to pandas tables.
+# Nothing in this file calls the PrairieLearn or Google APIs, so it can be benchmarked and tested offline.
+
+from itertools import chain
+import numpy as np
+import pandas as pd
+
+# Student fields copied from the gradebook endpoint onto every row.
+GRADEBOOK_STUDENT_FIELDS = ["user_id", "user_uid", "user_uin", "user_name", "user_role"]
+
+# Columns of the instance question table, in order, and the instance questions endpoint field each is read from.
+# Columns mapped to None are not provided by the API and are left empty.
+INSTANCE_QUESTION_FIELDS = {
+    "Zone number": "zone_number",
+    "Zone title": "zone_title",
+    "Question": "question_name",
+    "Question instance": "instance_question_id",
+    "Question points": "instance_question_points",
+    "Max points": "assessment_question_max_points",
+    "Question % score": "instance_question_score_perc",
+    "Auto points": "instance_question_auto_points",
+    "Max auto points": "assessment_question_max_auto_points",
+    "Manual points": "instance_question_manual_points",
+    "Max manual points": "assessment_question_max_manual_points",
+    "Date": None,
+    "Highest submission score": "highest_submission_score",
+    "Last submission score": "last_submission_score",
+    "Number attempts": "number_attempts",
+    "Duration seconds": "duration_seconds",
+    "Assigned manual grader": None,
+    "Last manual grader": None,
+}
+
+# Assessment fields copied from the gradebook endpoint. modified_at is the assessment instance's last modification time.
+GRADEBOOK_ASSESSMENT_FIELDS = ["assessment_id", "assessment_name", "assessment_instance_id", "modified_at"]
+
+INSTANCE_QUESTION_COLUMNS = ["UID", "UIN", "Username", "Name", "Role", "Assessment", "Assessment instance"] + list(INSTANCE_QUESTION_FIELDS)
+
+# Columns converted to numbers. Missing values become NaN (or <NA> for the integer columns).
+FLOAT_COLUMNS = ["Question points", "Max points", "Question % score", "Auto points", "Max auto points",
+                 "Manual points", "Max manual points", "Highest submission score", "Last submission score",
+                 "Duration seconds"]
+INTEGER_COLUMNS = ["Assessment instance", "Zone number", "Question instance", "Number attempts"]
+
+
+def explode_records(owners, nested_records, fields):
+    """
+    Flattens a list of record lists into a table, with one row per record, prefixed by the row of `owners` it belongs to.
+    Each column is built with one pass over the records, instead of building one dict or Series per record.
+
+    Args:
+        owners (pandas.DataFrame): One row per entry of nested_records.
+        nested_records (list): For each row of owners, in order, a list of record dicts.
+        fields (dict): Maps each output column to the record key it is read from, or to None for an empty column.
+    Returns:
+        pandas.DataFrame: The columns of owners followed by the columns of fields.
+    """
+    counts = np.fromiter((len(records) for records in nested_records), dtype=np.int64, count=len(nested_records))
+    records = list(chain.from_iterable(nested_records))
+    table = owners.iloc[np.repeat(np.arange(len(owners)), counts)].reset_index(drop=True)
+    for column, field in fields.items():
+        table[column] = [record.get(field) for record in records] if field else None
+    return table
+
+
+def flatten_gradebook(gradebook_data):
+    """
+    Unnests the assessments of every student in the gradebook endpoint's response into one row per assessment instance.
+
+    Args:
+        gradebook_data (list): The response of the gradebook endpoint: one dict per student, with an "assessments" list.
+    Returns:
+        pandas.DataFrame: One row per (student, assessment) with an assessment instance, with the columns
+        GRADEBOOK_STUDENT_FIELDS, "assessment_id", "assessment_name", "assessment_instance_id" (an integer) and
+        "modified_at" (None where the gradebook does not report it).
+        If a student has more than one instance of an assessment, only the last one is kept.
+    """
+    students = pd.DataFrame.from_records(gradebook_data, columns=GRADEBOOK_STUDENT_FIELDS + ["assessments"])
+    all_assessments = [assessments or [] for assessments in students["assessments"]]
+    # Explode the assessments: repeat each student once per assessment, lined up with the flattened assessments.
+    student_instances = explode_records(students[GRADEBOOK_STUDENT_FIELDS], all_assessments,
+                                        {field: field for field in GRADEBOOK_ASSESSMENT_FIELDS})
+    student_instances = student_instances[student_instances["assessment_instance_id"].notna()]
+    student_instances = student_instances.drop_duplicates(subset=["user_id", "user_uid", "assessment_name"], keep="last")
+    student_instances["assessment_instance_id"] = pd.to_numeric(student_instances["assessment_instance_id"]).astype("Int64")
+    return student_instances.reset_index(drop=True)
+
+
+def build_instance_question_table(student_instances, all_instance_questions):
+    """
+    Builds the instance question table: one row per question of every assessment instance, with the student's details.
+
+    Args:
+        student_instances (pandas.DataFrame): The output of flatten_gradebook.
+        all_instance_questions (list): For each row of student_instances, in order, the response of the
+            instance questions endpoint for its assessment instance (a list of dicts, one per question).
+    Returns:
+        pandas.DataFrame: A table with the columns INSTANCE_QUESTION_COLUMNS, with numeric columns typed.
+    """
+    owners = student_instances.rename(columns={
+        "user_uid": "UID", "user_uin": "UIN", "user_name": "Name", "user_role": "Role",
+        "assessment_name": "Assessment", "assessment_instance_id": "Assessment instance",
+    })
+    table = explode_records(owners[["UID", "UIN", "Name", "Role", "Assessment", "Assessment instance"]],
+                            all_instance_questions, INSTANCE_QUESTION_FIELDS)
+    table["Username"] = None
+    table = table[INSTANCE_QUESTION_COLUMNS]
+    for column in FLOAT_COLUMNS:
+        table[column] = pd.to_numeric(table[column], errors="coerce").astype("float64")
+    for column in INTEGER_COLUMNS:
+        table[column] = pd.to_numeric(table[column], errors="coerce").astype("Int64")
+    return table
+
+
+def rename_assessments(instance_question_df, assessments):
+    """
+    Replaces the assessment names in the "Assessment" column with the assessment titles, with one lookup per row.
+    Assessments without a title keep their name.
+
+    Args:
+        instance_question_df (pandas.DataFrame): A table with an "Assessment" column, such as the output of build_instance_question_table.
+        assessments (list): The response of the assessments endpoint: one dict per assessment, with "assessment_name" and "title".
+    Returns:
+        pandas.DataFrame: instance_question_df, with its "Assessment" column renamed.
+    """
+    titles = {assessment["assessment_name"]: assessment["title"] for assessment in assessments}
+    instance_question_df["Assessment"] = instance_question_df["Assessment"].map(titles).fillna(instance_question_df["Assessment"])
+    return instance_question_df
@@ -0,0 +1,548 @@
+# Backends for the Google Sheets calls of the sync scripts: the Sheets API, or a stand-in spreadsheet kept in memory or
+# in a SQLite file, for local runs and tests without credentials or network access.
+# This file is shared by the Gradescope and PrairieLearn sync scripts. Each script is deployed from its own folder,
+# so an identical copy lives next to each of them; keep the copies in sync.
+
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+GOOGLE_BACKEND = "google"
+MEMORY_BACKEND = "memory"
+SQLITE_BACKEND = "sqlite"
+# The grid of a new sheet, as Google creates it.
+DEFAULT_ROW_COUNT = 1000
+DEFAULT_COLUMN_COUNT = 26
+A1_CELL_PATTERN = re.compile(r"^\$?([A-Za-z]*)\$?(\d*)$")
+CAMEL_CASE_BOUNDARY = re.compile(r"(?<!^)(?=[A-Z])")
+
+
+def create_backend(name, build_google_resource, metrics=None, directory="."):
+    """
+    Creates the backend named by the SHEETS_BACKEND environment variable.
+
+    Args:
+        name (String): "google" for the Sheets API, "memory" for a stand-in spreadsheet that lasts as long as the
+            process, or "sqlite:<path>" for a stand-in spreadsheet kept in a SQLite file. Defaults to "google".
+        build_google_resource (callable): Returns the `spreadsheets()` resource of googleapiclient. It is only called
+            by the Google backend, on its first call, so the stand-ins need no credentials.
+        metrics (SyncMetrics, optional): Where every call is counted, as `sheets_*` counters.
+        directory (String): The folder a relative SQLite path is relative to.
+    Returns:
+        SheetsBackend: The backend.
+    """
+    kind, _, path = (name or GOOGLE_BACKEND).partition(":")
+    if kind == GOOGLE_BACKEND:
+        return GoogleSheetsBackend(build_google_resource, metrics)
+    if kind == MEMORY_BACKEND:
+        return StandInSheetsBackend(metrics=metrics)
+    if kind == SQLITE_BACKEND and path:
+        return StandInSheetsBackend(SheetsStore(os.path.join(directory, path)), metrics)
+    raise ValueError(f"Unknown sheets backend {name!r}; expected google, memory or sqlite:<path>")
+
+
+def payload_size(payload):
+    """
+    Returns the size of a request body or response, serialized as compact JSON.
+    """
+    return len(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def requests_of(body):
+    """
+    Returns the requests of a batchUpdate body as a list. A single request may be given without a list.
+    """
+    requests = body.get("requests", [])
+    return [requests] if isinstance(requests, dict) else list(requests)
+
+
+class SheetsRequest:
+    """
+    A call to a backend that is made when `execute` is called, like the requests of googleapiclient.
+    """
+
+    def __init__(self, backend, operation, parameters, send):
+        self.backend = backend
+        self.operation = operation
+        self.parameters = parameters
+        self.send = send
+
+    def execute(self):
+        return self.backend.call(self.operation, self.parameters, self.send)
+
+    def __repr__(self):
+        return f"<SheetsRequest {self.operation} on {type(self.backend).__name__}>"
+
+
+class SheetsValues:
+    """
+    The `values()` collection of a backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, spreadsheetId, range, **options):
+        return SheetsRequest(self.backend, "values_get", {"range": range, **options},
+                             lambda: self.backend.get_values(spreadsheetId, range, options))
+
+    def batchGet(self, spreadsheetId, ranges, **options):
+        return SheetsRequest(self.backend, "values_batch_get", {"ranges": ranges, **options},
+                             lambda: self.backend.batch_get_values(spreadsheetId, ranges, options))
+
+
+class SheetsBackend:
+    """
+    The calls the sync scripts make to a spreadsheet, with the interface of the `spreadsheets()` resource of
+    googleapiclient: `get`, `values().get`, `values().batchGet` and `batchUpdate` return requests that are made by
+    calling `execute()`. Subclasses implement `get_spreadsheet`, `get_values`, `batch_get_values` and `batch_update`.
+
+    Every call is counted by operation, with the bytes of its parameters and of its response, serialized as compact
+    JSON. The requests in the body of each batchUpdate are counted by kind, e.g. `paste_data_requests`.
+    """
+
+    def __init__(self, metrics=None):
+        """
+        Args:
+            metrics (SyncMetrics, optional): Where every count is also added, prefixed with `sheets_`.
+        """
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def get(self, spreadsheetId, **options):
+        return SheetsRequest(self, "get", options, lambda: self.get_spreadsheet(spreadsheetId, options))
+
+    def values(self):
+        return SheetsValues(self)
+
+    def batchUpdate(self, spreadsheetId, body):
+        return SheetsRequest(self, "batch_update", body, lambda: self.batch_update(spreadsheetId, body))
+
+    def call(self, operation, parameters, send):
+        """
+        Makes a call with `send` and counts it, its payload sizes, and the requests of a batchUpdate.
+        A call that raises is counted as an error, and the exception is raised again.
+        """
+        self.count(f"{operation}_calls")
+        self.count(f"{operation}_request_bytes", payload_size(parameters))
+        if operation == "batch_update":
+            for request in requests_of(parameters):
+                for kind in request:
+                    self.count(f"{CAMEL_CASE_BOUNDARY.sub('_', kind).lower()}_requests")
+        try:
+            response = send()
+        except Exception:
+            self.count(f"{operation}_errors")
+            raise
+        self.count(f"{operation}_response_bytes", payload_size(response))
+        return response
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+        if self.metrics is not None:
+            self.metrics.increment(f"sheets_{counter}", amount)
+
+    def stats(self):
+        """
+        Returns the counts of every call made so far, e.g. {"batch_update_calls": 2, "paste_data_requests": 60, ...}.
+        """
+        with self.lock:
+            return dict(self.counters)
+
+    def get_spreadsheet(self, spreadsheet_id, options):
+        raise NotImplementedError
+
+    def get_values(self, spreadsheet_id, a1_range, options):
+        raise NotImplementedError
+
+    def batch_get_values(self, spreadsheet_id, a1_ranges, options):
+        raise NotImplementedError
+
+    def batch_update(self, spreadsheet_id, body):
+        raise NotImplementedError
+
+
+class GoogleSheetsBackend(SheetsBackend):
+    """
+    Sends every call to the Google Sheets API.
+    """
+
+    def __init__(self, build_resource, metrics=None):
+        """
+        Args:
+            build_resource (callable): Returns the `spreadsheets()` resource of googleapiclient. Called on the first call.
+            metrics (SyncMetrics, optional): Where every count is also added.
+        """
+        super().__init__(metrics)
+        self.build_resource = build_resource
+        self._resource = None
+
+    def resource(self):
+        with self.lock:
+            if self._resource is None:
+                self._resource = self.build_resource()
+            return self._resource
+
+    def get_spreadsheet(self, spreadsheet_id, options):
+        return self.resource().get(spreadsheetId=spreadsheet_id, **options).execute()
+
+    def get_values(self, spreadsheet_id, a1_range, options):
+        return self.resource().values().get(spreadsheetId=spreadsheet_id, range=a1_range, **options).execute()
+
+    def batch_get_values(self, spreadsheet_id, a1_ranges, options):
+        return self.resource().values().batchGet(spreadsheetId=spreadsheet_id, ranges=a1_ranges, **options).execute()
+
+    def batch_update(self, spreadsheet_id, body):
+        return self.resource().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
+
+
+def column_number(letters):
+    """
+    Returns the zero-based index of a column, e.g. 0 for "A" and 26 for "AA".
+    """
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number - 1
+
+
+def parse_a1_range(a1_range):
+    """
+    Splits an A1 range such as "Labs!C2:C501", "'Lecture Quizzes'!1:1" or "Labs" into its sheet title and bounds.
+
+    Returns:
+        tuple: (title, first row, first column, last row, last column), zero-based and inclusive. Open bounds are None.
+    Raises:
+        ValueError: If the cells are not an A1 range.
+    """
+    title, separator, cells = a1_range.rpartition("!")
+    if not separator:
+        title, cells = cells, ""
+    if len(title) > 1 and title[0] == title[-1] == "'":
+        title = title[1:-1].replace("''", "'")
+    if not cells:
+        return title, None, None, None, None
+    start, _, end = cells.partition(":")
+    bounds = []
+    for cell in (start, end or start):
+        match = A1_CELL_PATTERN.match(cell)
+        if not match or not cell:
+            raise ValueError(f"Unable to parse range: {a1_range}")
+        letters, digits = match.groups()
+        bounds.append((int(digits) - 1 if digits else None, column_number(letters) if letters else None))
+    (first_row, first_column), (last_row, last_column) = bounds
+    return title, first_row, first_column, last_row, last_column
+
+
+def trimmed(rows):
+    """
+    Drops the empty cells at the end of each row and the empty rows at the end, as the Sheets API does.
+    """
+    rows = [row[:max((index + 1 for index, value in enumerate(row) if value != ""), default=0)] for row in rows]
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+def invalid_argument(message):
+    """
+    Returns the HttpError the Sheets API raises for a bad request.
+    """
+    content = json.dumps({"error": {"code": 400, "message": message, "status": "INVALID_ARGUMENT"}}).encode("utf-8")
+    return HttpError(httplib2.Response({"status": 400}), content)
+
+
+class StandInSheetsBackend(SheetsBackend):
+    """
+    A stand-in for the Sheets API that keeps spreadsheets in memory and, if given a SheetsStore, in a SQLite file
+    that later runs start from. It applies addSheet and pasteData, and answers spreadsheet metadata and values
+    requests from what was pasted. A spreadsheet that was never written starts with one empty sheet, "Sheet1".
+
+    Cells hold the pasted text: formulas are not evaluated, and numbers are not reformatted. As with the Sheets API,
+    a batchUpdate with an invalid request raises an HttpError with status 400 and applies none of its requests.
+    """
+
+    def __init__(self, store=None, metrics=None):
+        """
+        Args:
+            store (SheetsStore, optional): Where the spreadsheets are persisted. Defaults to memory only.
+            metrics (SyncMetrics, optional): Where every count is also added.
+        """
+        super().__init__(metrics)
+        self.store = store
+        # Maps spreadsheet IDs to lists of sheets, each a dict with its sheetId, title and rows.
+        self.spreadsheets = {}
+        self.data_lock = threading.Lock()
+
+    def sheets_of(self, spreadsheet_id):
+        if spreadsheet_id not in self.spreadsheets:
+            stored = self.store.load(spreadsheet_id) if self.store else None
+            self.spreadsheets[spreadsheet_id] = stored if stored is not None else [
+                {"sheetId": 0, "title": "Sheet1", "rows": []}]
+        return self.spreadsheets[spreadsheet_id]
+
+    @staticmethod
+    def properties_of(sheet, index):
+        return {
+            "sheetId": sheet["sheetId"],
+            "title": sheet["title"],
+            "index": index,
+            "sheetType": "GRID",
+            "gridProperties": {
+                "rowCount": max(DEFAULT_ROW_COUNT, len(sheet["rows"])),
+                "columnCount": max([DEFAULT_COLUMN_COUNT] + [len(row) for row in sheet["rows"]]),
+            },
+        }
+
+    def get_spreadsheet(self, spreadsheet_id, options):
+        with self.data_lock:
+            sheets = [{"properties": self.properties_of(sheet, index)}
+                      for index, sheet in enumerate(self.sheets_of(spreadsheet_id))]
+        if options.get("fields"):
+            return {"sheets": sheets}
+        return {"spreadsheetId": spreadsheet_id, "sheets": sheets}
+
+    def read_range(self, spreadsheet_id, a1_range):
+        try:
+            title, first_row, first_column, last_row, last_column = parse_a1_range(a1_range)
+        except ValueError as e:
+            raise invalid_argument(str(e))
+        with self.data_lock:
+            sheet = next((sheet for sheet in self.sheets_of(spreadsheet_id) if sheet["title"] == title), None)
+            if sheet is None:
+                raise invalid_argument(f"Unable to parse range: {a1_range}")
+            rows = sheet["rows"][first_row or 0:None if last_row is None else last_row + 1]
+            rows = [row[first_column or 0:None if last_column is None else last_column + 1] for row in rows]
+        value_range = {"range": a1_range, "majorDimension": "ROWS"}
+        values = trimmed(rows)
+        if values:
+            value_range["values"] = values
+        return value_range
+
+    def get_values(self, spreadsheet_id, a1_range, options):
+        return self.read_range(spreadsheet_id, a1_range)
+
+    def batch_get_values(self, spreadsheet_id, a1_ranges, options):
+        if isinstance(a1_ranges, str):
+            a1_ranges = [a1_ranges]
+        return {"spreadsheetId": spreadsheet_id,
+                "valueRanges": [self.read_range(spreadsheet_id, a1_range) for a1_range in a1_ranges]}
+
+    def batch_update(self, spreadsheet_id, body):
+        requests = requests_of(body)
+        with self.data_lock:
+            sheets = self.sheets_of(spreadsheet_id)
+            self.validate(sheets, requests)
+            replies = []
+            changed_rows = {}
+            for request in requests:
+                if "addSheet" in request:
+                    properties = request["addSheet"].get("properties", {})
+                    sheet = {"sheetId": properties.get("sheetId", max([sheet["sheetId"] for sheet in sheets], default=0) + 1),
+                             "title": properties["title"], "rows": []}
+                    sheets.insert(properties.get("index", len(sheets)), sheet)
+                    changed_rows.setdefault(sheet["sheetId"], set())
+                    replies.append({"addSheet": {"properties": self.properties_of(sheet, sheets.index(sheet))}})
+                else:
+                    sheet_id = request["pasteData"]["coordinate"].get("sheetId", 0)
+                    sheet = next(sheet for sheet in sheets if sheet["sheetId"] == sheet_id)
+                    changed_rows.setdefault(sheet_id, set()).update(self.paste(sheet, request["pasteData"]))
+                    replies.append({})
+            if self.store:
+                self.store.save(spreadsheet_id, sheets, changed_rows)
+        return {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+    def import_csv_folder(self, spreadsheet_id, folder):
+        """
+        Pastes every `<sheet title>.csv` file of a folder into the sheet of that title, adding the sheets that are
+        missing, e.g. to start from a copy of the gradebook template downloaded as CSV files. Imports are not counted.
+
+        Returns:
+            list: The titles of the imported sheets.
+        """
+        titles = sorted(name[:-len(".csv")] for name in os.listdir(folder) if name.endswith(".csv"))
+        existing = {sheet["properties"]["title"] for sheet in self.get_spreadsheet(spreadsheet_id, {})["sheets"]}
+        missing = [{"addSheet": {"properties": {"title": title}}} for title in titles if title not in existing]
+        if missing:
+            self.batch_update(spreadsheet_id, {"requests": missing})
+        sheet_ids = {sheet["properties"]["title"]: sheet["properties"]["sheetId"]
+                     for sheet in self.get_spreadsheet(spreadsheet_id, {})["sheets"]}
+        pastes = []
+        for title in titles:
+            with open(os.path.join(folder, f"{title}.csv"), newline="") as csv_file:
+                pastes.append({"pasteData": {"coordinate": {"sheetId": sheet_ids[title], "rowIndex": 0, "columnIndex": 0},
+                                             "data": csv_file.read(), "type": "PASTE_NORMAL", "delimiter": ","}})
+        if pastes:
+            self.batch_update(spreadsheet_id, {"requests": pastes})
+        return titles
+
+    def export_csv_folder(self, spreadsheet_id, folder):
+        """
+        Writes every sheet of a spreadsheet to `<folder>/<sheet title>.csv`.
+
+        Returns:
+            list: The titles of the exported sheets.
+        """
+        os.makedirs(folder, exist_ok=True)
+        with self.data_lock:
+            sheets = [(sheet["title"], trimmed(sheet["rows"])) for sheet in self.sheets_of(spreadsheet_id)]
+        for title, rows in sheets:
+            with open(os.path.join(folder, f"{title}.csv"), "w", newline="") as csv_file:
+                csv.writer(csv_file, lineterminator="\n").writerows(rows)
+        return [title for title, _ in sheets]
+
+    @staticmethod
+    def validate(sheets, requests):
+        """
+        Checks every request of a batchUpdate before any is applied, so that an invalid one applies none of them.
+        """
+        titles = {sheet["title"] for sheet in sheets}
+        sheet_ids = {sheet["sheetId"] for sheet in sheets}
+        next_sheet_id = max(sheet_ids, default=0) + 1
+        for request in requests:
+            if "addSheet" in request:
+                properties = request["addSheet"].get("properties", {})
+                title = properties.get("title")
+                if not title:
+                    raise invalid_argument("addSheet needs a title")
+                if title in titles:
+                    raise invalid_argument(f'A sheet with the name "{title}" already exists. Please enter another name.')
+                sheet_id = properties.get("sheetId", next_sheet_id)
+                if sheet_id in sheet_ids:
+                    raise invalid_argument(f"Sheet ID {sheet_id} is already in use.")
+                titles.add(title)
+                sheet_ids.add(sheet_id)
+                next_sheet_id = max(sheet_ids) + 1
+            elif "pasteData" in request:
+                paste = request["pasteData"]
+                if paste.get("html"):
+                    raise invalid_argument("The stand-in sheets backend does not paste HTML")
+                if paste.get("coordinate", {}).get("sheetId", 0) not in sheet_ids:
+                    raise invalid_argument(f"No grid with id: {paste.get('coordinate', {}).get('sheetId', 0)}")
+            else:
+                raise invalid_argument(f"The stand-in sheets backend does not support {', '.join(request)} requests")
+
+    @staticmethod
+    def paste(sheet, paste):
+        """
+        Pastes delimited data into a sheet at its coordinate, and returns the indexes of the rows it wrote.
+        """
+        coordinate = paste["coordinate"]
+        row_index = coordinate.get("rowIndex", 0)
+        column_index = coordinate.get("columnIndex", 0)
+        delimiter = paste.get("delimiter", ",")
+        if len(delimiter) == 1:
+            pasted_rows = list(csv.reader(io.StringIO(paste.get("data", "")), delimiter=delimiter))
+        else:
+            pasted_rows = [line.split(delimiter) for line in paste.get("data", "").splitlines()]
+        rows = sheet["rows"]
+        if len(rows) < row_index + len(pasted_rows):
+            rows.extend([] for _ in range(row_index + len(pasted_rows) - len(rows)))
+        for offset, pasted in enumerate(pasted_rows):
+            row = rows[row_index + offset]
+            if len(row) < column_index:
+                row.extend([""] * (column_index - len(row)))
+            row[column_index:column_index + len(pasted)] = pasted
+        return range(row_index, row_index + len(pasted_rows))
+
+
+class SheetsStore:
+    """
+    Keeps the spreadsheets of a StandInSheetsBackend in a SQLite file: one row per sheet, and one row per sheet row
+    holding its cells as JSON. Only the rows a batchUpdate wrote are saved again.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (String): The SQLite file. It and its folder are created if they do not exist.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sheets ("
+                "spreadsheet_id TEXT NOT NULL, sheet_id INTEGER NOT NULL, title TEXT NOT NULL, sheet_index INTEGER NOT NULL, "
+                "PRIMARY KEY (spreadsheet_id, sheet_id))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_rows ("
+                "spreadsheet_id TEXT NOT NULL, sheet_id INTEGER NOT NULL, row_index INTEGER NOT NULL, cells TEXT NOT NULL, "
+                "PRIMARY KEY (spreadsheet_id, sheet_id, row_index))"
+            )
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self, spreadsheet_id):
+        """
+        Returns the sheets of a spreadsheet, in order, or None if it was never saved.
+        """
+        with self.connect() as connection:
+            sheet_rows = connection.execute(
+                "SELECT sheet_id, title FROM sheets WHERE spreadsheet_id = ? ORDER BY sheet_index", (spreadsheet_id,)
+            ).fetchall()
+            cell_rows = connection.execute(
+                "SELECT sheet_id, row_index, cells FROM sheet_rows WHERE spreadsheet_id = ?", (spreadsheet_id,)
+            ).fetchall()
+        if not sheet_rows:
+            return None
+        sheets = {sheet_id: {"sheetId": sheet_id, "title": title, "rows": []} for sheet_id, title in sheet_rows}
+        for sheet_id, row_index, cells in cell_rows:
+            rows = sheets[sheet_id]["rows"]
+            if len(rows) <= row_index:
+                rows.extend([] for _ in range(row_index + 1 - len(rows)))
+            rows[row_index] = json.loads(cells)
+        return list(sheets.values())
+
+    def save(self, spreadsheet_id, sheets, changed_rows):
+        """
+        Saves the order and titles of every sheet, and the given rows.
+
+        Args:
+            spreadsheet_id (String): The spreadsheet.
+            sheets (list): Its sheets, in order.
+            changed_rows (dict): Maps the IDs of sheets to the indexes of their rows to save.
+        """
+        sheets_by_id = {sheet["sheetId"]: sheet for sheet in sheets}
+        with self.connect() as connection:
+            connection.execute("DELETE FROM sheets WHERE spreadsheet_id = ?", (spreadsheet_id,))
+            connection.executemany(
+                "INSERT INTO sheets (spreadsheet_id, sheet_id, title, sheet_index) VALUES (?, ?, ?, ?)",
+                [(spreadsheet_id, sheet["sheetId"], sheet["title"], index) for index, sheet in enumerate(sheets)]
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO sheet_rows (spreadsheet_id, sheet_id, row_index, cells) VALUES (?, ?, ?, ?)",
+                [(spreadsheet_id, sheet_id, row_index, json.dumps(sheets_by_id[sheet_id]["rows"][row_index]))
+                 for sheet_id, row_indexes in changed_rows.items() for row_index in sorted(row_indexes)]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Imports CSV files into, or exports them from, a spreadsheet of a SQLite stand-in sheets backend.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("store", help="The SQLite file of the backend, as in SHEETS_BACKEND=sqlite:<path>.")
+    parser.add_argument("spreadsheet_id", help="The SPREADSHEET_ID of the config file.")
+    parser.add_argument("folder", help="A folder of <sheet title>.csv files.")
+    args = parser.parse_args()
+    backend = StandInSheetsBackend(SheetsStore(args.store))
+    if args.action == "import":
+        titles = backend.import_csv_folder(args.spreadsheet_id, args.folder)
+    else:
+        titles = backend.export_csv_folder(args.spreadsheet_id, args.folder)
+    print(f"{args.action.capitalize()}ed {len(titles)} sheet(s): {', '.join(titles)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Plans and executes Google Sheets batchUpdate calls in chunks.
+# This file is shared by the Gradescope and PrairieLearn sync scripts. Each script is deployed from its own folder,
+# so an identical copy lives next to each of them; keep the copies in sync.
+
+import json
+import logging
+import random
+import time
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+# Sheets rejects request bodies well before 10 MB, and large bodies are slow to apply, so chunks default to 2 MB.
+DEFAULT_MAX_BATCH_BYTES = 2_000_000
+DEFAULT_MAX_REQUESTS_PER_BATCH = 200
+# The default Sheets write quota is 60 requests per minute per user.
+DEFAULT_MAX_BATCHES_PER_MINUTE = 60
+DEFAULT_MAX_TRIES = 5
+
+# Statuses worth retrying: rate limiting and transient server errors.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Status returned when a request body is too large. A chunk that hits it is split in half and retried.
+REQUEST_TOO_LARGE_STATUS = 413
+
+
+class BatchUpdateError(Exception):
+    """
+    Raised when some chunks of a batch could not be applied. The other chunks were applied.
+    """
+
+    def __init__(self, failed_chunks):
+        """
+        Parameters:
+            failed_chunks (list): (chunk, exception) pairs for every chunk that failed.
+        """
+        self.failed_chunks = failed_chunks
+        failed_requests = sum(len(chunk) for chunk, _ in failed_chunks)
+        super().__init__(f"{len(failed_chunks)} batch update chunk(s) with {failed_requests} request(s) failed: "
+                         f"{failed_chunks[0][1]}")
+
+
+def request_size(request):
+    """
+    Returns the number of bytes a request adds to a batchUpdate body.
+
+    Args:
+        request (dict): A Google sheets API rest request of any type.
+    Returns:
+        int: The size of the request, serialized as JSON.
+    """
+    return len(json.dumps(request, separators=(",", ":")).encode("utf-8"))
+
+
+def plan_batches(requests, max_bytes=DEFAULT_MAX_BATCH_BYTES, max_requests=DEFAULT_MAX_REQUESTS_PER_BATCH):
+    """
+    Splits requests into chunks of at most `max_requests` requests and `max_bytes` bytes, keeping their order.
+    A single request larger than `max_bytes` gets a chunk of its own.
+
+    Args:
+        requests (list): Google sheets API rest requests, in the order they should be applied.
+        max_bytes (int): The maximum serialized size of one chunk.
+        max_requests (int): The maximum number of requests in one chunk.
+    Returns:
+        list: A list of chunks, each a list of requests.
+    """
+    chunks = []
+    chunk = []
+    chunk_bytes = 0
+    for request in requests:
+        size = request_size(request)
+        if size > max_bytes:
+            logger.warning(f"A request of {size} bytes exceeds the batch budget of {max_bytes} bytes; sending it alone")
+        if chunk and (chunk_bytes + size > max_bytes or len(chunk) >= max_requests):
+            chunks.append(chunk)
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def status_of(exception):
+    """
+    Returns the HTTP status of a failed Sheets API call, or `None` if the exception is not an HTTP error.
+    """
+    if isinstance(exception, HttpError):
+        return exception.resp.status
+    return None
+
+
+def retry_after_of(exception):
+    """
+    Returns the number of seconds the Sheets API asked us to wait before retrying, or `None` if it did not say.
+    """
+    if not isinstance(exception, HttpError):
+        return None
+    try:
+        return float(exception.resp.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def execute_batches(sheet_api_instance, spreadsheet_id, requests, max_bytes=DEFAULT_MAX_BATCH_BYTES,
+                    max_requests=DEFAULT_MAX_REQUESTS_PER_BATCH, max_batches_per_minute=DEFAULT_MAX_BATCHES_PER_MINUTE,
+                    max_tries=DEFAULT_MAX_TRIES, on_backoff=None):
+    """
+    Applies requests to a spreadsheet with as few batchUpdate calls as the budgets allow.
+
+    The chunks are sent in order, at most `max_batches_per_minute` per minute. A chunk that is rate limited or hits a
+    transient server error is retried on its own, with exponential backoff (or after the delay the API asks for),
+    so chunks that were already applied are never sent again. A chunk that is too large is split in half.
+
+    Args:
+        sheet_api_instance (sheets_backend.SheetsBackend): The sheet api instance
+        spreadsheet_id (String): The ID of the spreadsheet to update.
+        requests (list): Google sheets API rest requests, in the order they should be applied.
+        max_bytes (int): The maximum serialized size of one chunk.
+        max_requests (int): The maximum number of requests in one chunk.
+        max_batches_per_minute (int): The maximum number of batchUpdate calls started per minute.
+        max_tries (int): The number of times a chunk is tried before it is given up on.
+        on_backoff (callable, optional): Called with the exception every time a chunk is retried.
+    Returns:
+        list: The batchUpdate responses, one per applied chunk.
+    Raises:
+        BatchUpdateError: If any chunk could not be applied, after every other chunk has been tried.
+    """
+    pending = plan_batches(requests, max_bytes, max_requests)
+    logger.info(f"Split {len(requests)} requests into {len(pending)} batch update chunk(s)")
+    min_interval = 60.0 / max_batches_per_minute
+    last_sent_at = None
+    responses = []
+    failed_chunks = []
+    tries = 0
+    while pending:
+        chunk = pending[0]
+        if last_sent_at is not None:
+            time.sleep(max(0.0, last_sent_at + min_interval - time.monotonic()))
+        last_sent_at = time.monotonic()
+        tries += 1
+        try:
+            request = sheet_api_instance.batchUpdate(spreadsheetId=spreadsheet_id, body={"requests": chunk})
+            responses.append(request.execute())
+        except Exception as e:
+            status = status_of(e)
+            if status == REQUEST_TOO_LARGE_STATUS and len(chunk) > 1:
+                logger.warning(f"Batch update chunk of {len(chunk)} requests is too large; splitting it in half")
+                middle = len(chunk) // 2
+                pending[0:1] = [chunk[:middle], chunk[middle:]]
+                tries = 0
+                continue
+            if status in RETRYABLE_STATUSES and tries < max_tries:
+                delay = retry_after_of(e)
+                if delay is None:
+                    delay = random.uniform(0, 2 ** tries)
+                logger.warning(f"Batch update chunk failed with status {status}; retrying it in {delay:.1f} seconds")
+                if on_backoff is not None:
+                    on_backoff(e)
+                time.sleep(delay)
+                continue
+            logger.error(f"Giving up on a batch update chunk of {len(chunk)} requests: {e}")
+            failed_chunks.append((chunk, e))
+        pending.pop(0)
+        tries = 0
+    if failed_chunks:
+        raise BatchUpdateError(failed_chunks)
+    return responses
@@ -0,0 +1,114 @@
+from email.utils import formatdate
+import time
+import pytest
+import requests
+import http_retry
+from http_retry import RetryPolicy, RetryError, CircuitOpenError, CircuitBreaker, retry_after_seconds
+
+URL = "https://us.prairielearn.com/pl/api/v1/course_instances/1/gradebook"
+
+def response(status, headers=None):
+    result = requests.Response()
+    result.status_code = status
+    result.headers.update(headers or {})
+    return result
+
+class Upstream:
+    """
+    Answers each attempt with the next outcome: a status code, or an exception to raise.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome if isinstance(outcome, requests.Response) else response(outcome)
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(http_retry.time, "sleep", slept.append)
+    return slept
+
+def test_retries_transient_failures(sleeps):
+    retries = []
+    policy = RetryPolicy(max_tries=5, base_delay=1, timeout=7, on_retry=lambda url, failure: retries.append(failure))
+    upstream = Upstream(503, requests.ConnectionError(), requests.Timeout(), 200)
+    assert policy.request(upstream, URL).status_code == 200
+    assert retries == ["status 503", "ConnectionError", "Timeout"]
+    assert upstream.timeouts == [7] * 4
+    # Full jitter: each delay is between 0 and base_delay * 2 ** (attempt - 1).
+    assert len(sleeps) == 3 and all(0 <= delay <= 2 ** attempt for attempt, delay in enumerate(sleeps))
+
+def test_does_not_retry_other_errors(sleeps):
+    assert RetryPolicy().request(Upstream(404), URL).status_code == 404
+    with pytest.raises(ValueError):
+        RetryPolicy().request(Upstream(ValueError("bad")), URL)
+    assert sleeps == []
+
+def test_gives_up_after_max_tries(sleeps):
+    upstream = Upstream(502, 502, 502, 200)
+    with pytest.raises(RetryError, match="after 3 attempts"):
+        RetryPolicy(max_tries=3).request(upstream, URL)
+    assert len(sleeps) == 2 and len(upstream.outcomes) == 1
+
+def test_honors_retry_after(sleeps):
+    policy = RetryPolicy()
+    assert policy.request(Upstream(response(429, {"Retry-After": "12"}), 200), URL).status_code == 200
+    assert sleeps == [12.0]
+
+def test_gives_up_when_the_delay_would_pass_the_deadline(sleeps):
+    with pytest.raises(RetryError, match="deadline"):
+        RetryPolicy(deadline=10).request(Upstream(response(429, {"Retry-After": "30"}), 200), URL)
+    assert sleeps == []
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(http_retry.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(base_delay=1, max_delay=10)
+    assert [policy.backoff_delay(attempt) for attempt in range(1, 7)] == [1, 2, 4, 8, 10, 10]
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(response(429)) is None
+    assert retry_after_seconds(response(429, {"Retry-After": "-5"})) == 0
+    assert retry_after_seconds(response(429, {"Retry-After": "soon"})) is None
+    assert 25 <= retry_after_seconds(response(503, {"Retry-After": formatdate(time.time() + 30, usegmt=True)})) <= 30
+
+def test_circuit_breaker_opens_and_recovers(sleeps, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(http_retry.time, "monotonic", lambda: now[0])
+    policy = RetryPolicy(max_tries=10, circuit_breaker_threshold=3, circuit_breaker_cooldown=60)
+    upstream = Upstream(503, 503, 503, 200, 200)
+    with pytest.raises(CircuitOpenError):
+        policy.request(upstream, URL)
+    # Requests to the same host fail without being sent while the circuit is open; other hosts are not affected.
+    with pytest.raises(CircuitOpenError):
+        policy.request(upstream, URL)
+    assert len(upstream.outcomes) == 2
+    assert policy.request(Upstream(200), "https://www.gradescope.com/login").status_code == 200
+
+    now[0] += 61
+    assert policy.circuit_breaker_for(URL).seconds_until_retry() == 0
+    assert policy.request(upstream, URL).status_code == 200
+    assert policy.circuit_breaker_for(URL).failures == 0
+
+def test_circuit_breaker_reopens_after_a_failed_trial(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(http_retry.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    breaker.record_failure()
+    assert breaker.seconds_until_retry() == 0
+    breaker.record_failure()
+    assert breaker.seconds_until_retry() == 30
+    now[0] = 31
+    assert breaker.seconds_until_retry() == 0
+    breaker.record_failure()
+    assert breaker.seconds_until_retry() == 30
+
+def test_from_config():
+    policy = RetryPolicy.from_config({"PL_RETRY_MAX_TRIES": 2, "PL_REQUEST_TIMEOUT_SECONDS": 5, "GS_RETRY_MAX_TRIES": 9}, "PL_")
+    assert (policy.max_tries, policy.timeout, policy.deadline) == (2, 5, RetryPolicy().deadline)
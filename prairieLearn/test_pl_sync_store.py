@@ -0,0 +1,32 @@
+import os
+import pl_sync_store
+from pl_sync_store import InstanceQuestionStore
+
+def test_save_and_load(tmp_path):
+    store = InstanceQuestionStore(os.path.join(tmp_path, "state", "pl.sqlite"))
+    assert store.load([1, 2]) == {}
+    store.save({1: ("2025-01-01T00:00:00Z", [{"question_name": "q1"}]), "2": ("2025-01-02T00:00:00Z", [])})
+    assert store.load(["1", 2, 3]) == {1: ("2025-01-01T00:00:00Z", [{"question_name": "q1"}]), 2: ("2025-01-02T00:00:00Z", [])}
+    assert store.load([2]) == {2: ("2025-01-02T00:00:00Z", [])}
+
+def test_save_replaces_and_persists(tmp_path):
+    path = os.path.join(tmp_path, "pl.sqlite")
+    InstanceQuestionStore(path).save({1: ("2025-01-01T00:00:00Z", [{"points": 1}])})
+    InstanceQuestionStore(path).save({1: ("2025-02-01T00:00:00Z", [{"points": 2}])})
+    assert InstanceQuestionStore(path).load([1]) == {1: ("2025-02-01T00:00:00Z", [{"points": 2}])}
+
+def test_load_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(pl_sync_store, "MAX_IDS_PER_QUERY", 3)
+    store = InstanceQuestionStore(os.path.join(tmp_path, "pl.sqlite"))
+    store.save({instance_id: ("2025-01-01T00:00:00Z", [instance_id]) for instance_id in range(10)})
+    assert store.load(range(2, 9)) == {instance_id: ("2025-01-01T00:00:00Z", [instance_id]) for instance_id in range(2, 9)}
+
+def test_save_removes_instances_no_longer_present(tmp_path):
+    path = os.path.join(tmp_path, "pl.sqlite")
+    store = InstanceQuestionStore(path)
+    store.save({1: ("a", []), 2: ("a", []), 3: ("a", [])})
+    store.save({4: ("b", [])}, present_ids=[2, 4])
+    assert store.load([1, 2, 3, 4]) == {2: ("a", []), 4: ("b", [])}
+    # The list of present instances does not outlive the connection that used it.
+    InstanceQuestionStore(path).save({}, present_ids=[4])
+    assert store.load([1, 2, 3, 4]) == {4: ("b", [])}
@@ -0,0 +1,112 @@
+import random
+import pandas as pd
+import pl_transforms
+
+def legacy_transform(gradebook_data, instance_questions_by_instance_id):
+    """
+    The reference: the row-by-row implementation pl_to_spreadsheet.py used before pl_transforms.py. One gradebook
+    column per assessment is filled in with `.at` inside `iterrows`, then one record dict is built per question.
+    """
+    gradebook_df = pd.DataFrame.from_dict(gradebook_data)
+    for idx, row in gradebook_df.iterrows():
+        for assessment in row['assessments']:
+            gradebook_df.at[idx, assessment["assessment_name"]] = assessment["assessment_instance_id"]
+
+    fixed_cols = ['user_id', 'user_uid', 'user_uin', 'user_name', 'user_role', 'assessments']
+    assessment_columns = [col for col in gradebook_df.columns if col not in fixed_cols]
+    records = []
+    for idx, row in gradebook_df.iterrows():
+        for assessment in assessment_columns:
+            instance_id = row[assessment]
+            if pd.isnull(instance_id):
+                continue
+            for question in instance_questions_by_instance_id[int(instance_id)]:
+                record = {"UID": row.get('user_uid'), "UIN": row.get('user_uin'), "Username": None,
+                          "Name": row.get('user_name'), "Role": row.get('user_role'),
+                          "Assessment": assessment, "Assessment instance": instance_id}
+                for column, field in pl_transforms.INSTANCE_QUESTION_FIELDS.items():
+                    record[column] = question.get(field) if field else None
+                records.append(record)
+    return pd.DataFrame(records)
+
+def vectorized_transform(gradebook_data, instance_questions_by_instance_id):
+    student_instances = pl_transforms.flatten_gradebook(gradebook_data)
+    all_instance_questions = [instance_questions_by_instance_id[instance_id]
+                              for instance_id in student_instances["assessment_instance_id"]]
+    return pl_transforms.build_instance_question_table(student_instances, all_instance_questions)
+
+def pivot(instance_question_df):
+    """
+    The score pivot that pl_to_spreadsheet.create_pivot_table builds from the instance question table.
+    """
+    return instance_question_df.pivot_table(
+        index='UIN', columns=['Assessment', 'Zone number', 'Zone title'], values='Question points', aggfunc='first'
+    ).sort_index(axis=1)
+
+def question(instance_id, number, points):
+    return {"zone_number": number, "zone_title": f"Zone {number}", "question_name": f"q{number}",
+            "instance_question_id": instance_id * 10 + number, "instance_question_points": points,
+            "assessment_question_max_points": 2, "number_attempts": 1}
+
+# Covers a student without assessments, an assessment that was not started, a second instance of one assessment
+# (the last one wins), and questions with missing fields.
+GRADEBOOK = [
+    {"user_id": 1, "user_uid": "a@berkeley.edu", "user_uin": "3031", "user_name": "A", "user_role": "Student",
+     "assessments": [{"assessment_name": "hw1", "assessment_instance_id": 11, "modified_at": "2025-01-01"},
+                     {"assessment_name": "hw2", "assessment_instance_id": None}]},
+    {"user_id": 2, "user_uid": "b@berkeley.edu", "user_uin": "3032", "user_name": "B", "user_role": "Student",
+     "assessments": [{"assessment_name": "hw1", "assessment_instance_id": 21},
+                     {"assessment_name": "hw1", "assessment_instance_id": 22},
+                     {"assessment_name": "hw2", "assessment_instance_id": 23}]},
+    {"user_id": 3, "user_uid": "c@berkeley.edu", "user_uin": "3033", "user_name": "C", "user_role": "Student",
+     "assessments": []},
+]
+INSTANCE_QUESTIONS = {
+    11: [question(11, 1, 2), question(11, 2, 0.5)],
+    21: [question(21, 1, 1)],
+    22: [question(22, 1, 2), {"question_name": "q2", "instance_question_id": 222}],
+    23: [question(23, 1, None)],
+}
+
+def test_flatten_gradebook():
+    student_instances = pl_transforms.flatten_gradebook(GRADEBOOK)
+    assert list(student_instances["assessment_instance_id"]) == [11, 22, 23]
+    assert list(student_instances["modified_at"].isna()) == [False, True, True]
+
+def test_matches_legacy_transform():
+    legacy_df = legacy_transform(GRADEBOOK, INSTANCE_QUESTIONS)
+    # The legacy table was not typed; the values must match once its numeric columns are converted.
+    for column in pl_transforms.FLOAT_COLUMNS + pl_transforms.INTEGER_COLUMNS:
+        legacy_df[column] = pd.to_numeric(legacy_df[column], errors="coerce")
+    vectorized_df = vectorized_transform(GRADEBOOK, INSTANCE_QUESTIONS)
+    assert list(vectorized_df.columns) == pl_transforms.INSTANCE_QUESTION_COLUMNS
+    key = ["UIN", "Assessment", "Question"]
+    pd.testing.assert_frame_equal(
+        legacy_df[pl_transforms.INSTANCE_QUESTION_COLUMNS].sort_values(key).reset_index(drop=True),
+        vectorized_df.sort_values(key).reset_index(drop=True),
+        check_dtype=False,
+    )
+
+def test_matches_legacy_pivot_on_synthetic_course():
+    rng = random.Random(0)
+    gradebook_data, instance_questions = [], {}
+    for student in range(30):
+        assessments = []
+        for assessment in range(4):
+            # Some students have not started some assessments.
+            instance_id = None if rng.random() < 0.1 else student * 10 + assessment
+            assessments.append({"assessment_name": f"hw{assessment}", "assessment_instance_id": instance_id})
+            if instance_id is not None:
+                instance_questions[instance_id] = [question(instance_id, number, rng.choice([0, 0.5, 2, None]))
+                                                   for number in range(3)]
+        gradebook_data.append({"user_id": student, "user_uid": f"student{student}@berkeley.edu",
+                               "user_uin": str(3030000000 + student), "user_name": f"Student {student}",
+                               "user_role": "Student", "assessments": assessments})
+    pd.testing.assert_frame_equal(pivot(legacy_transform(gradebook_data, instance_questions)),
+                                  pivot(vectorized_transform(gradebook_data, instance_questions)),
+                                  check_dtype=False, check_column_type=False)
+
+def test_rename_assessments():
+    df = pd.DataFrame({"Assessment": ["hw1", "hw2"]})
+    renamed = pl_transforms.rename_assessments(df, [{"assessment_name": "hw1", "title": "Homework 1"}])
+    assert list(renamed["Assessment"]) == ["Homework 1", "hw2"]
@@ -0,0 +1,113 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+import sheets_batch
+from sheets_batch import plan_batches, execute_batches, request_size, BatchUpdateError
+
+def paste(size):
+    """
+    A pasteData request of exactly `size` bytes.
+    """
+    request = {"pasteData": {"data": ""}}
+    request["pasteData"]["data"] = "x" * (size - request_size(request))
+    return request
+
+def http_error(status, retry_after=None):
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = str(retry_after)
+    return HttpError(httplib2.Response(headers), b"{}")
+
+class Sheets:
+    """
+    Records every batchUpdate body, and fails calls according to `fail(chunk)`, which returns an exception or None.
+    """
+
+    def __init__(self, fail=lambda chunk: None):
+        self.fail = fail
+        self.calls = []
+        self.applied = []
+
+    def batchUpdate(self, spreadsheetId, body):
+        chunk = body["requests"]
+        sheets = self
+
+        class Request:
+            def execute(self):
+                sheets.calls.append(chunk)
+                error = sheets.fail(chunk)
+                if error is not None:
+                    raise error
+                sheets.applied.append(chunk)
+                return {"replies": [{} for _ in chunk]}
+        return Request()
+
+@pytest.fixture(autouse=True)
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(sheets_batch.time, "sleep", slept.append)
+    return slept
+
+def test_plan_batches_respects_both_budgets():
+    requests = [paste(100) for _ in range(7)]
+    assert [len(chunk) for chunk in plan_batches(requests, max_bytes=300, max_requests=10)] == [3, 3, 1]
+    assert [len(chunk) for chunk in plan_batches(requests, max_bytes=10_000, max_requests=2)] == [2, 2, 2, 1]
+    assert sum(plan_batches(requests, max_bytes=300), []) == requests
+
+def test_plan_batches_sends_oversized_requests_alone():
+    small, large = paste(100), paste(1000)
+    assert plan_batches([small, large, small], max_bytes=300) == [[small], [large], [small]]
+    assert plan_batches([large], max_bytes=300) == [[large]]
+    assert plan_batches([], max_bytes=300) == []
+
+def test_plan_batches_at_exact_budget():
+    requests = [paste(150), paste(150), paste(1)]
+    assert plan_batches(requests, max_bytes=300) == [requests[:2], requests[2:]]
+
+def test_splits_chunks_that_are_too_large():
+    requests = [paste(100) for _ in range(5)]
+    sheets = Sheets(lambda chunk: http_error(413) if len(chunk) > 2 else None)
+    execute_batches(sheets, "id", requests, max_batches_per_minute=600)
+    assert [len(chunk) for chunk in sheets.calls] == [5, 2, 3, 1, 2]
+    # Every request is applied exactly once, in order.
+    assert sum(sheets.applied, []) == requests
+
+def test_gives_up_on_a_single_request_that_is_too_large():
+    requests = [paste(100), paste(100)]
+    sheets = Sheets(lambda chunk: http_error(413) if chunk[0] is requests[0] else None)
+    with pytest.raises(BatchUpdateError) as error:
+        execute_batches(sheets, "id", requests, max_requests=1, max_batches_per_minute=600)
+    assert error.value.failed_chunks[0][0] == [requests[0]]
+    assert sheets.applied == [[requests[1]]]
+
+def test_retries_only_the_failed_chunk(sleeps):
+    requests = [paste(100) for _ in range(3)]
+    failures = [http_error(429, retry_after=7), http_error(503)]
+    sheets = Sheets(lambda chunk: failures.pop(0) if chunk[0] is requests[1] and failures else None)
+    backoffs = []
+    responses = execute_batches(sheets, "id", requests, max_requests=1, max_batches_per_minute=600, on_backoff=backoffs.append)
+    assert len(responses) == 3 and len(backoffs) == 2
+    assert sum(sheets.applied, []) == requests
+    assert [chunk[0] is requests[1] for chunk in sheets.calls] == [False, True, True, True, False]
+    assert 7 in sleeps
+
+def test_gives_up_after_max_tries_and_applies_the_rest():
+    requests = [paste(100) for _ in range(3)]
+    sheets = Sheets(lambda chunk: http_error(500) if chunk[0] is requests[0] else None)
+    with pytest.raises(BatchUpdateError) as error:
+        execute_batches(sheets, "id", requests, max_requests=1, max_batches_per_minute=600, max_tries=3)
+    assert len(error.value.failed_chunks) == 1
+    assert sum(1 for chunk in sheets.calls if chunk[0] is requests[0]) == 3
+    assert sum(sheets.applied, []) == requests[1:]
+
+def test_does_not_retry_client_errors():
+    sheets = Sheets(lambda chunk: http_error(400))
+    with pytest.raises(BatchUpdateError):
+        execute_batches(sheets, "id", [paste(100)])
+    assert len(sheets.calls) == 1
+
+def test_paces_batches(monkeypatch, sleeps):
+    now = [0.0]
+    monkeypatch.setattr(sheets_batch.time, "monotonic", lambda: now[0])
+    execute_batches(Sheets(), "id", [paste(100) for _ in range(3)], max_requests=1, max_batches_per_minute=30)
+    assert sleeps == [2.0, 2.0]